@@ -0,0 +1,278 @@
+import json
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, request, stream_with_context, abort
+from sqlalchemy import tuple_
+from models import db, Artist, Venue, Show, SHOW_LENGTH
+from queries import encode_cursor, decode_cursor, overlapping, booking_conflicts
+from search import genre_filter, genre_match
+from dates import to_utc
+
+#----------------------------------------------------------------------------#
+# JSON read API.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Fields each resource exposes, as name -> column. Rows are selected as
+# plain tuples of just the requested columns; nothing is hydrated.
+VENUE_FIELDS = {
+    'id': Venue.id,
+    'name': Venue.name,
+    'genres': Venue.genres,
+    'address': Venue.address,
+    'city': Venue.city,
+    'state': Venue.state,
+    'phone': Venue.phone,
+    'website': Venue.website,
+    'facebook_link': Venue.facebook_link,
+    'seeking_talent': Venue.seeking_talent,
+    'seeking_description': Venue.seeking_description,
+    'image_link': Venue.image_link,
+    'updated_at': Venue.updated_at,
+}
+
+ARTIST_FIELDS = {
+    'id': Artist.id,
+    'name': Artist.name,
+    'genres': Artist.genres,
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'website': Artist.website,
+    'facebook_link': Artist.facebook_link,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+    'image_link': Artist.image_link,
+    'updated_at': Artist.updated_at,
+}
+
+SHOW_FIELDS = {
+    'id': Show.id,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+    'start_time': Show.start_time,
+    'updated_at': Show.updated_at,
+}
+
+
+def error(status, message):
+    return Response(json.dumps({'success': False, 'error': message}),
+                    status=status, mimetype='application/json')
+
+
+def default(value):
+    if isinstance(value, datetime):
+        # show times go out in UTC whatever the session's TimeZone
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def dumps(record):
+    return json.dumps(record, default=default, separators=(',', ':'))
+
+
+def selected_fields(available):
+    """The fields named in ?fields=a,b,c (all of them by default); 'id' is
+    always included since it is the pagination cursor.
+    """
+    names = request.args.get('fields')
+    if not names:
+        return list(available)
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(error(400, 'Unknown fields: ' + ', '.join(unknown)))
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return names
+
+
+def listing(query, id_column, available):
+    """List endpoint shared by every resource.
+
+    Pages seek on id with ?after=<last id> and ?limit=. With
+    ?format=ndjson the whole remaining result is streamed one JSON object
+    per line from a server-side cursor, so memory stays flat for exports.
+    """
+    names = selected_fields(available)
+    query = query.with_entities(*[available[name] for name in names]) \
+        .order_by(id_column)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(id_column > after)
+
+    if request.args.get('format') == 'ndjson':
+        rows = query.execution_options(stream_results=True).yield_per(1000)
+
+        def generate():
+            for row in rows:
+                yield dumps(dict(zip(names, row))) + '\n'
+        return Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson')
+
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    rows = query.limit(limit + 1).all()
+    data = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = data[-1]['id'] if len(rows) > limit else None
+    return Response(dumps({'data': data, 'next_cursor': next_cursor}),
+                    mimetype='application/json')
+
+
+def time_arg(name):
+    """The ISO 8601 date/time in ?name=, taken as UTC when it has no offset;
+    400 when it is missing or malformed.
+    """
+    value = request.args.get(name)
+    try:
+        return to_utc(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        abort(error(400, 'Expected an ISO 8601 date/time in ' + name))
+
+
+def detail(query, available, description):
+    names = selected_fields(available)
+    row = query.with_entities(*[available[name] for name in names]).one_or_none()
+    if row is None:
+        return error(404, description + ' not found')
+    return Response(dumps(dict(zip(names, row))), mimetype='application/json')
+
+
+@api.route('/venues')
+def venues():
+    return listing(db.session.query(Venue), Venue.id, VENUE_FIELDS)
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return detail(db.session.query(Venue).filter(Venue.id == venue_id),
+                  VENUE_FIELDS, 'Venue #%d' % venue_id)
+
+
+@api.route('/artists')
+def artists():
+    return listing(db.session.query(Artist), Artist.id, ARTIST_FIELDS)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return detail(db.session.query(Artist).filter(Artist.id == artist_id),
+                  ARTIST_FIELDS, 'Artist #%d' % artist_id)
+
+
+def shows_query():
+    # along the relationships, so the shows of deleted venues and artists
+    # drop out (see models.hide_deleted)
+    return db.session.query(Show) \
+        .join(Show.venue) \
+        .join(Show.artist)
+
+
+@api.route('/shows')
+def shows():
+    return listing(shows_query(), Show.id, SHOW_FIELDS)
+
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+    return detail(shows_query().filter(Show.id == show_id),
+                  SHOW_FIELDS, 'Show #%d' % show_id)
+
+
+@api.route('/calendar')
+def calendar():
+    """Shows taking place between ?start= and ?end=, soonest first.
+
+    Filters: venue_id, artist_id, city, state and genre (the artist's; all
+    of them when repeated).
+    Pages seek on (start_time, id) with ?after=<next_cursor>.
+    """
+    start, end = time_arg('start'), time_arg('end')
+    if end <= start:
+        return error(400, 'end must be after start')
+    names = selected_fields(SHOW_FIELDS)
+    query = shows_query().filter(overlapping(start, end))
+    for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+        value = request.args.get(name, type=int)
+        if value is not None:
+            query = query.filter(column == value)
+    for name, column in (('city', Venue.city), ('state', Venue.state)):
+        value = request.args.get(name)
+        if value:
+            query = query.filter(column == value)
+    genres = genre_filter(request.args.getlist('genre'))
+    if genres:
+        query = query.filter(genre_match(Artist.genres, genres))
+    after = request.args.get('after')
+    if after:
+        try:
+            query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*decode_cursor(after)))
+        except ValueError:
+            return error(400, 'Malformed cursor')
+
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    rows = query.with_entities(Show.id, Show.start_time, *[SHOW_FIELDS[name] for name in names]) \
+        .order_by(Show.start_time, Show.id) \
+        .limit(limit + 1).all()
+    data = [dict(zip(names, row[2:])) for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1].start_time, rows[limit - 1].id) \
+        if len(rows) > limit else None
+    return Response(dumps({'data': data, 'next_cursor': next_cursor}),
+                    mimetype='application/json')
+
+
+@api.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+    """Whether a show starting at ?start_time= fits the venue's bookings,
+    and the shows in the way if not.
+    """
+    start = time_arg('start_time')
+    if not db.session.query(Venue.query.filter(Venue.id == venue_id).exists()).scalar():
+        return error(404, 'Venue #%d not found' % venue_id)
+    names = selected_fields(SHOW_FIELDS)
+    rows = shows_query().filter(Show.venue_id == venue_id, overlapping(start, start + SHOW_LENGTH)) \
+        .with_entities(*[SHOW_FIELDS[name] for name in names]) \
+        .order_by(Show.start_time).all()
+    return Response(dumps({
+        'venue_id': venue_id,
+        'start_time': start,
+        'end_time': start + SHOW_LENGTH,
+        # a deleted artist's shows are not listed but hold their slots
+        'available': not booking_conflicts(venue_id, start),
+        'conflicts': [dict(zip(names, row)) for row in rows],
+    }), mimetype='application/json')
+
+
+def matches(model, id, description, other_model, available):
+    """The stored best matches of a venue or artist, best first, with the
+    requested fields of each and its score; ?limit= up to MATCH_TOP_K.
+    """
+    engine = current_app.extensions['matching']
+    if not db.session.query(model.query.filter(model.id == id).exists()).scalar():
+        return error(404, description + ' not found')
+    names = selected_fields(available)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), engine.k)
+    matched = engine.matches(model.__tablename__.lower(), id, limit)
+    rows = {row[0]: row for row in db.session.query(
+        other_model.id, *[available[name] for name in names])
+        .filter(other_model.id.in_([match_id for match_id, _ in matched]))}
+    data = [dict(zip(names, rows[match_id][1:]), score=round(score, 4))
+            for match_id, score in matched if match_id in rows]
+    return Response(dumps({'data': data}), mimetype='application/json')
+
+
+@api.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    return matches(Artist, artist_id, 'Artist #%d' % artist_id, Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    return matches(Venue, venue_id, 'Venue #%d' % venue_id, Artist, ARTIST_FIELDS)
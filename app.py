@@ -2,9 +2,12 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import itertools
 import json
-import dateutil.parser
-import babel
+import os
+import time
+import uuid
+import click
 from flask import (
     Flask, 
     render_template, 
@@ -13,20 +16,62 @@ from flask import (
     flash, 
     redirect, 
     url_for,
-    abort
+    abort,
+    jsonify
 )
 from flask_moment import Moment
+from jinja2 import pass_context
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import or_, desc
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import sys
 import pytz
-from models import db, Artist, Venue, Show
+import dates
+from dates import utcnow, viewer_timezone
+from models import db, Artist, Venue, Show, SHOW_LENGTH, touch, is_booking_conflict, init_statement_timeout
+from config import configs
+from queries import (
+    venue_areas,
+    venue_profile,
+    artist_profile,
+    artist_list,
+    show_listing,
+    venue_shows,
+    artist_shows,
+    venue_stats,
+    artist_stats,
+    next_show_start,
+    booking_conflicts,
+    venue_version,
+    artist_version,
+    venues_version,
+    artists_version,
+    shows_version
+)
+from loading import load_options
+from search import search, genre_filter
+from typeahead import PrefixIndex
+from matching import MatchEngine
+from cache import ResponseCache, cache_tag, cache_expires
+from conditional import conditional
+from streaming import stream_page
+from readmodels import VenuePage, ArtistPage
+from api import api
+from importer import KINDS as IMPORT_KINDS, import_file, validate as validate_row
+from writequeue import ShowQueue
+import stats
+import purge
+import seed as fake
+import bench
+from profiling import Profiler
+from metrics import Metrics
+from routing import ReplicaRouter
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -34,22 +79,36 @@ from models import db, Artist, Venue, Show
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
+app.config.from_object(configs[os.environ.get('FYYUR_ENV', 'development')])
+if not app.config['SECRET_KEY']:
+  raise RuntimeError('SECRET_KEY must be set: each worker would sign sessions with its own key')
 db.init_app(app)
+init_statement_timeout(app)
+replicas = ReplicaRouter(app)
+show_queue = ShowQueue(app)
+stats_rollover = stats.RolloverJob(app)
+purge_job = purge.PurgeJob(app)
 migrate = Migrate(app, db)
+typeahead_index = PrefixIndex(app.config['TYPEAHEAD_MAX_NAMES'])
+match_engine = MatchEngine(app)
+response_cache = ResponseCache(app)
+profiler = Profiler(app)
+metrics = Metrics(app)
+app.register_blueprint(api)
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+@app.context_processor
+def inject_viewer_timezone():
+  return {'viewer_timezone': viewer_timezone()}
+
+@pass_context
+def format_datetime(context, value, format='medium'):
+  tzinfo = context.get('viewer_timezone') or viewer_timezone()
+  return dates.format_datetime(value, format, tzinfo, app.config['DISPLAY_LOCALE'])
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -62,76 +121,106 @@ def index():
   return render_template('pages/home.html')
 
 
+#  Typeahead
+#  ----------------------------------------------------------------
+
+@app.route('/typeahead')
+def typeahead():
+  # name suggestions for the navbar search boxes, answered from memory
+  typeahead_index.ensure_fresh(app)
+  kind = request.args.get('kind')
+  limit = min(request.args.get('limit', 10, type=int), 50)
+  results = typeahead_index.lookup(request.args.get('q', ''), kind=kind, limit=limit)
+  return jsonify(results=[{
+      'kind': result_kind,
+      'id': id,
+      'name': name
+  } for result_kind, id, name in results])
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(lambda: venues_version(utcnow()))
+@response_cache.cached('venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  locals = []
-  #utc=pytz.UTC
-  current_date = datetime.now()
-  venues = Venue.query.all()
-  places = Venue.query.distinct(Venue.city, Venue.state).all()
-  for place in places:
-      locals.append({
-          'city': place.city,
-          'state': place.state,
-          'venues': [{
-              'id': venue.id,
-              'name': venue.name,
-              'num_upcoming_shows': len([show for show in venue.shows if show.start_time > current_date])
-          } for venue in venues if
-              venue.city == place.city and venue.state == place.state]
-      })
-  return render_template('pages/venues.html', areas=locals)
-
-@app.route('/venues/search', methods=['POST'])
+  # num_upcoming_shows comes from the VenueStats counts, see queries.venue_areas
+  current_date = utcnow()
+  cache_expires(next_show_start(current_date))
+  if app.config['STREAM_LISTINGS']:
+    # rows go from a server-side cursor into the page as it is sent
+    areas = venue_areas(current_date, yield_per=app.config['STREAM_YIELD_PER'])
+    return stream_page('pages/venues.html', areas=areas)
+  areas = venue_areas(current_date)
+  return render_template('pages/venues.html', areas=areas)
+
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # partial, case-insensitive match on name, city or state, best matches first.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  term = request.form.get('search_term')
-  search = "%{}%".format(term.lower())
-  res= Venue.query.filter(or_(Venue.name.ilike(search), Venue.city.ilike(search), Venue.state.ilike(search))).all()
-  response = {'count':len(res),'data':res}
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  term = request.values.get('search_term', '')
+  genres = genre_filter(request.values.getlist('genre'))
+  page = max(request.values.get('page', 1, type=int), 1)
+  per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+  count, res = search(Venue, term, page, per_page, genres=genres)
+  response = {
+      'count': count,
+      'data': res,
+      'page': page,
+      'pages': (count + per_page - 1) // per_page
+  }
+  return render_template('pages/search_venues.html', results=response, search_term=term, genres=genres)
 
 @app.route('/venues/<int:venue_id>')
+@conditional(lambda venue_id: venue_version(venue_id, utcnow()))
+@response_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get_or_404(venue_id)
-  past_shows = []
-  upcoming_shows = []
-  for show in venue.shows:
-      temp_show = {
-          'artist_id': show.artist_id,
-          'artist_name': show.artist.name,
-          'artist_image_link': show.artist.image_link,
-          'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-      }
-      
-      #utc=pytz.UTC
-      #show_time = show.start_time
-      current_date = datetime.now()
-      
-      if current_date < show.start_time:
-          upcoming_shows.append(temp_show)
-      else:
-          past_shows.append(temp_show)
+  current_date = utcnow()
+  venue = venue_profile(venue_id)
+  if venue is None:
+    abort(404)
+  upcoming_shows, upcoming_cursor = venue_shows(
+      venue_id, current_date, True, app.config['UPCOMING_SHOWS_LIMIT'])
+  past_shows, past_cursor = venue_shows(
+      venue_id, current_date, False, app.config['PAST_SHOWS_LIMIT'])
+  upcoming_shows_count, past_shows_count, next_show_at = venue_stats(venue_id, current_date)
+  cache_tag(*{'artist:%d' % show.artist_id for show in upcoming_shows + past_shows})
+  cache_expires(next_show_at)
 
-  # object class to dict
-  data = vars(venue)
+  data = VenuePage(
+      *venue,
+      upcoming_shows=upcoming_shows,
+      past_shows=past_shows,
+      upcoming_shows_count=upcoming_shows_count,
+      past_shows_count=past_shows_count,
+      upcoming_shows_more=upcoming_cursor and url_for(
+          'venue_show_tiles', venue_id=venue_id, when='upcoming', after=upcoming_cursor),
+      past_shows_more=past_cursor and url_for(
+          'venue_show_tiles', venue_id=venue_id, when='past', after=past_cursor)
+  )
 
-  data['past_shows'] = past_shows
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-  
   return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+@conditional(lambda venue_id, when: venue_version(venue_id, utcnow()))
+@response_cache.cached('venue:{venue_id}')
+def venue_show_tiles(venue_id, when):
+  # next page of a venue's show tiles for the "Load more" button
+  limit_key = 'UPCOMING_SHOWS_LIMIT' if when == 'upcoming' else 'PAST_SHOWS_LIMIT'
+  try:
+    shows, cursor = venue_shows(venue_id, utcnow(), when == 'upcoming',
+                                app.config[limit_key], after=request.args.get('after'))
+  except ValueError:
+    abort(400)
+  more_url = cursor and url_for('venue_show_tiles', venue_id=venue_id, when=when, after=cursor)
+  cache_tag(*{'artist:%d' % show.artist_id for show in shows})
+  if when == 'upcoming':
+    cache_expires(next_show_start(utcnow(), Show.venue_id, venue_id))
+  return render_template('pages/show_tiles.html', shows=shows, more_url=more_url)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -162,7 +251,12 @@ def create_venue_submission():
           seeking_description=form.seeking_description.data
       )
       db.session.add(venue)
+      db.session.flush()
+      venue_id = venue.id
       db.session.commit()
+      typeahead_index.add('venue', venue_id, form.name.data)
+      match_engine.profiles_changed('venue', [venue_id])
+      response_cache.invalidate('venues')
     except ValueError as e:
         print(e)
         error = True
@@ -190,7 +284,7 @@ def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a artist_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error = False
-  existing_venue = Venue.query.filter_by(id=venue_id).one_or_none()
+  existing_venue = Venue.query.options(*load_options()).filter_by(id=venue_id).one_or_none()
   if not existing_venue:
         return json.dumps({
           'success':
@@ -200,9 +294,11 @@ def delete_venue(venue_id):
       }), 404
   else:
     try:
-      Show.query.filter_by(venue_id=venue_id).delete()
-      Venue.query.filter_by(id=venue_id).delete()
+      # only flagged; the shows go later, see purge.py
+      purge.soft_delete('venue', venue_id)
       db.session.commit()
+      removed('venue', int(venue_id))
+      response_cache.invalidate('venues', 'shows', 'venue:' + venue_id)
     except ValueError as e:
       print(e)
       error=True
@@ -217,70 +313,132 @@ def delete_venue(venue_id):
       abort(500)
     return render_template('pages/home.html')
 
+@app.route('/venues/<int:venue_id>/restore', methods=['POST'])
+def restore_venue(venue_id):
+  # undoes a delete made less than PURGE_RESTORE_WINDOW ago
+  if not purge.restore('venue', venue_id, app.config['PURGE_RESTORE_WINDOW']):
+    return json.dumps({
+        'success': False,
+        'error': 'Venue #%d not found or no longer restorable' % venue_id
+    }), 404
+  db.session.commit()
+  name = restored('venue', venue_id)
+  purge_job.changed('venue', venue_id)
+  response_cache.invalidate('venues', 'shows', 'venue:%d' % venue_id)
+  flash('Venue ' + name + ' was restored!')
+  return redirect(url_for('show_venue', venue_id=venue_id))
+
+def removed(kind, id):
+  # a deleted venue or artist leaves the typeahead at once; its match lists
+  # and the rows it had shows with are seen to off the request (purge.PurgeJob)
+  typeahead_index.remove(kind, id)
+  purge_job.changed(kind, id)
+
+def restored(kind, id):
+  # the reverse of removed(), apart from queueing the follow-up; returns the
+  # name
+  model = purge.KINDS[kind][0]
+  name = db.session.query(model.name).filter(model.id == id).scalar()
+  typeahead_index.add(kind, id, name)
+  return name
+
+def deleted_or_restored(kind, id):
+  # runs on the purge thread, which is already off the request
+  match_engine.run_refresh(kind, [id])
+
+def related_touched(kind, ids):
+  # pages listing or counting the shows of a venue or artist deleted or restored
+  response_cache.invalidate(*['%s:%d' % (kind, id) for id in ids])
+
+purge_job.on_changed = deleted_or_restored
+purge_job.on_touched = related_touched
+
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(artists_version)
+@response_cache.cached('artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[]
-  artists = db.session.query(Artist).order_by('id').all()
-  for artist in artists:   
-      data.append({
-          "id":artist.id,
-          "name":artist.name,
-          })
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
+  # ids and names only, see queries.artist_list
+  if app.config['STREAM_LISTINGS']:
+    artists = artist_list(yield_per=app.config['STREAM_YIELD_PER'])
+    return stream_page('pages/artists.html', artists=artists)
+  return render_template('pages/artists.html', artists=artist_list())
+
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # partial, case-insensitive match on name, city or state, best matches first.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  term = request.form.get('search_term')
-  search = "%{}%".format(term.lower())
-  res= Artist.query.filter(or_(Artist.name.ilike(search), Artist.city.ilike(search), Artist.state.ilike(search))).all()
-  response = {'count':len(res),'data':res}
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  term = request.values.get('search_term', '')
+  genres = genre_filter(request.values.getlist('genre'))
+  page = max(request.values.get('page', 1, type=int), 1)
+  per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+  count, res = search(Artist, term, page, per_page, genres=genres)
+  response = {
+      'count': count,
+      'data': res,
+      'page': page,
+      'pages': (count + per_page - 1) // per_page
+  }
+  return render_template('pages/search_artists.html', results=response, search_term=term, genres=genres)
 
 @app.route('/artists/<int:artist_id>')
+@conditional(lambda artist_id: artist_version(artist_id, utcnow()))
+@response_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
-      # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  artist = Artist.query.get_or_404(artist_id)
-  past_shows = []
-  upcoming_shows = []
-  for show in artist.shows:
-      artist_show = {"venue_id": show.venue_id,
-                      "venue_name": show.venue.name,
-                      "venue_image_link": show.venue.image_link,
-                      'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-                      }
-      
-      #utc=pytz.UTC
-      current_date = datetime.now()
-      show_time = show.start_time
-      
-      if current_date < show_time:
-          upcoming_shows.append(artist_show)
-      else:
-          past_shows.append(artist_show)
+  # shows the artist page with the given artist_id
+  current_date = utcnow()
+  artist = artist_profile(artist_id)
+  if artist is None:
+    abort(404)
+  upcoming_shows, upcoming_cursor = artist_shows(
+      artist_id, current_date, True, app.config['UPCOMING_SHOWS_LIMIT'])
+  past_shows, past_cursor = artist_shows(
+      artist_id, current_date, False, app.config['PAST_SHOWS_LIMIT'])
+  upcoming_shows_count, past_shows_count, next_show_at = artist_stats(artist_id, current_date)
+  cache_tag(*{'venue:%d' % show.venue_id for show in upcoming_shows + past_shows})
+  cache_expires(next_show_at)
 
-  # object class to dict
-  data = vars(artist)
-  
-  data['past_shows'] = past_shows
-  data['upcoming_shows'] = upcoming_shows
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
+  data = ArtistPage(
+      *artist,
+      upcoming_shows=upcoming_shows,
+      past_shows=past_shows,
+      upcoming_shows_count=upcoming_shows_count,
+      past_shows_count=past_shows_count,
+      upcoming_shows_more=upcoming_cursor and url_for(
+          'artist_show_tiles', artist_id=artist_id, when='upcoming', after=upcoming_cursor),
+      past_shows_more=past_cursor and url_for(
+          'artist_show_tiles', artist_id=artist_id, when='past', after=past_cursor)
+  )
 
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+@conditional(lambda artist_id, when: artist_version(artist_id, utcnow()))
+@response_cache.cached('artist:{artist_id}')
+def artist_show_tiles(artist_id, when):
+  # next page of an artist's show tiles for the "Load more" button
+  limit_key = 'UPCOMING_SHOWS_LIMIT' if when == 'upcoming' else 'PAST_SHOWS_LIMIT'
+  try:
+    shows, cursor = artist_shows(artist_id, utcnow(), when == 'upcoming',
+                                 app.config[limit_key], after=request.args.get('after'))
+  except ValueError:
+    abort(400)
+  more_url = cursor and url_for('artist_show_tiles', artist_id=artist_id, when=when, after=cursor)
+  cache_tag(*{'venue:%d' % show.venue_id for show in shows})
+  if when == 'upcoming':
+    cache_expires(next_show_start(utcnow(), Show.artist_id, artist_id))
+  return render_template('pages/show_tiles.html', shows=shows, more_url=more_url)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  artist = Artist.query.get_or_404(artist_id)
+  artist = artist_profile(artist_id)
+  if artist is None:
+    abort(404)
   form.name.data=artist.name
   form.genres.data=artist.genres
   form.city.data=artist.city
@@ -300,7 +458,7 @@ def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
   error = False
-  artist = Artist.query.filter_by(id=artist_id).one_or_none()
+  artist = Artist.query.options(*load_options()).filter_by(id=artist_id).one_or_none()
   form = ArtistForm(request.form, meta={'csrf': False})
   if not artist:
     return json.dumps({
@@ -321,8 +479,15 @@ def edit_artist_submission(artist_id):
       artist.website=form.website_link.data or artist.website
       artist.seeking_venue=form.seeking_venue.data or artist.seeking_venue
       artist.seeking_description=form.seeking_description.data or artist.seeking_description
+      name = artist.name
       try:
+        # venue pages show this artist's name and image on their show tiles
+        touch(Venue, Venue.id.in_(
+            db.session.query(Show.venue_id).filter(Show.artist_id == artist_id)))
         db.session.commit()
+        typeahead_index.add('artist', artist_id, name)
+        match_engine.profiles_changed('artist', [artist_id])
+        response_cache.invalidate('artists', 'shows', 'artist:%d' % artist_id)
       except ValueError as e:
         print(e)
         error = True
@@ -347,7 +512,9 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue = Venue.query.get_or_404(venue_id)
+  venue = venue_profile(venue_id)
+  if venue is None:
+    abort(404)
   form.name.data=venue.name
   form.genres.data=venue.genres
   form.address.data=venue.address
@@ -367,24 +534,29 @@ def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
   error = False
+  # the row itself: the read model from venue_profile() cannot be updated
+  venue = Venue.query.options(*load_options()).get_or_404(venue_id)
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      venue = Venue(
-          name=form.name.data,
-          genres=form.genres.data,
-          address=form.address.data,
-          city=form.city.data,
-          state=form.state.data,
-          phone=form.phone.data,
-          facebook_link=form.facebook_link.data,
-          image_link=form.image_link.data,
-          website=form.website_link.data,
-          seeking_talent=form.seeking_talent.data,
-          seeking_description=form.seeking_description.data
-      )
-      db.session.add(venue)
+      venue.name = form.name.data
+      venue.genres = form.genres.data
+      venue.address = form.address.data
+      venue.city = form.city.data
+      venue.state = form.state.data
+      venue.phone = form.phone.data
+      venue.facebook_link = form.facebook_link.data
+      venue.image_link = form.image_link.data
+      venue.website = form.website_link.data
+      venue.seeking_talent = form.seeking_talent.data
+      venue.seeking_description = form.seeking_description.data
+      # artist pages show this venue's name and image on their show tiles
+      touch(Artist, Artist.id.in_(
+          db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)))
       db.session.commit()
+      typeahead_index.add('venue', venue_id, form.name.data)
+      match_engine.profiles_changed('venue', [venue_id])
+      response_cache.invalidate('venues', 'shows', 'venue:%d' % venue_id)
     except ValueError as e:
         print(e)
         error = True
@@ -436,7 +608,12 @@ def create_artist_submission():
         seeking_description=form.seeking_description.data 
       )
       db.session.add(artist)
+      db.session.flush()
+      artist_id = artist.id
       db.session.commit()
+      typeahead_index.add('artist', artist_id, form.name.data)
+      match_engine.profiles_changed('artist', [artist_id])
+      response_cache.invalidate('artists')
     except ValueError as e:
       print(e)
       error = True
@@ -463,7 +640,7 @@ def delete_artist(artist_id):
   # TODO: Complete this endpoint for taking a artist_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error = False
-  existing_artist = Artist.query.filter_by(id=artist_id).one_or_none()
+  existing_artist = Artist.query.options(*load_options()).filter_by(id=artist_id).one_or_none()
   if not existing_artist:
         return json.dumps({
           'success':
@@ -473,9 +650,11 @@ def delete_artist(artist_id):
       }), 404
   else:
     try:
-      Show.query.filter_by(artist_id=artist_id).delete()
-      Artist.query.filter_by(id=artist_id).delete()
+      # only flagged; the shows go later, see purge.py
+      purge.soft_delete('artist', artist_id)
       db.session.commit()
+      removed('artist', int(artist_id))
+      response_cache.invalidate('artists', 'shows', 'venues', 'artist:' + artist_id)
     except ValueError as e:
       print(e)
       error=True
@@ -489,29 +668,41 @@ def delete_artist(artist_id):
       flash('An error occurred. Artist could not be deleted.')
       abort(500)
   return render_template('pages/home.html')
+
+@app.route('/artists/<int:artist_id>/restore', methods=['POST'])
+def restore_artist(artist_id):
+  # undoes a delete made less than PURGE_RESTORE_WINDOW ago
+  if not purge.restore('artist', artist_id, app.config['PURGE_RESTORE_WINDOW']):
+    return json.dumps({
+        'success': False,
+        'error': 'Artist #%d not found or no longer restorable' % artist_id
+    }), 404
+  db.session.commit()
+  name = restored('artist', artist_id)
+  purge_job.changed('artist', artist_id)
+  response_cache.invalidate('artists', 'shows', 'venues', 'artist:%d' % artist_id)
+  flash('Artist ' + name + ' was restored!')
+  return redirect(url_for('show_artist', artist_id=artist_id))
     
 
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_version)
+@response_cache.cached('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  data = []
-  shows = db.session.query(Show).order_by(desc(Show.start_time)).all()
-  for show in shows:
-        artist = db.session.query(Artist.name, Artist.image_link).filter(Artist.id == show.artist_id).one()
-        venue = db.session.query(Venue.name).filter(Venue.id == show.venue_id).one()
-        data.append({
-          "venue_id": show.venue_id,
-          "venue_name": venue.name,
-          "artist_id": show.artist_id,
-          "artist_name":artist.name,
-          "artist_image_link": artist.image_link,
-          "start_time": show.start_time.strftime('%m/%d/%Y')
-        })
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one page at a time
+  try:
+    data, prev_cursor, next_cursor = show_listing(
+        app.config['SHOWS_PER_PAGE'],
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+  except ValueError:
+    abort(400)
+  return render_template('pages/shows.html', shows=data,
+                         prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/shows/create')
 def create_shows():
@@ -519,34 +710,490 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+def shows_listed(records):
+  # drop the pages new shows appear on
+  response_cache.invalidate('shows', 'venues',
+                            *{'venue:%d' % record['venue_id'] for record in records},
+                            *{'artist:%d' % record['artist_id'] for record in records})
+
+show_queue.on_drained = shows_listed
+
+BOOKED_MESSAGE = 'The venue already has a show booked within {:g} hours of that time.'.format(
+    SHOW_LENGTH.total_seconds() / 3600)
+MISSING_MESSAGE = 'No venue or artist with that ID. Show could not be listed.'
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-  error=False
+  record, errors = validate_row('shows', request.form, tzinfo=viewer_timezone())
+  if errors:
+    flash('Errors ' + str([field + ' ' + '|'.join(err) for field, err in errors.items()]))
+    return render_template('forms/new_show.html', form=ShowForm(request.form))
+  if booking_conflicts(record['venue_id'], record['start_time']):
+    flash(BOOKED_MESSAGE)
+    return render_template('forms/new_show.html', form=ShowForm(request.form))
+
+  if app.config['SHOW_WRITE_BEHIND']:
+    # queued; a background thread inserts it with others (see writequeue.py)
+    ticket = show_queue.submit(record)
+    if request.accept_mimetypes.best == 'application/json':
+      return jsonify(show_queue.status(ticket)), 202
+    flash('Show submission #%d received. It will be listed shortly.' % ticket)
+    return render_template('pages/home.html')
+
   try:
-    data = Show()
-    data.venue_id = request.form.get('venue_id')
-    data.artist_id = request.form.get('artist_id')
-    data.start_time = request.form.get('start_time')
-    db.session.add(data)
-    db.session.commit()
-  except:
-    error=True
+    if not list_show(record):
+      flash(MISSING_MESSAGE)
+      return render_template('forms/new_show.html', form=ShowForm(request.form))
+  except IntegrityError as e:
     db.session.rollback()
-    print(sys.exc_info())
-  finally:
-    db.session.close()
-  if not error:
-    flash('Show was successfully listed!')
-  else:
+    # a booking made since the check above still trips the constraint
+    flash(BOOKED_MESSAGE if is_booking_conflict(e) else MISSING_MESSAGE)
+    return render_template('forms/new_show.html', form=ShowForm(request.form))
+  except SQLAlchemyError:
+    db.session.rollback()
+    app.logger.exception('Could not list show')
     flash('An error occurred. Show could not be listed.')
     abort(500)
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  finally:
+    db.session.close()
+  shows_listed([record])
+  flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+def list_show(record):
+  # touching the venue and artist doubles as the check that neither was
+  # deleted, which the foreign keys cannot tell; False if one was
+  db.session.add(Show(**record))
+  if not (touch(Venue, Venue.id == record['venue_id'], Venue.deleted_at.is_(None))
+          and touch(Artist, Artist.id == record['artist_id'], Artist.deleted_at.is_(None))):
+    db.session.rollback()
+    return False
+  db.session.commit()
+  return True
+
+@app.route('/shows/submissions/<int:ticket>')
+def show_submission_status(ticket):
+  # where a queued show submission stands: pending, done (with show_id) or failed
+  status = show_queue.status(ticket)
+  if status is None:
+    return jsonify({'success': False, 'error': 'Unknown submission'}), 404
+  return jsonify(status)
+
+#  Import
+#  ----------------------------------------------------------------
+
+def imported(kind, records):
+  # drop whatever the imported rows show up on
+  if kind == 'shows':
+    shows_listed(records)
+  else:
+    response_cache.invalidate(kind)
+    typeahead_index.expire()
+    # too many rows to refresh one by one; see `flask matches-build`
+    match_engine.expire()
+
+@app.route('/import/<any(venues, artists, shows):kind>', methods=['POST'])
+def import_upload(kind):
+  # streams an uploaded CSV/NDJSON file into the database, see importer.py
+  upload = request.files.get('file')
+  if upload is None:
+    return json.dumps({'success': False, 'error': 'No file uploaded'}), 400
+  format = 'csv' if upload.filename.lower().endswith('.csv') else 'ndjson'
+  # uploads in the same second must not share a report
+  errors_path = os.path.join(app.config['IMPORT_ERRORS_DIR'], '{}-{}-{}.errors.ndjson'.format(
+      kind, time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:12]))
+  report = import_file(kind, upload.stream, format, errors_path,
+                       batch_size=app.config['IMPORT_BATCH_SIZE'], on_batch=imported)
+  return jsonify(report.as_dict())
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to csv for *.csv files, ndjson otherwise.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Where rejected rows go (default: PATH.errors.ndjson).')
+def import_command(kind, path, format, batch_size, errors_path):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+  format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+  with open(path, 'rb') as stream:
+    report = import_file(kind, stream, format, errors_path or path + '.errors.ndjson',
+                         batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+                         on_batch=imported)
+  click.echo('{read} rows read, {loaded} loaded, {failed} rejected in {seconds}s '
+             '({rows_per_second} rows/s)'.format(**report.as_dict()))
+  if report.failed:
+    click.echo('Rejected rows written to ' + report.errors_path)
+
+
+#  Show counts
+#  ----------------------------------------------------------------
+
+@app.cli.command('stats-rollover')
+def stats_rollover_command():
+  """Count the shows that have started since the last run as past."""
+  moved = stats.rollover()
+  click.echo('{} shows moved from upcoming to past'.format(moved))
+
+@app.cli.command('stats-check')
+@click.option('--repair', is_flag=True, help='Rewrite the rows that differ.')
+def stats_check_command(repair):
+  """Recompute the venue and artist show counts and report any drift."""
+  drift = stats.check(repair=repair)
+  for row in drift:
+    click.echo('{} {}: stored {} expected {}'.format(
+        row['kind'], row['id'], json.dumps(row['stored'], default=str),
+        json.dumps(row['expected'], default=str)))
+  if drift:
+    click.echo('{} rows {}'.format(len(drift), 'repaired' if repair else 'differ'))
+    if repair:
+      response_cache.invalidate('venues', *['{}:{}'.format(row['kind'], row['id']) for row in drift])
+    else:
+      sys.exit(1)
+  else:
+    click.echo('Show counts are consistent')
+
+#  Deleted venues and artists
+#  ----------------------------------------------------------------
+
+@app.cli.command('purges')
+def purges_command():
+  """List the deleted venues and artists waiting to be purged."""
+  rows = purge.pending(app.config['PURGE_RESTORE_WINDOW'])
+  for row in rows:
+    click.echo('{kind} {id} {name!r}: deleted {deleted_at:%Y-%m-%d %H:%M:%S}, {state} '
+               '{due:%Y-%m-%d %H:%M:%S}, {shows} shows'.format(
+                   state='restorable until' if row['restorable'] else 'purge due since', **row))
+  click.echo('{} pending'.format(len(rows)))
+
+@app.cli.command('purge')
+def purge_command():
+  """Purge the venues and artists past their restore window, with their shows."""
+  started = time.perf_counter()
+  purged = purge_job.purge_now()
+  click.echo('{} venues and {} artists purged with {} shows in {:.1f}s'.format(
+      len(purged['venue']), len(purged['artist']),
+      sum(shows for rows in purged.values() for _, shows in rows), time.perf_counter() - started))
+
+@app.cli.command('restore')
+@click.argument('kind', type=click.Choice(sorted(purge.KINDS)))
+@click.argument('id', type=int)
+def restore_command(kind, id):
+  """Undo the deletion of a venue or artist within its restore window."""
+  if not purge.restore(kind, id, app.config['PURGE_RESTORE_WINDOW']):
+    click.echo('No deleted {} {} within the restore window'.format(kind, id))
+    sys.exit(1)
+  db.session.commit()
+  name = restored(kind, id)
+  purge_job.touch(kind, id)
+  response_cache.invalidate('venues', 'artists', 'shows', '{}:{}'.format(kind, id))
+  click.echo('Restored {} {} {!r}'.format(kind, id, name))
+
+#  Matching
+#  ----------------------------------------------------------------
+
+@app.cli.command('matches-build')
+def matches_build_command():
+  """Rank every venue's artists and every artist's venues from scratch."""
+  started = time.perf_counter()
+  written = match_engine.rebuild_table()
+  click.echo('{venue} venue and {artist} artist matches stored in {seconds:.1f}s'.format(
+      seconds=time.perf_counter() - started, **written))
+
+#  Seed data and benchmarks
+#  ----------------------------------------------------------------
+
+@app.cli.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=2000, show_default=True)
+@click.option('--shows', default=20000, show_default=True)
+@click.option('--seed', 'seed', default=0, show_default=True, help='Random seed.')
+@click.option('--reset', is_flag=True, help='Empty the venue, artist and show tables first.')
+def seed_command(venues, artists, shows, seed, reset):
+  """Fill the database with generated venues, artists and shows."""
+  if reset:
+    click.confirm('This deletes every venue, artist and show. Continue?', abort=True)
+    fake.truncate()
+  started = time.perf_counter()
+  fake.seed(venues, artists, shows, seed=seed)
+  response_cache.invalidate('venues', 'artists', 'shows')
+  click.echo('Seeded {} venues, {} artists and {} shows in {:.1f}s'.format(
+      venues, artists, shows, time.perf_counter() - started))
+
+def benchmark_requests(venue_id, artist_id):
+  # (name, method, path, form data) for every route that leaves the data
+  # set as it found it, apart from the rows the create routes add
+  venue_form = {
+    'name': 'Benchmark Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+    'phone': '512-555-0100', 'genres': ['Jazz', 'Blues'],
+    'facebook_link': 'https://www.facebook.com/benchmark', 'image_link': '',
+    'website_link': '', 'seeking_talent': 'y', 'seeking_description': 'Anyone'
+  }
+  artist_form = dict(venue_form, name='Benchmark Band', seeking_venue='y')
+  del artist_form['address'], artist_form['seeking_talent']
+  # a new slot each time, the venue takes one show at a time
+  slots = itertools.count()
+  show_form = lambda: {'venue_id': str(venue_id), 'artist_id': str(artist_id), 'start_time': (
+      datetime(2031, 1, 1, 20) + next(slots) * SHOW_LENGTH).strftime('%Y-%m-%d %H:%M:%S')}
+  today = utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+  saturday = today + timedelta(days=(5 - today.weekday()) % 7 or 7)
+  weekend = {'start': saturday.isoformat(), 'end': (saturday + timedelta(days=2)).isoformat()}
+  return [
+    ('index', 'GET', url_for('index'), None),
+    ('typeahead', 'GET', url_for('typeahead', q='the'), None),
+    ('venues', 'GET', url_for('venues'), None),
+    ('search_venues', 'GET', url_for('search_venues', search_term='an'), None),
+    ('show_venue', 'GET', url_for('show_venue', venue_id=venue_id), None),
+    ('venue_show_tiles', 'GET', url_for('venue_show_tiles', venue_id=venue_id, when='past'), None),
+    ('create_venue_form', 'GET', url_for('create_venue_form'), None),
+    ('create_venue_submission', 'POST', url_for('create_venue_submission'), venue_form),
+    ('edit_venue', 'GET', url_for('edit_venue', venue_id=venue_id), None),
+    ('edit_venue_submission', 'POST', url_for('edit_venue_submission', venue_id=venue_id), venue_form),
+    ('artists', 'GET', url_for('artists'), None),
+    ('search_artists', 'GET', url_for('search_artists', search_term='an'), None),
+    ('show_artist', 'GET', url_for('show_artist', artist_id=artist_id), None),
+    ('artist_show_tiles', 'GET', url_for('artist_show_tiles', artist_id=artist_id, when='past'), None),
+    ('edit_artist', 'GET', url_for('edit_artist', artist_id=artist_id), None),
+    ('edit_artist_submission', 'POST', url_for('edit_artist_submission', artist_id=artist_id), artist_form),
+    ('create_artist_form', 'GET', url_for('create_artist_form'), None),
+    ('create_artist_submission', 'POST', url_for('create_artist_submission'), artist_form),
+    ('shows', 'GET', url_for('shows'), None),
+    ('create_shows', 'GET', url_for('create_shows'), None),
+    ('create_show_submission', 'POST', url_for('create_show_submission'), show_form),
+    ('api.venues', 'GET', url_for('api.venues', limit=100), None),
+    ('api.venue', 'GET', url_for('api.venue', venue_id=venue_id), None),
+    ('api.artists', 'GET', url_for('api.artists', limit=100), None),
+    ('api.artist', 'GET', url_for('api.artist', artist_id=artist_id), None),
+    ('api.shows', 'GET', url_for('api.shows', limit=100), None),
+    ('api.show', 'GET', url_for('api.show', show_id=1), None),
+    ('api.calendar', 'GET', url_for('api.calendar', city='San Francisco', genre='Jazz', **weekend), None),
+    ('api.calendar_venue', 'GET', url_for('api.calendar', venue_id=venue_id, start=today.isoformat(),
+                                          end=(today + timedelta(days=30)).isoformat()), None),
+    ('api.venue_availability', 'GET', url_for('api.venue_availability', venue_id=venue_id,
+                                              start_time=(saturday + timedelta(hours=20)).isoformat()), None),
+  ]
+
+@app.cli.command('bench')
+@click.option('--scale', 'scales', multiple=True,
+              default=['100:200:1000', '1000:2000:20000', '5000:10000:200000'], show_default=True,
+              help='VENUES:ARTISTS:SHOWS to seed before each run; repeatable.')
+@click.option('--repeat', default=20, show_default=True, help='Timed requests per route.')
+@click.option('--seed', 'seed', default=0, show_default=True)
+@click.option('--output', default='bench.json', show_default=True, type=click.Path(dir_okay=False))
+@click.option('--compare', 'baseline', type=click.File(),
+              help='An earlier report to check for regressions.')
+@click.option('--yes', is_flag=True, help='Do not ask before emptying the database.')
+def bench_command(scales, repeat, seed, output, baseline, yes):
+  """Seed the database at each scale and time every route against it.
+
+  Runs without the page cache so the numbers show what a miss costs.
+  """
+  if not yes:
+    click.confirm('Each scale empties and re-seeds the database. Continue?', abort=True)
+  app.config['WTF_CSRF_ENABLED'] = False
+  response_cache.enabled = False
+  client = app.test_client()
+  results = []
+  for scale in scales:
+    venues, artists, shows = (int(n) for n in scale.split(':'))
+    fake.truncate()
+    started = time.perf_counter()
+    fake.seed(venues, artists, shows, seed=seed)
+    result = {'venues': venues, 'artists': artists, 'shows': shows,
+              'seed_seconds': round(time.perf_counter() - started, 2), 'routes': {}}
+
+    started = time.perf_counter()
+    typeahead_index.build()
+    result['typeahead_build_seconds'] = round(time.perf_counter() - started, 3)
+    result['typeahead_lookup'] = bench.time_calls(lambda: typeahead_index.lookup('the'), 1000)
+
+    # the busiest venue and artist: the worst case for their pages
+    venue_id = db.session.query(Show.venue_id).group_by(Show.venue_id) \
+      .order_by(db.func.count().desc()).limit(1).scalar() or 1
+    artist_id = db.session.query(Show.artist_id).group_by(Show.artist_id) \
+      .order_by(db.func.count().desc()).limit(1).scalar() or 1
+    db.session.remove()
+    with app.test_request_context():
+      requests = benchmark_requests(venue_id, artist_id)
+    for name, method, path, data in requests:
+      result['routes'][name] = bench.measure(client, db.engine, method, path, data, repeat)
+      click.echo('{}/{}/{} {:<26} {}'.format(venues, artists, shows, name, json.dumps(
+          {k: v for k, v in result['routes'][name].items() if k not in ('path', 'method')})))
+    results.append(result)
+
+  skipped = set(app.view_functions) - {name for name, _, _, _ in requests} \
+    - {'static', 'delete_venue', 'delete_artist', 'restore_venue', 'restore_artist', 'import_upload'}
+  if skipped:
+    click.echo('Not benchmarked: ' + ', '.join(sorted(skipped)))
+  report = bench.report(results, seed, repeat)
+  bench.write(report, output)
+  click.echo('Report written to ' + output)
+  if baseline is not None:
+    regressions = bench.compare(json.load(baseline), report)
+    for line in regressions:
+      click.echo('REGRESSION ' + line)
+    if regressions:
+      sys.exit(1)
+
+@app.cli.command('bench-pool')
+@click.option('--threads', default=32, show_default=True, help='Concurrent clients.')
+@click.option('--requests', default=50, show_default=True, help='Requests per client.')
+def bench_pool_command(threads, requests):
+  """Load the connection pool from concurrent clients and report its use.
+
+  Reads the seeded venue and artist pages uncached; with more clients than
+  pool_size + max_overflow, the extra ones wait up to pool_timeout.
+  """
+  response_cache.enabled = False
+  profiler.sample_rate = 0
+  with app.app_context():
+    venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id).limit(20)]
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id).limit(20)]
+    engine = db.engine
+    db.session.remove()
+  paths = ['/venues/%d' % id for id in venue_ids] + ['/artists/%d' % id for id in artist_ids] \
+    + ['/shows', '/api/v1/shows?limit=100']
+  click.echo(json.dumps(bench.pool_load(app, engine, paths, threads, requests)))
+
+@app.cli.command('bench-shows')
+@click.option('--count', default=5000, show_default=True, help='Submissions per mode.')
+@click.option('--rate', default=1000, show_default=True, help='Target submissions per second.')
+@click.option('--threads', default=16, show_default=True, help='Concurrent submitters.')
+def bench_shows_command(count, rate, threads):
+  """Compare inline and write-behind show creation at a steady rate.
+
+  Adds COUNT shows per mode between the seeded venues and artists.
+  """
+  import random
+  with app.app_context():
+    venue_ids = [id for id, in db.session.query(Venue.id)]
+    artist_ids = [id for id, in db.session.query(Artist.id)]
+    db.session.remove()
+  rng = random.Random(0)
+  base = datetime(2030, 1, 1, tzinfo=timezone.utc)
+  # distinct slots, so no submission is turned down as double booked
+  slots = iter(rng.sample(range(10 ** 6), 2 * count))
+
+  def records():
+    return [{'venue_id': rng.choice(venue_ids), 'artist_id': rng.choice(artist_ids),
+             'start_time': base + next(slots) * SHOW_LENGTH} for _ in range(count)]
+
+  def inline(record):
+    try:
+      list_show(record)
+    finally:
+      db.session.remove()
+
+  result = {'inline': bench.paced(app, inline, records(), rate, threads)}
+  started = time.perf_counter()
+  result['write_behind'] = bench.paced(app, show_queue.submit, records(), rate, threads)
+  while show_queue.pending():
+    time.sleep(0.05)
+  result['write_behind']['drained_seconds'] = round(time.perf_counter() - started, 2)
+  click.echo(json.dumps(result, indent=2))
+
+@app.cli.command('bench-tiles')
+@click.option('--tiles', default=10000, show_default=True, help='Show tiles per render.')
+@click.option('--repeat', default=20, show_default=True)
+def bench_tiles_command(tiles, repeat):
+  """Time rendering show tiles with the old and the current date filter."""
+  start = datetime(2030, 1, 1, 20, tzinfo=timezone.utc)
+  rows = [{'artist_id': i, 'artist_name': 'Artist %d' % i, 'artist_image_link': '',
+           'start_time': start + i * SHOW_LENGTH} for i in range(tiles)]
+  click.echo(json.dumps(bench.show_times(app, rows, repeat), indent=2))
+
+@app.cli.command('bench-stream')
+@click.option('--path', 'paths', multiple=True, default=['/venues', '/artists'], show_default=True)
+@click.option('--mode', type=click.Choice(['buffered', 'streaming']), default=None,
+              help='Run one mode in this process (the default runs each in a fresh one).')
+def bench_stream_command(paths, mode):
+  """Compare time to first byte and peak RSS of the listing pages, buffered
+  and streamed. Seed a large catalog first, e.g. flask seed --venues 100000.
+  """
+  if mode is None:
+    import subprocess
+    results = {}
+    for mode in ('buffered', 'streaming'):
+      results[mode] = {}
+      for path in paths:
+        # a fresh process each, so one page's peak does not hide the next's
+        output = subprocess.check_output([sys.executable, '-m', 'flask', 'bench-stream',
+                                          '--mode', mode, '--path', path])
+        results[mode].update(json.loads(output))
+    click.echo(json.dumps(results, indent=2))
+    return
+  app.config['STREAM_LISTINGS'] = mode == 'streaming'
+  response_cache.enabled = False
+  profiler.sample_rate = 0
+  client = app.test_client()
+  client.get('/')
+  click.echo(json.dumps({path: bench.first_byte(client, path) for path in paths}))
+
+@app.cli.command('bench-rows')
+@click.option('--rows', default=100000, show_default=True, help='Venues to load (seed them first).')
+def bench_rows_command(rows):
+  """Compare loading venues as ORM instances, dicts and read models."""
+  with app.app_context():
+    click.echo(json.dumps(bench.read_models(rows), indent=2))
+
+@app.cli.command('bench-typeahead')
+@click.option('--repeat', default=1000, show_default=True)
+def bench_typeahead_command(repeat):
+  """Time typeahead lookups and index rebuilds (seed 100k names first, e.g.
+  flask seed --venues 50000 --artists 50000)."""
+  profiler.sample_rate = 0
+  with app.app_context():
+    click.echo(json.dumps(bench.typeahead(app, PrefixIndex(app.config['TYPEAHEAD_MAX_NAMES']), repeat), indent=2))
+
+@app.cli.command('bench-search')
+@click.option('--term', 'terms', multiple=True, default=['an', 'music', 'san fran'], show_default=True)
+@click.option('--genre', 'genres', multiple=True, default=['HipHop', 'Jazz'], show_default=True)
+@click.option('--repeat', default=20, show_default=True)
+def bench_search_command(terms, genres, repeat):
+  """Compare search with and without the trigram indexes, and genre-filtered
+  search on literal spellings and on every spelling (seed 100k venues and
+  artists first)."""
+  per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+  with app.app_context():
+    click.echo(json.dumps({
+        'trigram': bench.trigram_search(list(terms), per_page, repeat),
+        'genres': bench.genre_search(terms[0], list(genres), per_page, repeat),
+    }, indent=2))
+
+@app.cli.command('bench-forms')
+@click.option('--repeat', default=2000, show_default=True)
+def bench_forms_command(repeat):
+  """Time building, validating and rendering the venue form."""
+  click.echo(json.dumps(bench.forms(app, repeat), indent=2))
+
+@app.cli.command('bench-matches')
+@click.option('--repeat', default=200, show_default=True)
+def bench_matches_command(repeat):
+  """Time match lookups, live scoring and a refresh (run matches-build first)."""
+  profiler.sample_rate = 0
+  with app.app_context():
+    click.echo(json.dumps(bench.matches(app, match_engine, repeat), indent=2))
+
+@app.cli.command('bench-delete')
+@click.option('--shows', 'sizes', multiple=True, type=int, default=[0, 1000, 10000, 100000],
+              show_default=True, help='Shows per deleted venue; repeatable.')
+@click.option('--repeat', default=5, show_default=True)
+def bench_delete_command(sizes, repeat):
+  """Time deleting venues with more and more shows, and purging them."""
+  response_cache.enabled = False
+  profiler.sample_rate = 0
+  with app.app_context():
+    click.echo(json.dumps(bench.deletes(app, sizes, repeat, app.config['PURGE_BATCH_SIZE']), indent=2))
+
+@app.cli.command('bench-metrics')
+@click.option('--repeat', default=100000, show_default=True)
+def bench_metrics_command(repeat):
+  """Time what the Prometheus hooks add to each request and statement."""
+  click.echo(json.dumps(bench.metrics_overhead(app, metrics, repeat)))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
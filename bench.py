@@ -0,0 +1,602 @@
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values`."""
+    values = sorted(values)
+    return values[max(int(round(p / 100.0 * len(values))) - 1, 0)]
+
+
+class StatementCounter:
+    """Counts the statements `engine` executes while the block runs."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def measure(client, engine, method, path, data=None, repeat=20):
+    """Time `repeat` requests after one warm-up; a final, separate request
+    runs under tracemalloc for the peak allocation, which would otherwise
+    distort the timings. `data` may be a callable giving each request's
+    form data.
+    """
+    def request():
+        response = client.open(path, method=method, data=data() if callable(data) else data)
+        response.get_data()
+        return response
+
+    response = request()
+    if response.status_code >= 400:
+        return {'path': path, 'method': method, 'status': response.status_code}
+    timings = []
+    for _ in range(repeat):
+        with StatementCounter(engine) as statements:
+            started = time.perf_counter()
+            request()
+            timings.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'path': path,
+        'method': method,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'statements': statements.count,
+        'peak_kib': round(peak / 1024.0, 1),
+    }
+
+
+def time_calls(function, repeat):
+    """p50/p95 in microseconds of calling `function()` `repeat` times."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {
+        'p50_us': round(percentile(timings, 50) * 1e6, 2),
+        'p95_us': round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(scales, seed, repeat):
+    return {
+        'revision': revision(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'seed': seed,
+        'repeat': repeat,
+        'scales': scales,
+    }
+
+
+def compare(old, new, tolerance=0.25):
+    """Lines describing routes that got slower than `tolerance` allows or
+    started running more statements, per scale present in both reports.
+    """
+    def key(scale):
+        return (scale['venues'], scale['artists'], scale['shows'])
+
+    old_scales = {key(scale): scale for scale in old['scales']}
+    lines = []
+    for scale in new['scales']:
+        before = old_scales.get(key(scale))
+        if before is None:
+            continue
+        for name, result in scale['routes'].items():
+            previous = before['routes'].get(name)
+            if not previous or 'p95_ms' not in result or 'p95_ms' not in previous:
+                continue
+            label = '{} @ {}/{}/{}'.format(name, *key(scale))
+            if result['statements'] > previous['statements']:
+                lines.append('{}: {} -> {} statements'.format(
+                    label, previous['statements'], result['statements']))
+            if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                lines.append('{}: p95 {} -> {} ms'.format(
+                    label, previous['p95_ms'], result['p95_ms']))
+    return lines
+
+
+def write(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def metrics_overhead(app, metrics, repeat=100000):
+    """Microseconds the metrics hooks add per request (one cache lookup)
+    and per SQL statement, timed over `repeat` calls.
+    """
+    from flask import Response
+    from metrics import _before_cursor_execute, _after_cursor_execute
+
+    class Connection:
+        info = {}
+
+    response = Response('')
+    response.headers['X-Cache'] = 'MISS'
+    with app.test_request_context('/venues') as context:
+        wrapped = metrics.timed(lambda environ, start_response: None)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            wrapped(context.request.environ, None)
+            metrics.finish(response)
+        per_request = (time.perf_counter() - started) / repeat
+    conn = Connection()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        _before_cursor_execute(conn, None, '', None, None, False)
+        _after_cursor_execute(conn, None, '', None, None, False)
+    per_statement = (time.perf_counter() - started) / repeat
+    return {
+        'per_request_us': round(per_request * 1e6, 2),
+        'per_statement_us': round(per_statement * 1e6, 2),
+    }
+
+
+def pool_load(app, engine, paths, threads, requests):
+    """Hit `paths` from `threads` concurrent clients, `requests` each, and
+    report latency, errors and the pool's high-water marks.
+    """
+    import threading
+    from collections import Counter
+
+    pool = engine.pool
+    peak = {'checked_out': 0, 'overflow': 0}
+
+    def checkout(*args):
+        peak['checked_out'] = max(peak['checked_out'], pool.checkedout())
+        peak['overflow'] = max(peak['overflow'], pool.overflow())
+
+    errors = Counter()
+    timings = []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = app.test_client()
+        local = []
+        for i in range(requests):
+            started = time.perf_counter()
+            try:
+                response = client.get(paths[(n + i) % len(paths)])
+                response.get_data()
+                if response.status_code >= 500:
+                    errors['HTTP %d' % response.status_code] += 1
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            timings.extend(local)
+
+    event.listen(pool, 'checkout', checkout)
+    try:
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - started
+    finally:
+        event.remove(pool, 'checkout', checkout)
+    return {
+        'threads': threads,
+        'requests': len(timings),
+        'seconds': round(seconds, 2),
+        'requests_per_second': round(len(timings) / seconds, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'errors': dict(errors),
+        'pool_size': pool.size(),
+        'peak_checked_out': peak['checked_out'],
+        'peak_overflow': max(peak['overflow'], 0),
+    }
+
+
+def paced(app, submit, records, rate, threads):
+    """Call `submit(record)` for each record from `threads` threads, each
+    call scheduled at its slot in a steady `rate` per second, and report
+    the submission latency and the rate actually achieved.
+    """
+    import threading
+    from collections import Counter
+
+    errors = Counter()
+    timings = []
+    lock = threading.Lock()
+    slots = iter(range(len(records)))
+    started = time.perf_counter()
+
+    def worker():
+        local = []
+        with app.app_context():
+            for i in slots:
+                delay = started + i / float(rate) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                began = time.perf_counter()
+                try:
+                    submit(records[i])
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                local.append(time.perf_counter() - began)
+        with lock:
+            timings.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return {
+        'submitted': len(timings),
+        'seconds': round(seconds, 2),
+        'per_second': round(len(timings) / seconds, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'errors': dict(errors),
+    }
+
+
+def show_times(app, rows, repeat):
+    """Time rendering `rows` show tiles with the old string-parsing date
+    filter and with the current one, in the viewer's timezone.
+    """
+    import babel.dates
+    import dateutil.parser
+    from flask import render_template
+
+    def legacy(value, format='medium'):
+        # before show times were datetimes: parsed back from the string
+        # the query built, then formatted by Babel
+        date = dateutil.parser.parse(value)
+        if format == 'full':
+            format = "EEEE MMMM, d, y 'at' h:mma"
+        elif format == 'medium':
+            format = "EE MM, dd, y h:mma"
+        return babel.dates.format_datetime(date, format, locale='en')
+
+    strings = [dict(row, start_time=row['start_time'].strftime('%m/%d/%Y, %H:%M')) for row in rows]
+    current = app.jinja_env.filters['datetime']
+    results = {}
+    # compiled templates bind the filter's calling convention; recompile
+    app.jinja_env.cache.clear()
+    with app.test_request_context('/', headers={'Cookie': 'tz=America/New_York'}):
+        try:
+            app.jinja_env.filters['datetime'] = legacy
+            results['legacy'] = time_calls(
+                lambda: render_template('pages/show_tiles.html', shows=strings), repeat)
+        finally:
+            app.jinja_env.filters['datetime'] = current
+            app.jinja_env.cache.clear()
+        results['current'] = time_calls(
+            lambda: render_template('pages/show_tiles.html', shows=rows), repeat)
+    for result in results.values():
+        result['per_tile_us'] = round(result['p50_us'] / len(rows), 2)
+    return results
+
+
+def first_byte(client, path):
+    """Seconds to the first chunk of the body and to the last, the bytes
+    sent, and how far the process's peak RSS grew over the request (KiB).
+    """
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    ttfb = None
+    size = 0
+    try:
+        for chunk in response.response:
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            size += len(chunk)
+    finally:
+        response.close()
+    return {
+        'status': response.status_code,
+        'ttfb_ms': round((ttfb or 0) * 1000, 1),
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        'bytes': size,
+        'peak_rss_growth_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+    }
+
+
+def read_models(limit, repeat=3):
+    """Load `limit` venues as ORM instances, as a dict per row and as read
+    model tuples: the best time of `repeat` and the memory the result holds.
+    """
+    from models import db, Venue
+    from readmodels import VENUE_COLUMNS, venue_record
+
+    columns = [getattr(Venue, name) for name in VENUE_COLUMNS]
+
+    def rows():
+        return db.session.query(*columns).order_by(Venue.id).limit(limit)
+
+    builders = {
+        'orm': lambda: Venue.query.order_by(Venue.id).limit(limit).all(),
+        'dicts': lambda: [dict(zip(VENUE_COLUMNS, row)) for row in rows()],
+        'read_models': lambda: [venue_record(row) for row in rows()],
+    }
+    results = {}
+    for name, build in builders.items():
+        timings = []
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            loaded = build()
+            timings.append(time.perf_counter() - started)
+            del loaded
+            db.session.remove()
+        gc.collect()
+        tracemalloc.start()
+        loaded = build()
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'rows': len(loaded),
+            'ms': round(min(timings) * 1000, 1),
+            'rows_per_second': int(len(loaded) / min(timings)),
+            'held_mib': round(held / 2 ** 20, 1),
+            'peak_mib': round(peak / 2 ** 20, 1),
+        }
+        del loaded
+        db.session.remove()
+    return results
+
+
+def typeahead(app, index, repeat=1000, builds=3):
+    """Time rebuilding `index` from the database, with the memory it then
+    holds, lookups for short, word-length and missing prefixes, the
+    /typeahead endpoint and an incremental update.
+    """
+    from models import db
+    timings = []
+    for _ in range(builds):
+        gc.collect()
+        started = time.perf_counter()
+        index.build()
+        timings.append(time.perf_counter() - started)
+        db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    index.build()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+
+    names = sorted(index.names.values())
+    sample = names[len(names) // 2] if names else 'the'
+    word = sample.lower().split()[0]
+    prefixes = {
+        'one_letter': word[:1],
+        'three_letters': word[:3],
+        'word': word,
+        'two_words': ' '.join(sample.lower().split()[:2])[:len(word) + 2],
+        'missing': 'zzqx',
+    }
+    lookups = {}
+    for name, prefix in prefixes.items():
+        lookups[name] = dict(time_calls(lambda: index.lookup(prefix), repeat), prefix=prefix,
+                             hits=len(index.lookup(prefix)))
+
+    client = app.test_client()
+    client.get('/typeahead?q=' + word)
+    endpoint = time_calls(lambda: client.get('/typeahead', query_string={'q': word[:3]}), repeat)
+
+    kind, id = next(iter(index.names))
+    update = time_calls(lambda: index.add(kind, id, 'Benchmark Renamed ' + sample), repeat)
+    return {
+        'names': len(index),
+        'entries': len(index.entries),
+        'rebuild_s': {'best': round(min(timings), 3), 'p50': round(percentile(timings, 50), 3)},
+        'held_mib': round(held / 2 ** 20, 1),
+        'bytes_per_name': int(held / len(index)) if len(index) else 0,
+        'lookup': lookups,
+        'endpoint': endpoint,
+        'update': update,
+    }
+
+
+def trigram_search(terms, per_page=20, repeat=20):
+    """Time search() for each of `terms` on venues and artists as planned,
+    and again with bitmap scans off: the only way PostgreSQL reads the
+    gin_trgm_ops indexes, so that run is the ILIKE scan they replaced.
+    """
+    from sqlalchemy import text
+    from search import search
+    from models import db, Artist, Venue
+
+    indexes = sorted(name for name, in db.session.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE indexname LIKE '%\\_trgm'")))
+    results = {'trigram_indexes': indexes}
+    for model in (Venue, Artist):
+        result = results[model.__tablename__] = {'rows': db.session.query(model).count()}
+        db.session.remove()
+        for term in terms:
+            timings = result[term] = {'matches': search(model, term, 1, per_page)[0]}
+            for name, setting in (('trigram', 'on'), ('ilike_scan', 'off')):
+                db.session.execute(text('SET LOCAL enable_bitmapscan = ' + setting))
+                timings[name] = time_calls(lambda: search(model, term, 1, per_page), repeat)
+                db.session.remove()
+    return results
+
+
+def genre_search(term, genres, per_page=20, repeat=20):
+    """Time a venue and an artist search restricted to `genres`, matching
+    the literal spellings (as before) and every spelling of each genre.
+    """
+    import search as search_module
+    from sqlalchemy import cast
+    from sqlalchemy.dialects.postgresql import array
+    from models import db, Artist, Venue
+
+    def literal(column, genres):
+        return column.op('@>')(cast(array(genres), column.type))
+
+    current = search_module.genre_match
+    results = {}
+    for model in (Venue, Artist):
+        result = results[model.__tablename__] = {'rows': db.session.query(model).count()}
+        for name, match in (('literal', literal), ('spellings', current)):
+            search_module.genre_match = match
+            try:
+                result[name] = time_calls(
+                    lambda: search_module.search(model, term, 1, per_page, genres), repeat)
+                result[name]['matches'] = search_module.search(model, term, 1, per_page, genres)[0]
+            finally:
+                search_module.genre_match = current
+            db.session.remove()
+    return results
+
+
+def forms(app, repeat=2000):
+    """Microseconds to build, validate and render the venue form in a
+    request, and to validate one import row.
+    """
+    from flask import render_template
+    from werkzeug.datastructures import MultiDict
+    from forms import VenueForm
+    from importer import validate
+
+    row = {
+        'name': 'Benchmark Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+        'phone': '512-555-0100', 'genres': ['Jazz', 'Blues'],
+        'facebook_link': 'https://www.facebook.com/benchmark', 'image_link': '',
+        'website': '', 'seeking_talent': True, 'seeking_description': 'Anyone',
+    }
+    data = MultiDict(dict(row, genres=None, seeking_talent='y', website_link=''))
+    data.setlist('genres', row['genres'])
+    results = {}
+    with app.test_request_context('/venues/create'):
+        form = VenueForm()
+        results['construct'] = time_calls(VenueForm, repeat)
+        results['render'] = time_calls(lambda: render_template('forms/new_venue.html', form=form), repeat)
+        results['edit_render'] = time_calls(
+            lambda: render_template('forms/edit_venue.html', form=VenueForm(data), venue=row), repeat)
+    with app.test_request_context('/venues/create', method='POST', data=data):
+        results['validate'] = time_calls(
+            lambda: VenueForm(data, meta={'csrf': False}).validate(), repeat)
+    with app.app_context():
+        assert validate('venues', row)[1] is None
+        results['import_row'] = time_calls(lambda: validate('venues', row), repeat)
+    return results
+
+
+def matches(app, engine, repeat=200):
+    """How long answering "best venues for artist X" takes from the stored
+    lists, through the API, and by scoring every venue on the spot; and the
+    refresh an artist's edit costs. Artists are picked at random.
+    """
+    import itertools
+    import random
+    from models import db
+
+    started = time.perf_counter()
+    engine.build()
+    build_seconds = time.perf_counter() - started
+    if not engine.table_built:
+        raise RuntimeError('No stored matches; run `flask matches-build` first')
+    random.seed(0)
+    artist_ids = random.choices(engine.profiles['artist'].ids.tolist(), k=repeat)
+    ids = itertools.cycle(artist_ids)
+    client = app.test_client()
+    results = {
+        'venues': len(engine.profiles['venue']),
+        'artists': len(engine.profiles['artist']),
+        'columns_build_s': round(build_seconds, 3),
+        'stored': time_calls(lambda: engine.matches('artist', next(ids), 10), repeat),
+        'api': time_calls(lambda: client.get('/api/v1/artists/%d/matches' % next(ids)).get_data(), repeat),
+        'live': time_calls(lambda: engine.ranked('artist', next(ids), 10), repeat),
+        'refresh': time_calls(lambda: engine.refresh('artist', [next(ids)]), min(repeat, 50)),
+    }
+    db.session.remove()
+    return results
+
+
+INSERT_SHOWS = '''
+INSERT INTO "Show" (venue_id, artist_id, start_time)
+SELECT :venue_id, (CAST(:artist_ids AS integer[]))[1 + i % cardinality(CAST(:artist_ids AS integer[]))],
+       :start + i * interval '3 hours'
+  FROM generate_series(0, :shows - 1) i
+'''
+
+
+def deletes(app, sizes, repeat=5, batch_size=1000):
+    """Milliseconds a DELETE /venues/<id>/delete request takes for venues
+    with each number of shows in `sizes`, and seconds the purge of each
+    venue then takes (what the request used to wait for). Adds and purges
+    its own venues.
+    """
+    from datetime import timezone
+    from sqlalchemy import text
+    from models import db, Artist, Venue
+    import purge
+
+    client = app.test_client()
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id).limit(1000)]
+    if not artist_ids:
+        raise RuntimeError('No artists; seed some first')
+    results = {}
+    for shows in sizes:
+        requests, purges = [], []
+        for _ in range(repeat):
+            venue = Venue(name='Benchmark Purge', genres=['Jazz'], city='Austin', state='TX')
+            db.session.add(venue)
+            db.session.flush()
+            venue_id = venue.id
+            if shows:
+                db.session.execute(text(INSERT_SHOWS), {
+                    'venue_id': venue_id, 'artist_ids': artist_ids, 'shows': shows,
+                    'start': datetime(2040, 1, 1, tzinfo=timezone.utc)})
+            db.session.commit()
+            started = time.perf_counter()
+            response = client.delete('/venues/%d/delete' % venue_id)
+            requests.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+            started = time.perf_counter()
+            purge.purge_row('venue', venue_id, datetime.utcnow(), batch_size, 0)
+            purges.append(time.perf_counter() - started)
+        results[shows] = {
+            'delete_p50_ms': round(percentile(requests, 50) * 1000, 2),
+            'delete_max_ms': round(max(requests) * 1000, 2),
+            'purge_p50_s': round(percentile(purges, 50), 3),
+        }
+    db.session.remove()
+    return results
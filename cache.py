@@ -0,0 +1,299 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from urllib.parse import urlencode
+from flask import g, request, session, Response
+from dates import viewer_timezone
+
+#----------------------------------------------------------------------------#
+# Rendered-page cache.
+#----------------------------------------------------------------------------#
+
+# etag: the conditional GET validator the page was rendered under, if any
+CachedPage = namedtuple('CachedPage', 'body status mimetype expires_at etag', defaults=(None,))
+
+
+class MemoryBackend:
+    """Per-process LRU cache bounded by the total size of the cached bodies.
+
+    Only suitable when the app runs as a single process: other workers
+    never see its invalidations. Use the Redis backend under gunicorn.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (page, tags, size)
+        self.tags = {}                # tag -> set of keys
+        self.size = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def current_generation(self):
+        return self.generation
+
+    def _remove(self, key):
+        page, tags, size = self.entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0].expires_at <= time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, page, tags, generation):
+        size = len(key) + len(page.body)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            # an invalidation ran while this page was rendering; it may
+            # already be stale
+            if generation != self.generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (page, tags, size)
+            self.size += size
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._remove(key)
+
+
+class RedisBackend:
+    """Cache shared by every worker through a Redis-compatible server.
+
+    Pages are hashes expiring with the entry; each tag is a set of the page
+    keys carrying it, kept alive for `tag_ttl` seconds (the longest a page
+    lives) from the last page added to it, so it outlasts all of them. The
+    byte budget is left to the server's maxmemory policy; whichever one
+    evicts, a page is only served while every one of its tag sets is still
+    there to invalidate it. `client` is anything exposing the redis-py API,
+    which lets a fake stand in for a server.
+    """
+
+    def __init__(self, client, prefix='fyyur:cache:', tag_ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.tag_ttl = tag_ttl
+
+    def current_generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def get(self, key):
+        fields = self.client.hgetall(self.prefix + 'page:' + key)
+        if not fields:
+            return None
+        tag_keys = [self.prefix + 'tag:' + tag for tag in fields.get(b'tags', b'').decode().split('\n') if tag]
+        if tag_keys and self.client.exists(*tag_keys) != len(tag_keys):
+            # a tag set was evicted: nothing would invalidate this page any more
+            self.client.delete(self.prefix + 'page:' + key)
+            return None
+        return CachedPage(
+            body=fields[b'body'],
+            status=int(fields[b'status']),
+            mimetype=fields[b'mimetype'].decode(),
+            expires_at=float(fields[b'expires_at']),
+            etag=fields.get(b'etag', b'').decode() or None
+        )
+
+    def set(self, key, page, tags, generation):
+        from redis.exceptions import WatchError
+        ttl = int(page.expires_at - time.time())
+        if ttl <= 0:
+            return
+        page_key = self.prefix + 'page:' + key
+        with self.client.pipeline() as pipe:
+            try:
+                # an invalidation between this check and the writes makes
+                # them fail rather than store a page that may be stale
+                pipe.watch(self.prefix + 'generation')
+                if int(pipe.get(self.prefix + 'generation') or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.hset(page_key, mapping={
+                    'body': page.body,
+                    'status': page.status,
+                    'mimetype': page.mimetype,
+                    'expires_at': page.expires_at,
+                    'etag': page.etag or '',
+                    'tags': '\n'.join(sorted(tags))
+                })
+                pipe.expire(page_key, ttl)
+                for tag in tags:
+                    pipe.sadd(self.prefix + 'tag:' + tag, key)
+                    pipe.expire(self.prefix + 'tag:' + tag, max(self.tag_ttl, ttl))
+                pipe.execute()
+            except WatchError:
+                pass
+
+    def invalidate(self, tags):
+        # the generation goes first: a set() still in flight either fails
+        # on it or has added its key by the time the tag sets are read
+        self.client.incr(self.prefix + 'generation')
+        tag_keys = [self.prefix + 'tag:' + tag for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys.update(self.client.smembers(tag_key))
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.delete(self.prefix + 'page:' + key.decode())
+        pipe.delete(*tag_keys)
+        pipe.execute()
+
+
+def make_backend(config):
+    if config['CACHE_BACKEND'] == 'redis':
+        import redis
+        return RedisBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']),
+                            tag_ttl=config['CACHE_DEFAULT_TIMEOUT'])
+    return MemoryBackend(config['CACHE_MAX_BYTES'])
+
+
+class ResponseCache:
+    """Caches rendered GET responses keyed by path and query arguments.
+
+    Views are tagged with what they render ('venue:3', 'shows', ...) and the
+    write paths invalidate by tag. A view can add tags or bring its expiry
+    forward (e.g. to when its next upcoming show starts) while it runs,
+    through cache_tag() and cache_expires().
+
+    Under @conditional, a page is stored with the ETag it was rendered
+    under and only served while the data still yields that ETag. The memory
+    backend is per process, so another worker's writes do not clear it;
+    the ETag check keeps those pages from going out once stale.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['CACHE_ENABLED']
+        self.default_timeout = app.config['CACHE_DEFAULT_TIMEOUT']
+        self.max_page_bytes = app.config['CACHE_MAX_PAGE_BYTES']
+        self.reinvalidate_after = app.config['CACHE_REINVALIDATE_AFTER']
+        if self.backend is None:
+            self.backend = make_backend(app.config)
+
+    @staticmethod
+    def key():
+        # show times are rendered in the viewer's timezone
+        args = sorted(request.args.items(multi=True))
+        return request.path + '?' + urlencode(args) + '#' + viewer_timezone().zone
+
+    def cached(self, *tags):
+        """Cache the decorated view. `tags` may use the view arguments as
+        format fields, e.g. 'venue:{venue_id}'.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # pages with pending flash messages are personal; clients
+                # pinned to the primary after a write must not see a page
+                # rendered from a lagging replica
+                if not self.enabled or request.method != 'GET' or session.get('_flashes') \
+                        or g.get('sticky_primary'):
+                    return view(**kwargs)
+                key = self.key()
+                etag = g.get('page_etag')
+                page = self.backend.get(key)
+                if page is not None and page.etag == etag:
+                    self.hits += 1
+                    response = Response(page.body, status=page.status, mimetype=page.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                # rendered from older data, possibly changed through another worker
+                self.misses += 1
+
+                generation = self.backend.current_generation()
+                g.cache_tags = {tag.format(**kwargs) for tag in tags}
+                g.cache_expires_at = time.time() + self.default_timeout
+                response = view(**kwargs)
+                if not isinstance(response, Response):
+                    response = Response(response)
+                if response.status_code == 200 and response.is_streamed:
+                    response.response = self.tee(response.iter_encoded(), response, key, generation,
+                                                 g._get_current_object(), etag)
+                elif response.status_code == 200:
+                    self.backend.set(key, CachedPage(
+                        body=response.get_data(),
+                        status=response.status_code,
+                        mimetype=response.mimetype,
+                        expires_at=g.cache_expires_at,
+                        etag=etag
+                    ), frozenset(g.cache_tags), generation)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def tee(self, body, response, key, generation, state, etag):
+        """Pass the chunks of a streamed page through, caching the page once
+        it was sent in full unless it grew past max_page_bytes. `state` is
+        the request's g, still readable after the request context is gone.
+        """
+        chunks = []
+        size = 0
+        for chunk in body:
+            if chunks is not None:
+                size += len(chunk)
+                chunks.append(chunk)
+                if size > self.max_page_bytes:
+                    chunks = None
+            yield chunk
+        if chunks is not None:
+            self.backend.set(key, CachedPage(
+                body=b''.join(chunks),
+                status=response.status_code,
+                mimetype=response.mimetype,
+                expires_at=state.cache_expires_at,
+                etag=etag
+            ), frozenset(state.cache_tags), generation)
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        self.backend.invalidate(tags)
+        if self.reinvalidate_after:
+            # a page re-rendered from a lagging replica right after the
+            # write may hold the old data; drop it once the replicas caught up
+            timer = threading.Timer(self.reinvalidate_after, self.backend.invalidate, (tags,))
+            timer.daemon = True
+            timer.start()
+
+
+def cache_tag(*tags):
+    """Tag the page being rendered so invalidating any of `tags` drops it."""
+    if 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+
+def cache_expires(when):
+    """Expire the page being rendered no later than `when` (an aware
+    datetime, as stored on Show.start_time).
+    """
+    if when is not None and 'cache_expires_at' in g:
+        g.cache_expires_at = min(g.cache_expires_at, when.timestamp())
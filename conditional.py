@@ -0,0 +1,48 @@
+from functools import wraps
+from hashlib import blake2b
+from flask import g, request, session, make_response
+from dates import viewer_timezone
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+def conditional(validator):
+    """Answer repeat GETs with 304 Not Modified when nothing changed.
+
+    `validator` is called with the view arguments and returns a tuple that
+    changes whenever the page would (None if the page does not exist). Its
+    ETag is checked against If-None-Match before the view runs its queries
+    or renders anything. The first item, a datetime, is sent as
+    Last-Modified, but If-Modified-Since alone never produces a 304: the
+    rest of the state (row counts, the next show start) has no timestamp.
+    The ETag is left in g.page_etag for the page cache to check against.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # pages with pending flash messages have to be rendered
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(**kwargs)
+            state = validator(**kwargs)
+            if state is None:
+                return view(**kwargs)
+            # the same state renders differently in another timezone
+            state = tuple(state) + (viewer_timezone().zone,)
+            etag = blake2b(repr(state).encode(), digest_size=16).hexdigest()
+            # a cached copy is only good for the state it was rendered in
+            g.page_etag = etag
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = state[0]
+            # let browsers and the CDN keep the page but always revalidate it
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -1,16 +1,222 @@
 import os
 
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
-SQLALCHEMY_TRACK_MODIFICATIONS = True
 
+def env_flag(name, default=False):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
 
-#TODO IMPLEMENT DATABASE URL
-#SQLALCHEMY_DATABASE_URI = "postgresql://{}:{}@{}:{}/{}".format(DB_USERNAME, DB_PASSWORD, DB_HOST, DB_PORT, DATABASE_NAME)
 
-#URI for Production
-SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+def engine_options(url, pool_size, max_overflow, pool_timeout, pool_recycle,
+                   statement_timeout, pgbouncer):
+    """SQLALCHEMY_ENGINE_OPTIONS for a per-process QueuePool.
+
+    Each gunicorn worker holds up to pool_size + max_overflow connections,
+    so workers * (pool_size + max_overflow) must stay under the server's
+    max_connections (or PgBouncer's default_pool_size when behind it).
+    pool_pre_ping replaces connections the server or a proxy dropped, and
+    pool_recycle retires them before an idle timeout on the way does.
+
+    PgBouncer in transaction mode rejects the 'options' startup parameter
+    and hands session state to other clients, so there the statement
+    timeout is applied per transaction instead (see models.py). psycopg2
+    never uses server-side prepared statements, so nothing else needs
+    switching off; a psycopg 3 or asyncpg driver would need prepared
+    statements disabled.
+    """
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+    if statement_timeout and not pgbouncer:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options_for(url, options)
+
+
+def options_for(url, options):
+    """`options` less what `url`'s database cannot take: SQLite files get a
+    NullPool, which has no size, overflow or timeout, and no server to pass
+    startup options to.
+    """
+    if url and url.startswith('sqlite'):
+        options = {name: value for name, value in options.items()
+                   if name not in ('pool_size', 'max_overflow', 'pool_timeout', 'connect_args')}
+    return options
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+
+    DEBUG = False
+    TESTING = False
+
+    #URI for Production
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    # the per-object change tracking only feeds Flask-SQLAlchemy's signals,
+    # which nothing here listens to
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read replicas (comma separated URLs) that serve GET requests, and how
+    # long a client that posted a form keeps reading from the primary.
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = 5
+
+    # Running behind PgBouncer in transaction pooling mode, and the longest
+    # a statement may run (milliseconds, 0 for no limit).
+    DATABASE_PGBOUNCER = env_flag('DATABASE_PGBOUNCER')
+    DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 30000))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        SQLALCHEMY_DATABASE_URI,
+        pool_size=int(os.environ.get('DATABASE_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DATABASE_MAX_OVERFLOW', 5)),
+        pool_timeout=10,
+        pool_recycle=1800,
+        statement_timeout=DATABASE_STATEMENT_TIMEOUT,
+        pgbouncer=DATABASE_PGBOUNCER
+    )
+
+    # Number of shows per page on /shows.
+    SHOWS_PER_PAGE = 30
+
+    # Show tiles rendered per section on the venue and artist pages; the rest
+    # are fetched with the "Load more" button.
+    UPCOMING_SHOWS_LIMIT = 12
+    PAST_SHOWS_LIMIT = 12
+
+    # Stream the venue and artist listings: rows are read from a server-side
+    # cursor STREAM_YIELD_PER at a time and the page is sent in chunks of
+    # about STREAM_CHUNK_SIZE characters while it renders.
+    STREAM_LISTINGS = env_flag('STREAM_LISTINGS', default=True)
+    STREAM_YIELD_PER = 1000
+    STREAM_CHUNK_SIZE = 16 * 1024
+
+    # Venue and artist search results per page.
+    SEARCH_RESULTS_PER_PAGE = 20
+
+    # In-memory typeahead index: names indexed per process, and how old (in
+    # seconds) the index may get before it is rebuilt to pick up writes made
+    # through other workers.
+    TYPEAHEAD_MAX_NAMES = 200000
+    TYPEAHEAD_MAX_AGE = 300
+
+    # Venue-artist matching: matches stored per venue and per artist, and how
+    # old (seconds) each worker's in-memory copy of the scoring columns may
+    # get before it is reloaded to pick up other workers' writes.
+    MATCH_TOP_K = 20
+    MATCH_MAX_AGE = 300
+
+    # Rendered-page cache. The memory backend is per process; with several
+    # gunicorn workers use 'redis' (needs the redis package) so invalidations
+    # reach every worker.
+    CACHE_ENABLED = True
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_MAX_BYTES = 64 * 1024 * 1024
+    # streamed pages are collected while sent; larger ones are not cached
+    CACHE_MAX_PAGE_BYTES = 16 * 1024 * 1024
+    CACHE_DEFAULT_TIMEOUT = 300
+    # With replicas, invalidate a second time this many seconds after a write
+    # to drop pages re-rendered from a replica that had not caught up yet.
+    CACHE_REINVALIDATE_AFTER = REPLICA_STICKY_SECONDS if SQLALCHEMY_REPLICA_URIS else 0
+
+    # Request profiling: the share of requests timed (Server-Timing header and a
+    # JSON log line each), how many of the slowest statements to log, and how
+    # often one statement may repeat in a request before it is flagged as N+1.
+    # PROFILING_PANEL lets ?_profile=1 append the details to a page; keep it off
+    # in production, the panel shows statement parameters.
+    PROFILING_ENABLED = True
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '1.0'))
+    PROFILING_SLOW_STATEMENTS = 5
+    PROFILING_DUPLICATE_THRESHOLD = 5
+    PROFILING_PANEL = False
+
+    # Prometheus metrics, served at METRICS_PATH. Under gunicorn also set
+    # PROMETHEUS_MULTIPROC_DIR so the numbers cover every worker.
+    METRICS_ENABLED = True
+    METRICS_PATH = '/metrics'
+
+    # Write-behind for show submissions: when on, validated shows are queued
+    # in a local SQLite journal and inserted in batches by a background
+    # thread; the form gets a ticket to poll instead of waiting on a commit.
+    SHOW_WRITE_BEHIND = env_flag('SHOW_WRITE_BEHIND')
+    SHOW_QUEUE_PATH = os.environ.get('SHOW_QUEUE_PATH', os.path.join(basedir, 'show-queue.sqlite3'))
+    SHOW_QUEUE_BATCH_SIZE = 500
+    SHOW_QUEUE_CLAIM_TIMEOUT = 30
+    SHOW_QUEUE_RETENTION = 24 * 3600
+
+    # How often (seconds) each worker moves shows that have started from the
+    # upcoming to the past counts; 0 to run `flask stats-rollover` from cron
+    # instead. Pages are exact either way, a longer interval only makes them
+    # count more recent shows themselves.
+    STATS_ROLLOVER_INTERVAL = 60
+
+    # Deleted venues and artists: how long (seconds) they can be restored,
+    # and how often each worker purges the ones past that (0 to run `flask
+    # purge` from cron instead). Their shows go PURGE_BATCH_SIZE per
+    # transaction with a pause of PURGE_BATCH_PAUSE seconds in between.
+    PURGE_RESTORE_WINDOW = 24 * 3600
+    PURGE_INTERVAL = 300
+    PURGE_BATCH_SIZE = 1000
+    PURGE_BATCH_PAUSE = 0.05
+
+    # Show times are stored in UTC and shown in the timezone the browser
+    # reports (the 'tz' cookie), else in DISPLAY_TIMEZONE.
+    DISPLAY_TIMEZONE = os.environ.get('DISPLAY_TIMEZONE', 'UTC')
+    DISPLAY_LOCALE = 'en'
+
+    # Bulk import: rows per transaction, and where uploads write rejected rows.
+    IMPORT_BATCH_SIZE = 5000
+    IMPORT_ERRORS_DIR = os.environ.get('IMPORT_ERRORS_DIR', '/tmp')
+
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+    PROFILING_PANEL = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', Config.SQLALCHEMY_DATABASE_URI)
+    WTF_CSRF_ENABLED = False
+    CACHE_ENABLED = False
+    PROFILING_ENABLED = False
+    # no background rollovers or purges changing the data under a test
+    STATS_ROLLOVER_INTERVAL = 0
+    PURGE_INTERVAL = 0
+    DATABASE_STATEMENT_TIMEOUT = 5000
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        SQLALCHEMY_DATABASE_URI, pool_size=2, max_overflow=2, pool_timeout=5, pool_recycle=1800,
+        statement_timeout=DATABASE_STATEMENT_TIMEOUT,
+        pgbouncer=Config.DATABASE_PGBOUNCER
+    )
+
+
+class ProductionConfig(Config):
+    # every worker has to sign session cookies (and so the replica
+    # stickiness they carry) with the same key; no random fallback
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # sample a few requests; every one of them still gets metrics
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0.01'))
+    DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 5000))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.SQLALCHEMY_DATABASE_URI,
+        pool_size=int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+        max_overflow=int(os.environ.get('DATABASE_MAX_OVERFLOW', 10)),
+        pool_timeout=5,
+        pool_recycle=1800,
+        statement_timeout=DATABASE_STATEMENT_TIMEOUT,
+        pgbouncer=Config.DATABASE_PGBOUNCER
+    )
+
+
+# FYYUR_ENV picks one of these; development is the default.
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+import pytz
+from babel import Locale
+from babel.dates import DateTimeFormat, tokenize_pattern
+from flask import current_app, has_request_context, request
+
+#----------------------------------------------------------------------------#
+# Dates and times.
+#----------------------------------------------------------------------------#
+
+# Show times are stored as timestamptz and handled as aware UTC datetimes;
+# they only take the viewer's timezone when a template formats them.
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# set by layouts/main.html from the browser's Intl API
+TIMEZONE_COOKIE = 'tz'
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def to_utc(value, tzinfo=timezone.utc):
+    """`value` as an aware UTC datetime; a naive one is taken to be in `tzinfo`."""
+    if value.tzinfo is None:
+        value = tzinfo.localize(value) if hasattr(tzinfo, 'localize') else value.replace(tzinfo=tzinfo)
+    return value.astimezone(timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """pytz timezone by name; raises pytz.UnknownTimeZoneError."""
+    return pytz.timezone(name)
+
+
+def viewer_timezone():
+    """The timezone in the viewer's cookie, or DISPLAY_TIMEZONE."""
+    if has_request_context():
+        name = request.cookies.get(TIMEZONE_COOKIE)
+        if name:
+            try:
+                return get_timezone(name)
+            except pytz.UnknownTimeZoneError:
+                pass
+    return get_timezone(current_app.config['DISPLAY_TIMEZONE'])
+
+
+def _number(attribute, width, transform=None):
+    def field(value):
+        number = getattr(value, attribute)
+        return str(transform(number) if transform else number).zfill(width)
+    return field
+
+
+def _name(names, key):
+    return lambda value: names[key(value)]
+
+
+def _field(char, count, locale):
+    """A function formatting one pattern field, with the locale's names
+    looked up once; fields without a fast path go through Babel.
+    """
+    width = {3: 'abbreviated', 4: 'wide', 5: 'narrow'}.get(count, 'abbreviated')
+    if char == 'y' and count != 2:
+        return _number('year', count)
+    if char == 'y':
+        return _number('year', 2, lambda year: year % 100)
+    if char == 'M' and count <= 2:
+        return _number('month', count)
+    if char == 'M':
+        return _name(locale.months['format'][width], lambda value: value.month)
+    if char == 'd':
+        return _number('day', count)
+    if char == 'E':
+        return _name(locale.days['format'][width], lambda value: value.weekday())
+    if char == 'h':
+        return _number('hour', count, lambda hour: hour % 12 or 12)
+    if char == 'H':
+        return _number('hour', count)
+    if char == 'm':
+        return _number('minute', count)
+    if char == 's':
+        return _number('second', count)
+    if char == 'a':
+        periods = locale.day_periods['format']['abbreviated']
+        am, pm = periods['am'], periods['pm']
+        return lambda value: pm if value.hour >= 12 else am
+    key = char * count
+    return lambda value: DateTimeFormat(value, locale)[key]
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(format, locale):
+    """The named (see FORMATS) or literal Babel pattern `format` for
+    `locale`, as a list of literal strings and field functions.
+    """
+    locale = Locale.parse(locale)
+    parts = []
+    for kind, value in tokenize_pattern(FORMATS.get(format, format)):
+        parts.append(value if kind == 'chars' else _field(*value, locale))
+    return parts
+
+
+def format_datetime(value, format='medium', tzinfo=timezone.utc, locale='en'):
+    """Format the aware datetime `value` in `tzinfo`, as Babel would."""
+    value = value.astimezone(tzinfo)
+    return ''.join([part if part.__class__ is str else part(value)
+                    for part in compile_pattern(format, locale)])
@@ -1,7 +1,10 @@
 from datetime import datetime
+import threading
 from flask_wtf import FlaskForm as Form
+from markupsafe import Markup
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
 from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.widgets import Select, html_params
 import re
 from enums import Genre, State
 
@@ -15,90 +18,128 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'],
         default= datetime.today()
     )
     
-state_choices=[
-            ('AL', 'AL'),
-            ('AK', 'AK'),
-            ('AZ', 'AZ'),
-            ('AR', 'AR'),
-            ('CA', 'CA'),
-            ('CO', 'CO'),
-            ('CT', 'CT'),
-            ('DE', 'DE'),
-            ('DC', 'DC'),
-            ('FL', 'FL'),
-            ('GA', 'GA'),
-            ('HI', 'HI'),
-            ('ID', 'ID'),
-            ('IL', 'IL'),
-            ('IN', 'IN'),
-            ('IA', 'IA'),
-            ('KS', 'KS'),
-            ('KY', 'KY'),
-            ('LA', 'LA'),
-            ('ME', 'ME'),
-            ('MT', 'MT'),
-            ('NE', 'NE'),
-            ('NV', 'NV'),
-            ('NH', 'NH'),
-            ('NJ', 'NJ'),
-            ('NM', 'NM'),
-            ('NY', 'NY'),
-            ('NC', 'NC'),
-            ('ND', 'ND'),
-            ('OH', 'OH'),
-            ('OK', 'OK'),
-            ('OR', 'OR'),
-            ('MD', 'MD'),
-            ('MA', 'MA'),
-            ('MI', 'MI'),
-            ('MN', 'MN'),
-            ('MS', 'MS'),
-            ('MO', 'MO'),
-            ('PA', 'PA'),
-            ('RI', 'RI'),
-            ('SC', 'SC'),
-            ('SD', 'SD'),
-            ('TN', 'TN'),
-            ('TX', 'TX'),
-            ('UT', 'UT'),
-            ('VT', 'VT'),
-            ('VA', 'VA'),
-            ('WA', 'WA'),
-            ('WV', 'WV'),
-            ('WI', 'WI'),
-            ('WY', 'WY'),
-        ]
-
-
-genre_choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+# Derived from the enums once, at import; a field given a callable instead
+# would rebuild its list for every form.
+state_choices = State.choices()
+genre_choices = Genre.choices()
+STATES = frozenset(name for name, _ in state_choices)
+GENRES = frozenset(name for name, _ in genre_choices)
+
+PHONE = re.compile(r'^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
 
 
 def is_valid_phone(number):
-    regex = re.compile('^\(?([0-9]{3})\)?[-. ]?([0-9]{3})[-. ]?([0-9]{4})$')
-    return regex.match(number)
+    return PHONE.match(number)
+
+
+class CachedSelect(Select):
+    """wtforms' Select, with each option's markup built once per choice
+    list (selected and not) instead of on every render.
+    """
+
+    def __init__(self, multiple=False):
+        super().__init__(multiple=multiple)
+        self.rendered = {}  # choices -> [(option, selected option)]
+
+    def options(self, choices):
+        # each bound field holds a copy of the list, so key on its items
+        key = tuple(choices)
+        options = self.rendered.get(key)
+        if options is None:
+            options = self.rendered[key] = [
+                (self.render_option(value, label, False), self.render_option(value, label, True))
+                for value, label in choices]
+        return options
+
+    def __call__(self, field, **kwargs):
+        if not _plain_choices(field):
+            return super().__call__(field, **kwargs)
+        choices = field.choices
+        kwargs.setdefault('id', field.id)
+        if self.multiple:
+            kwargs['multiple'] = True
+        flags = vars(field.flags)
+        for name in self.validation_attrs:
+            if name in flags and name not in kwargs:
+                kwargs[name] = flags[name]
+        data = field.data
+        if self.multiple:
+            chosen = set(data) if data is not None else ()
+        else:
+            chosen = (data,)
+        html = ['<select %s>' % html_params(name=field.name, **kwargs)]
+        for (value, _), (option, selected) in zip(choices, self.options(choices)):
+            html.append(selected if value in chosen else option)
+        html.append('</select>')
+        return Markup(''.join(html))
+
+
+_choice_values = {}
+
+
+def choice_values(choices):
+    """The set of values in a list of (value, label) choices."""
+    key = tuple(choices)
+    values = _choice_values.get(key)
+    if values is None:
+        values = _choice_values[key] = frozenset(value for value, _ in choices)
+    return values
+
+
+def _plain_choices(field):
+    # what the fast paths below handle; anything else goes through wtforms
+    choices = field.choices
+    return field.coerce is str and isinstance(choices, list) \
+        and (not choices or isinstance(choices[0], tuple))
+
+
+class EnumSelectField(SelectField):
+    """SelectField checking its value against a set of the choice values
+    rather than walking the choices; errors still come from wtforms.
+    """
+    widget = CachedSelect()
+
+    def pre_validate(self, form):
+        if self.validate_choice and _plain_choices(self) \
+                and self.data in choice_values(self.choices):
+            return
+        super().pre_validate(form)
+
+
+class EnumSelectMultipleField(SelectMultipleField):
+    """SelectMultipleField counterpart of EnumSelectField."""
+    widget = CachedSelect(multiple=True)
+
+    def pre_validate(self, form):
+        if _plain_choices(self) and (not self.data or choice_values(self.choices).issuperset(self.data)):
+            return
+        super().pre_validate(form)
+
+
+class FormValidator:
+    """Validates rows with a form bound once per thread and reprocessed
+    for each row: the form's own rules and messages, without building its
+    fields again. For the import and queued write paths; pages that render
+    the form still build one per request.
+    """
+
+    def __init__(self, form_class):
+        self.form_class = form_class
+        self.local = threading.local()
+
+    def __call__(self, formdata):
+        """The validated form, or None and the errors."""
+        form = getattr(self.local, 'form', None)
+        if form is None:
+            form = self.local.form = self.form_class(formdata=None, meta={'csrf': False})
+        form.process(formdata)
+        if not form.validate():
+            return None, form.errors
+        return form, None
 
 
 class VenueForm(Form):
@@ -108,9 +149,9 @@ class VenueForm(Form):
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = EnumSelectField(
         'state', validators=[DataRequired()],
-        choices=State.choices
+        choices=state_choices
     )
     address = StringField(
         'address', validators=[DataRequired()]
@@ -121,10 +162,10 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
+    genres = EnumSelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
-        choices=Genre.choices()    
+        choices=genre_choices
     )
     facebook_link = StringField(
         'facebook_link', validators=[URL()]
@@ -147,10 +188,10 @@ class VenueForm(Form):
         if not is_valid_phone(self.phone.data):
             self.phone.errors.append('Invalid phone.')
             return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
+        if not GENRES.issuperset(self.genres.data):
             self.genres.errors.append('Invalid genres.')
             return False
-        if self.state.data not in dict(State.choices()).keys():
+        if self.state.data not in STATES:
             self.state.errors.append('Invalid state.')
             return False
         # if pass validation
@@ -164,9 +205,9 @@ class ArtistForm(Form):
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = EnumSelectField(
         'state', validators=[DataRequired()],
-        choices=State.choices
+        choices=state_choices
     )
     phone = StringField(
         # TODO implement validation logic for state
@@ -175,9 +216,9 @@ class ArtistForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
+    genres = EnumSelectMultipleField(
         'genres', validators=[DataRequired()],
-        choices=Genre.choices()
+        choices=genre_choices
     )      
     facebook_link = StringField(
         # TODO implement enum restriction
@@ -203,10 +244,10 @@ class ArtistForm(Form):
         if not is_valid_phone(self.phone.data):
             self.phone.errors.append('Invalid phone.')
             return False
-        if not set(self.genres.data).issubset(dict(Genre.choices()).keys()):
+        if not GENRES.issuperset(self.genres.data):
             self.genres.errors.append('Invalid genres.')
             return False
-        if self.state.data not in dict(State.choices()).keys():
+        if self.state.data not in STATES:
             self.state.errors.append('Invalid state.')
             return False
         # if pass validation
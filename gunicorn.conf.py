@@ -0,0 +1,24 @@
+import os
+import shutil
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# Metrics from every worker are aggregated through files in
+# PROMETHEUS_MULTIPROC_DIR; it is emptied on start and a worker's live
+# gauges are dropped when it exits.
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/fyyur-metrics')
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
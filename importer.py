@@ -0,0 +1,354 @@
+import codecs
+import csv
+import io
+import json
+import time
+from datetime import timezone
+from itertools import islice
+import psycopg2
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from models import db, Artist, Venue, Show, touch
+from dates import to_utc
+from forms import VenueForm, ArtistForm, ShowForm, FormValidator
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# kind -> (model, form, {form field: model column}, multi-valued fields)
+KINDS = {
+    'venues': (Venue, VenueForm, {
+        'name': 'name',
+        'genres': 'genres',
+        'address': 'address',
+        'city': 'city',
+        'state': 'state',
+        'phone': 'phone',
+        'facebook_link': 'facebook_link',
+        'image_link': 'image_link',
+        'website_link': 'website',
+        'seeking_talent': 'seeking_talent',
+        'seeking_description': 'seeking_description',
+    }, ('genres',)),
+    'artists': (Artist, ArtistForm, {
+        'name': 'name',
+        'genres': 'genres',
+        'city': 'city',
+        'state': 'state',
+        'phone': 'phone',
+        'facebook_link': 'facebook_link',
+        'image_link': 'image_link',
+        'website_link': 'website',
+        'seeking_venue': 'seeking_venue',
+        'seeking_description': 'seeking_description',
+    }, ('genres',)),
+    'shows': (Show, ShowForm, {
+        'venue_id': 'venue_id',
+        'artist_id': 'artist_id',
+        'start_time': 'start_time',
+    }, ()),
+}
+
+
+# why a row INSERT ... ON CONFLICT DO NOTHING skipped was not stored
+CONFLICTS = {
+    'venues': 'A venue with this id already exists.',
+    'artists': 'An artist with this id already exists.',
+    'shows': 'The venue is already booked at that time.',
+}
+
+# the forms' rules, without building a form per row
+VALIDATORS = {kind: FormValidator(form_class) for kind, (_, form_class, _, _) in KINDS.items()}
+
+
+class ImportReport:
+
+    def __init__(self, kind, errors_path):
+        self.kind = kind
+        self.errors_path = errors_path
+        self.read = 0
+        self.loaded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'read': self.read,
+            'loaded': self.loaded,
+            'failed': self.failed,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors_path': self.errors_path if self.failed else None,
+        }
+
+
+def text_lines(stream, chunk_size=64 * 1024):
+    """Yield the lines of a binary UTF-8 stream, line ends kept.
+
+    Decoded chunk by chunk rather than through io.TextIOWrapper, which
+    needs readable() and friends that the SpooledTemporaryFile Werkzeug
+    keeps large uploads in lacks before Python 3.11.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+def read_rows(stream, format):
+    """Yield (line number, dict) from a binary CSV or NDJSON stream.
+
+    In CSV, multi-valued columns such as genres separate values with ';'.
+    """
+    lines = text_lines(stream)
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            if row.get('genres') is not None:
+                row['genres'] = [genre.strip() for genre in row['genres'].split(';') if genre.strip()]
+            yield number, row
+    else:
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, e
+
+
+def formdata(row, fields, multi):
+    data = MultiDict()
+    for name in fields:
+        # accept the model's column names as well as the form's; a missing
+        # column is submitted empty, as a blank input would be
+        value = row.get(name, row.get(fields[name]))
+        if value is None:
+            if name not in multi:
+                data.add(name, '')
+        elif name in multi:
+            for item in value if isinstance(value, list) else [value]:
+                data.add(name, item)
+        elif isinstance(value, bool):
+            data.add(name, 'true' if value else 'false')
+        else:
+            data.add(name, str(value))
+    return data
+
+
+def validate(kind, row, tzinfo=timezone.utc):
+    """Validate `row` with the kind's form; returns (record, errors). Show
+    times are read as wall-clock times in `tzinfo` and stored as UTC.
+    """
+    model, form_class, fields, multi = KINDS[kind]
+    form, errors = VALIDATORS[kind](formdata(row, fields, multi))
+    if errors:
+        return None, errors
+    record = {column: getattr(form, name).data for name, column in fields.items()}
+    if kind == 'shows':
+        try:
+            record['venue_id'] = int(record['venue_id'])
+            record['artist_id'] = int(record['artist_id'])
+        except (TypeError, ValueError):
+            return None, {'venue_id/artist_id': ['Must be integers.']}
+        record['start_time'] = to_utc(record['start_time'], tzinfo)
+    elif row.get('id') is not None:
+        try:
+            record['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            return None, {'id': ['Must be an integer.']}
+    return record, None
+
+
+def resolve_foreign_keys(records):
+    """Split show records into those whose venue and artist exist and the
+    rest, with one lookup per side for the whole batch.
+    """
+    venue_ids = {record['venue_id'] for record in records}
+    artist_ids = {record['artist_id'] for record in records}
+    venues = {id for id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+    artists = {id for id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    found, missing = [], []
+    for record in records:
+        if record['venue_id'] in venues and record['artist_id'] in artists:
+            found.append(record)
+        else:
+            missing.append(record)
+    return found, missing
+
+
+def pg_array(values):
+    return '{' + ','.join(
+        '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"' for value in values
+    ) + '}'
+
+
+def copy_rows(model, records):
+    """Load `records` with COPY ... FROM STDIN on the session's connection."""
+    columns = list(records[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([
+            pg_array(value) if isinstance(value, list) else
+            '' if value is None else value
+            for value in (record[column] for column in columns)
+        ])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        model.__tablename__, ', '.join('"{}"'.format(column) for column in columns)
+    ), buffer)
+    return cursor.rowcount
+
+
+def with_ids(model, records):
+    """`records` with an id each, drawn from the sequence for those without
+    one, so the rows an INSERT stores can be told from those it skips.
+    """
+    missing = sum('id' not in record for record in records)
+    ids = iter([id for id, in db.session.execute(
+        select(func.nextval(func.pg_get_serial_sequence('"{}"'.format(model.__tablename__), 'id')))
+        .select_from(func.generate_series(1, missing)))] if missing else [])
+    return [record if 'id' in record else dict(record, id=next(ids)) for record in records]
+
+
+def insert_rows(model, records):
+    """Multi-row INSERT that skips the rows clashing with stored ones (the
+    same id, a venue slot already booked); returns the ids it stored.
+    """
+    return {id for id, in db.session.execute(
+        insert(model.__table__).values(records).on_conflict_do_nothing()
+        .returning(model.__table__.c.id))}
+
+
+def insert_each(model, records):
+    """INSERT `records` one at a time; returns the ids stored and
+    {index: reason} for the rows the database refused.
+    """
+    ids, refused = set(), {}
+    for index, record in enumerate(records):
+        try:
+            with db.session.begin_nested():
+                ids |= insert_rows(model, [record])
+        except SQLAlchemyError as e:
+            refused[index] = str(getattr(e, 'orig', e)).strip()
+    return ids, refused
+
+
+def load_batch(kind, records):
+    """Load and commit one batch; returns the records stored, and {index:
+    errors} for the ones that were not.
+    """
+    model = KINDS[kind][0]
+    # COPY is fastest but all-or-nothing; rows with explicit ids may clash
+    # with existing ones, so those batches go through INSERT ... ON CONFLICT
+    if not any('id' in record for record in records):
+        try:
+            with db.session.begin_nested():
+                copy_rows(model, records)
+            stored, failed = records, {}
+        except (SQLAlchemyError, psycopg2.Error):
+            stored = None
+    else:
+        stored = None
+    if stored is None:
+        rows = with_ids(model, records)
+        try:
+            with db.session.begin_nested():
+                ids, refused = insert_rows(model, rows), {}
+        except SQLAlchemyError:
+            # one bad row fails the whole statement; find it
+            ids, refused = insert_each(model, rows)
+        stored, failed = [], {}
+        for index, row in enumerate(rows):
+            if index in refused:
+                failed[index] = {'row': [refused[index]]}
+            elif row['id'] in ids:
+                ids.discard(row['id'])  # an id repeated in the batch is stored once
+                stored.append(row)
+            else:
+                failed[index] = {'row': [CONFLICTS[kind]]}
+    if kind == 'shows' and stored:
+        # keep the conditional GET validators of the affected pages honest
+        touch(Venue, Venue.id.in_({record['venue_id'] for record in stored}))
+        touch(Artist, Artist.id.in_({record['artist_id'] for record in stored}))
+    db.session.commit()
+    return stored, failed
+
+
+def import_file(kind, stream, format, errors_path, batch_size=5000, on_batch=None):
+    """Stream `stream` into the `kind` table in batches of `batch_size`.
+
+    Memory is bounded by one batch. Each batch is validated with the same
+    form the create page uses, foreign keys are checked for the whole
+    batch at once, and the batch commits on its own; rejected rows are
+    written to `errors_path` as NDJSON and do not stop the import.
+    Rows the database skips or refuses are rejected the same way.
+    `on_batch(kind, records)` runs after each commit with the records
+    stored.
+    """
+    report = ImportReport(kind, errors_path)
+    rows = read_rows(stream, format)
+    explicit_ids = False
+    with open(errors_path, 'w') as errors_file:
+
+        def reject(number, row, errors):
+            report.failed += 1
+            errors_file.write(json.dumps({'line': number, 'row': row, 'errors': errors},
+                                         default=str) + '\n')
+
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            records = []
+            for number, row in batch:
+                report.read += 1
+                if isinstance(row, Exception) or not isinstance(row, dict):
+                    reject(number, None, {'row': [str(row)]})
+                    continue
+                record, errors = validate(kind, row)
+                if errors:
+                    reject(number, row, errors)
+                else:
+                    record['_line'] = number
+                    records.append(record)
+            if kind == 'shows' and records:
+                records, missing = resolve_foreign_keys(records)
+                for record in missing:
+                    reject(record.pop('_line'), record, {'venue_id/artist_id': ['Unknown venue or artist.']})
+            lines = [record.pop('_line') for record in records]
+            if records:
+                explicit_ids = explicit_ids or any('id' in record for record in records)
+                stored, failed = load_batch(kind, records)
+                for index, errors in sorted(failed.items()):
+                    reject(lines[index], records[index], errors)
+                report.loaded += len(stored)
+                if on_batch is not None and stored:
+                    on_batch(kind, stored)
+
+    if explicit_ids:
+        table = KINDS[kind][0].__tablename__
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+            "(SELECT MAX(id) FROM \"{0}\"))".format(table)))
+        db.session.commit()
+    report.seconds = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,38 @@
+from flask import request
+from sqlalchemy.orm import load_only, raiseload
+from models import Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Loading profiles.
+#----------------------------------------------------------------------------#
+
+# Relationships are lazy by default; each view declares here exactly what it
+# loads. Views that never render shows raise on access instead of silently
+# issuing a query, so a template change that starts touching `shows` fails
+# loudly rather than turning into an N+1. Read-only pages do not load ORM
+# instances at all (see readmodels.py).
+LOADING_PROFILES = {
+    # edit submissions need the columns but never the shows; the edit forms
+    # themselves read the venue_profile/artist_profile rows instead
+    'edit_venue_submission': (
+        raiseload(Venue.shows),
+    ),
+    'edit_artist_submission': (
+        raiseload(Artist.shows),
+    ),
+
+    # existence checks only need the primary key
+    'delete_venue': (
+        load_only(Venue.id),
+        raiseload(Venue.shows),
+    ),
+    'delete_artist': (
+        load_only(Artist.id),
+        raiseload(Artist.shows),
+    ),
+}
+
+
+def load_options(endpoint=None):
+    """Loader options registered for `endpoint` (the current one by default)."""
+    return LOADING_PROFILES.get(endpoint or request.endpoint, ())
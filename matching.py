@@ -0,0 +1,579 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint, DropConstraint
+from enums import Genre
+from models import db, Artist, Venue, ArtistMatch, VenueMatch
+
+#----------------------------------------------------------------------------#
+# Venue and artist matching.
+#----------------------------------------------------------------------------#
+
+# A venue-artist pair scores between 0 and 1:
+#   GENRE_WEIGHT x the genres they share over the genres either lists,
+#   PLACE_WEIGHT when in the same city, half that in the same state,
+#   SEEKING_WEIGHT when the venue is seeking talent and the artist a venue,
+#   half that when only one of them is.
+# Pairs sharing no genre do not match at all.
+#
+# Each side is held in memory as columns (NumPy arrays, a few MB for 100k
+# rows), genres as a bitset over the Genre enum, so scoring one venue or
+# artist against the whole other side is a handful of vectorised passes.
+# The best MATCH_TOP_K matches of every venue and artist are stored in
+# VenueMatch and ArtistMatch: `flask matches-build` fills them, and a write
+# to a venue or artist refreshes the lists it is, or now belongs, on.
+
+GENRE_WEIGHT = 0.6
+PLACE_WEIGHT = 0.25
+SEEKING_WEIGHT = 0.15
+
+# forms store a genre's name, older rows and imports its value
+GENRE_BITS = {}
+for bit, genre in enumerate(Genre):
+    GENRE_BITS[genre.name] = GENRE_BITS[genre.value] = 1 << bit
+
+# serialises refreshes and rebuilds across workers
+MATCH_LOCK = 0x6d61746368
+
+Side = namedtuple('Side', 'kind model seeking table owner other')
+# what pair_scores() reads from the other side
+Columns = namedtuple('Columns', 'genres city state seeking')
+
+SIDES = {
+    'venue': Side('venue', Venue, Venue.seeking_talent, VenueMatch, 'venue_id', 'artist_id'),
+    'artist': Side('artist', Artist, Artist.seeking_venue, ArtistMatch, 'artist_id', 'venue_id'),
+}
+OTHER = {'venue': 'artist', 'artist': 'venue'}
+
+
+def genre_bits(genres):
+    bits = 0
+    for genre in genres or ():
+        bits |= GENRE_BITS.get(genre, 0)
+    return bits
+
+
+def pair_scores(genres, city, state, seeking, other):
+    """Scores of profiles with the given columns against every row of
+    `other`. Scalars score one profile; (n, 1) arrays score n of them at
+    once, giving an n x len(other) array.
+    """
+    shared = np.bitwise_count(genres & other.genres)
+    score = shared.astype(np.float32)
+    score /= np.maximum(np.bitwise_count(genres | other.genres), 1)
+    score *= np.float32(GENRE_WEIGHT)
+    # a city code includes the state, so the same city counts twice
+    place = (city == other.city).view(np.uint8) + (state == other.state).view(np.uint8)
+    score += place * np.float32(PLACE_WEIGHT / 2)
+    score += (np.float32(seeking) + other.seeking) * np.float32(SEEKING_WEIGHT / 2)
+    score[shared == 0] = 0
+    return score
+
+
+def top(scores, ids, k):
+    """The `k` best (id, score) pairs, by score and then id."""
+    if len(scores) > k:
+        threshold = scores[np.argpartition(scores, -k)[-k:]].min()
+        candidates = np.flatnonzero(scores >= max(threshold, np.float32(1e-6)))
+    else:
+        candidates = np.flatnonzero(scores > 0)
+    order = np.lexsort((ids[candidates], -scores[candidates]))[:k]
+    picked = candidates[order]
+    return list(zip(ids[picked].tolist(), scores[picked].tolist()))
+
+
+class Places:
+    """Small integer codes for cities (with their state) and states, shared
+    by both sides so they compare as integers. A missing city or state gets
+    a code of its own and matches nothing.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.unknown = 0
+
+    def code(self, key):
+        if None in key:
+            self.unknown -= 1
+            return self.unknown
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.codes) + 1
+        return code
+
+    def columns(self, city, state):
+        state = state.strip().upper() or None if state else None
+        city = city.strip().lower() or None if city else None
+        return self.code((city, state)), self.code((state,))
+
+
+class Profiles:
+    """One side's scoring columns, one entry per venue or artist, and the
+    length and lowest score of each one's stored match list.
+
+    Deleted rows keep their entry with no genres, which scores nothing,
+    until the next build.
+    """
+
+    def __init__(self, rows, places):
+        self.places = places
+        columns = [self.encode(row) for row in rows]
+        self.ids = np.array([column[0] for column in columns], np.int64)
+        self.genres = np.array([column[1] for column in columns], np.uint32)
+        self.city = np.array([column[2] for column in columns], np.int32)
+        self.state = np.array([column[3] for column in columns], np.int32)
+        self.seeking = np.array([column[4] for column in columns], np.float32)
+        self.listed = np.zeros(len(columns), np.int32)
+        self.floor = np.zeros(len(columns), np.float32)
+        self.position = {id: i for i, id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, row):
+        id, genres, city, state, seeking = row
+        return (id, genre_bits(genres), *self.places.columns(city, state), 1.0 if seeking else 0.0)
+
+    def profile(self, position):
+        """The scoring columns of one entry, for pair_scores()."""
+        return (self.genres[position], self.city[position], self.state[position],
+                self.seeking[position])
+
+    def block(self, positions):
+        """The columns of several entries, shaped to score them together."""
+        return (self.genres[positions, None], self.city[positions, None],
+                self.state[positions, None], self.seeking[positions, None])
+
+    def subset(self, positions):
+        return Columns(self.genres[positions], self.city[positions], self.state[positions],
+                       self.seeking[positions])
+
+    def update(self, row):
+        """Add or overwrite the entry of a (id, genres, city, state, seeking) row."""
+        id, genres, city, state, seeking = self.encode(row)
+        position = self.position.get(id)
+        if position is None:
+            self.ids = np.append(self.ids, id)
+            self.genres = np.append(self.genres, np.uint32(genres))
+            self.city = np.append(self.city, np.int32(city))
+            self.state = np.append(self.state, np.int32(state))
+            self.seeking = np.append(self.seeking, np.float32(seeking))
+            self.listed = np.append(self.listed, np.int32(0))
+            self.floor = np.append(self.floor, np.float32(0))
+            position = self.position[id] = len(self.ids) - 1
+        else:
+            self.genres[position] = genres
+            self.city[position] = city
+            self.state[position] = state
+            self.seeking[position] = seeking
+        return position
+
+    def remove(self, id):
+        position = self.position.get(id)
+        if position is not None:
+            self.genres[position] = 0
+            self.listed[position] = 0
+
+    def listing(self, position, matches):
+        """Note what was stored as the entry's match list."""
+        self.listed[position] = len(matches)
+        self.floor[position] = matches[-1][1] if matches else 0
+
+    def classes(self):
+        """Entries that score alike (same genres, city, state and flag):
+        the first entry of each class, and the positions of all of them
+        grouped by class, in id order, with each class's start offset.
+        """
+        keys = np.stack([self.genres, self.city, self.state, self.seeking], axis=1).astype(np.int64)
+        _, first, inverse, counts = np.unique(
+            keys, axis=0, return_index=True, return_inverse=True, return_counts=True)
+        members = np.lexsort((self.ids, inverse.ravel()))
+        return first, members, np.concatenate(([0], np.cumsum(counts)))
+
+
+def copy_matches(side, stream):
+    """COPY CSV (owner id, other id, score) rows into the side's table."""
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}, {}, score) FROM STDIN WITH (FORMAT csv)'.format(
+        side.table.__tablename__, side.owner, side.other), stream)
+    return cursor.rowcount
+
+
+class MatchEngine:
+    """Ranks venues for artists and artists for venues.
+
+    Each process keeps both sides' columns in memory, built on first use
+    and rebuilt in the background once older than MATCH_MAX_AGE, like the
+    typeahead index. Writes made here are refreshed from a thread in each
+    worker process, off the request; refreshes take a database advisory
+    lock, so lists updated from several workers do not interleave.
+    """
+
+    def __init__(self, app=None):
+        self.profiles = None
+        self.built_at = None
+        self.table_built = False
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        self.thread = None
+        self.pid = None
+        self.changes = queue.Queue()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.k = app.config['MATCH_TOP_K']
+        self.max_age = app.config['MATCH_MAX_AGE']
+        app.extensions['matching'] = self
+
+    def load(self, kind, places):
+        side = SIDES[kind]
+        model = side.model
+        return Profiles(db.session.query(model.id, model.genres, model.city, model.state, side.seeking)
+                        .yield_per(10000), places)
+
+    def build(self):
+        """Load both sides, and where the stored lists stand."""
+        places = Places()
+        profiles = {kind: self.load(kind, places) for kind in SIDES}
+        table_built = False
+        for kind, side in SIDES.items():
+            owners = profiles[kind]
+            for owner, listed, floor in db.session.execute(text(
+                    'SELECT {}, count(*), min(score) FROM "{}" GROUP BY 1'.format(
+                        side.owner, side.table.__tablename__))):
+                position = owners.position.get(owner)
+                if position is not None:
+                    owners.listed[position] = listed
+                    owners.floor[position] = floor
+                table_built = True
+        with self.lock:
+            self.profiles, self.table_built = profiles, table_built
+            self.built_at = time.monotonic()
+
+    def expire(self):
+        """Have the next lookup trigger a background rebuild."""
+        if self.built_at is not None:
+            self.built_at = float('-inf')
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            self.build()
+            return
+        if time.monotonic() - self.built_at < self.max_age:
+            return
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+
+        def rebuild():
+            try:
+                with self.app.app_context():
+                    self.build()
+            finally:
+                self.rebuilding = False
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    def ranked(self, kind, id, limit=None):
+        """The best matches for one venue or artist, scored now: (id, score)
+        pairs, or None when there is no such venue or artist.
+        """
+        self.ensure_fresh()
+        owners, others = self.profiles[kind], self.profiles[OTHER[kind]]
+        position = owners.position.get(id)
+        if position is None:
+            # created through another worker since the last build
+            side = SIDES[kind]
+            row = db.session.query(side.model.id, side.model.genres, side.model.city,
+                                   side.model.state, side.seeking) \
+                .filter(side.model.id == id).one_or_none()
+            if row is None:
+                return None
+            with self.lock:
+                position = owners.update(row)
+        with self.lock:
+            scores = pair_scores(*owners.profile(position), others)
+            ids = others.ids
+        return top(scores, ids, limit or self.k)
+
+    def matches(self, kind, id, limit):
+        """The stored best matches for one venue or artist, as (id, score)
+        pairs; scored now instead until `flask matches-build` has run.
+        """
+        self.ensure_fresh()
+        if not self.table_built:
+            return self.ranked(kind, id, limit)
+        side = SIDES[kind]
+        return [tuple(row) for row in db.session.execute(text(
+            'SELECT {other}, score FROM "{table}" WHERE {owner} = :id '
+            'ORDER BY score DESC, {other} LIMIT :limit'.format(
+                table=side.table.__tablename__, owner=side.owner, other=side.other)),
+            {'id': id, 'limit': limit})]
+
+    def rank_all(self, kind):
+        """Yield (owner ids, matches) covering every venue or artist.
+
+        Entries that score alike are ranked once: 100k seeded venues fall
+        into ~26k such classes, and the other side's classes are scored in
+        blocks, so a full build does about a fifteenth of the pairs.
+        """
+        owners, others = self.profiles[kind], self.profiles[OTHER[kind]]
+        owner_first, owner_members, owner_starts = owners.classes()
+        first, members, starts = others.classes()
+        counts = np.diff(starts)
+        representatives = others.subset(first)
+        member_ids = others.ids[members]
+        first_ids = member_ids[starts[:-1]]
+        k = self.k
+        for begin in range(0, len(owner_first), 256):
+            scores = pair_scores(*owners.block(owner_first[begin:begin + 256]), representatives)
+            best = np.argpartition(scores, -min(k, len(first)), axis=1)[:, -k:] \
+                if len(first) else scores[:, :0]
+            for row, classes in enumerate(best, begin):
+                owner_ids = owners.ids[owner_members[owner_starts[row]:owner_starts[row + 1]]].tolist()
+                if not len(classes):
+                    yield owner_ids, []
+                    continue
+                score = scores[row - begin]
+                # k classes hold at least k members: the k-th best match
+                # scores `cutoff`, and everything above it is in
+                classes = classes[np.argsort(-score[classes], kind='stable')]
+                enough = np.searchsorted(np.cumsum(counts[classes]), k)
+                cutoff = score[classes[min(enough, len(classes) - 1)]]
+                picked = np.flatnonzero(score > max(cutoff, 0))
+                sizes = counts[picked]
+                if cutoff > 0:
+                    # ties go to the lowest ids; members are in id order, so
+                    # they come from the `need` tied classes whose first ids
+                    # are lowest, at most `need` members each
+                    need = k - sizes.sum()
+                    tied = np.flatnonzero(score == cutoff)
+                    if len(tied) > need:
+                        tied = tied[np.argpartition(first_ids[tied], need - 1)[:need]]
+                    picked = np.concatenate((picked, tied))
+                    sizes = np.concatenate((sizes, np.minimum(counts[tied], need)))
+                positions = np.arange(sizes.sum()) + np.repeat(starts[picked] - np.cumsum(sizes) + sizes, sizes)
+                yield owner_ids, top(np.repeat(score[picked], sizes), member_ids[positions], k)
+
+    def rebuild_table(self):
+        """Recompute and replace every stored match list; returns the number
+        of rows written per side.
+
+        Ranking runs against the old lists, spooling the new ones to
+        temporary files; readers wait only for the final load.
+        """
+        self.build()
+        files = {}
+        for kind in SIDES:
+            owners = self.profiles[kind]
+            chunks = {}
+            for owner_ids, matched in self.rank_all(kind):
+                lines = [',%d,%r\n' % match for match in matched]
+                for owner in owner_ids:
+                    owners.listing(owners.position[owner], matched)
+                    chunks[owner] = ''.join([str(owner) + line for line in lines])
+            # in primary key order, which loads far faster than random order
+            stream = files[kind] = tempfile.TemporaryFile('w+')
+            for owner in sorted(chunks):
+                stream.write(chunks[owner])
+            del chunks
+            stream.seek(0)
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MATCH_LOCK})
+        db.session.execute(text('TRUNCATE "ArtistMatch", "VenueMatch"'))
+        connection = db.session.connection()
+        written = {}
+        for kind, stream in files.items():
+            # checking the foreign key once and building the index once is
+            # several times quicker than doing both for every row
+            table = SIDES[kind].table.__table__
+            for constraint in table.foreign_key_constraints:
+                connection.execute(DropConstraint(constraint))
+            for index in table.indexes:
+                index.drop(bind=connection)
+            written[kind] = copy_matches(SIDES[kind], stream)
+            for index in table.indexes:
+                index.create(bind=connection)
+            for constraint in table.foreign_key_constraints:
+                connection.execute(AddConstraint(constraint))
+            stream.close()
+        db.session.commit()
+        self.table_built = True
+        return written
+
+    def store(self, side, lists):
+        """Replace the stored lists of the owners in `lists` (id -> matches)."""
+        if not lists:
+            return
+        db.session.execute(text('DELETE FROM "{}" WHERE {} = ANY(:ids)'.format(
+            side.table.__tablename__, side.owner)), {'ids': list(lists)})
+        self.insert(side, [(owner, other, score) for owner, matched in lists.items()
+                           for other, score in matched])
+
+    def insert(self, side, rows):
+        """Add (owner, other, score) `rows`, as one statement over arrays."""
+        if not rows:
+            return
+        owners, others, scores = zip(*rows)
+        db.session.execute(text(
+            'INSERT INTO "{}" ({}, {}, score) SELECT * FROM unnest(:owners, :others, CAST(:scores AS real[]))'.format(
+                side.table.__tablename__, side.owner, side.other)),
+            {'owners': list(owners), 'others': list(others), 'scores': list(scores)})
+
+    def discard(self, side, pairs):
+        """Delete the (owner, other) `pairs`."""
+        if not pairs:
+            return
+        owners, others = zip(*pairs)
+        db.session.execute(text(
+            'DELETE FROM "{table}" WHERE ({owner}, {other}) IN (SELECT * FROM unnest(:owners, :others))'.format(
+                table=side.table.__tablename__, owner=side.owner, other=side.other)),
+            {'owners': list(owners), 'others': list(others)})
+
+    def refresh(self, kind, ids):
+        """Update the stored lists after the venues or artists `ids` were
+        added, changed or deleted, and commit.
+
+        Their own lists are ranked again. On the other side they are merged
+        into the lists they were on or now make it onto (scoring at least
+        the list's lowest); a full list they drop out of is ranked again.
+        """
+        self.ensure_fresh()
+        if not self.table_built:
+            return
+        side, other = SIDES[kind], SIDES[OTHER[kind]]
+        model = side.model
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MATCH_LOCK})
+        rows = db.session.query(model.id, model.genres, model.city, model.state, side.seeking) \
+            .filter(model.id.in_(ids)).all()
+        owners, others = self.profiles[kind], self.profiles[other.kind]
+        gone = set(ids) - {row[0] for row in rows}
+        with self.lock:
+            positions = {row[0]: owners.update(row) for row in rows}
+            for id in gone:
+                owners.remove(id)
+            scores = {id: pair_scores(*owners.profile(position), others)
+                      for id, position in positions.items()}
+            other_ids, floor, listed = others.ids, others.floor, others.listed
+        own = {id: top(score, other_ids, self.k) for id, score in scores.items()}
+        # deleted ones keep no list of their own
+        self.store(side, {**dict.fromkeys(gone, ()), **own})
+        for id, matched in own.items():
+            owners.listing(positions[id], matched)
+
+        removed = {}
+        for owner, id, score in db.session.execute(text(
+                'DELETE FROM "{table}" WHERE {other} = ANY(:ids) RETURNING {owner}, {other}, score'.format(
+                    table=other.table.__tablename__, owner=other.owner, other=other.other)),
+                {'ids': list(ids)}):
+            removed.setdefault(owner, []).append((id, np.float32(score)))
+        gained = {}
+        for id, score in scores.items():
+            room = (score > 0) & ((score >= floor) | (listed < self.k))
+            for position in np.flatnonzero(room).tolist():
+                gained.setdefault(int(other_ids[position]), []).append((id, score[position].item()))
+        lists = {}
+        for owner, dropped in removed.items():
+            position = others.position.get(owner)
+            if position is None or position >= len(floor):
+                continue
+            # a list that was not full held every match, and one whose
+            # entries still score above its lowest (or, at the lowest, did
+            # already) keeps the rest as is; either way merging is enough.
+            # Otherwise it is ranked again.
+            now = dict(gained.get(owner, ()))
+            lowest = floor[position]
+            if listed[position] < self.k or all(
+                    now.get(id, 0) > lowest or now.get(id, 0) == lowest == before
+                    for id, before in dropped):
+                continue
+            with self.lock:
+                score = pair_scores(*others.profile(position), owners)
+                owner_ids = owners.ids
+            lists[owner] = top(score, owner_ids, self.k)
+        merging = {owner for owner in gained.keys() | removed.keys() if owner not in lists}
+        if merging:
+            current = {}
+            for owner, matched_id, score in db.session.execute(text(
+                    'SELECT {owner}, {other}, score FROM "{table}" WHERE {owner} = ANY(:ids)'.format(
+                        table=other.table.__tablename__, owner=other.owner, other=other.other)),
+                    {'ids': list(merging)}):
+                # back to the float32 the scores were computed in, or ties
+                # with the newcomers would not compare equal
+                current.setdefault(owner, []).append((matched_id, float(np.float32(score))))
+            # only what changed is written: the newcomers that made the
+            # cut, and the entries they pushed out
+            stale, added = [], []
+            for owner in merging:
+                matched = current.get(owner, []) + gained.get(owner, [])
+                matched.sort(key=lambda match: (-match[1], match[0]))
+                lists[owner] = matched[:self.k]
+                newcomers = {id for id, score in gained.get(owner, ())}
+                added.extend((owner, id, score) for id, score in lists[owner] if id in newcomers)
+                stale.extend((owner, id) for id, score in matched[self.k:] if id not in newcomers)
+            self.discard(other, stale)
+            self.insert(other, added)
+        self.store(other, {owner: lists[owner] for owner in lists if owner not in merging})
+        db.session.commit()
+        with self.lock:
+            for owner, matched in lists.items():
+                others.listing(others.position[owner], matched)
+        return len(lists)
+
+    def profiles_changed(self, kind, ids):
+        """Queue a refresh() for the venues or artists `ids`, which a
+        committed write added, changed or deleted.
+        """
+        self.ensure_thread()
+        self.changes.put((kind, list(ids)))
+
+    def run_refresh(self, kind, ids):
+        """refresh(), with a failure logged rather than raised: the write
+        that called for it has already been committed.
+        """
+        try:
+            self.refresh(kind, ids)
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Match refresh failed for %s %s', kind, ids)
+
+    def wait(self):
+        """Block until every queued refresh has run."""
+        self.changes.join()
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                changes = [self.changes.get()]
+                # writes that queued up meanwhile share one refresh per side
+                while True:
+                    try:
+                        changes.append(self.changes.get_nowait())
+                    except queue.Empty:
+                        break
+                pending = {}
+                for kind, ids in changes:
+                    pending.setdefault(kind, set()).update(ids)
+                try:
+                    for kind, ids in pending.items():
+                        self.run_refresh(kind, sorted(ids))
+                finally:
+                    db.session.remove()
+                    for _ in changes:
+                        self.changes.task_done()
+
+    def ensure_thread(self):
+        # threads do not survive gunicorn's fork; start one per process
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
@@ -0,0 +1,143 @@
+import os
+import time
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db
+
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#----------------------------------------------------------------------------#
+
+# Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py): each
+# worker then writes its samples to memory-mapped files in that directory
+# and /metrics sums them, whichever worker serves the scrape.
+
+# the histogram's _count doubles as the request counter
+REQUEST_DURATION = Histogram(
+    'fyyur_request_duration_seconds', 'Time spent handling requests.',
+    ['endpoint', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+# the _count of this histogram is the number of statements run
+STATEMENT_DURATION = Histogram(
+    'fyyur_db_statement_duration_seconds', 'Time spent executing SQL statements.',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_pool_checked_out', 'Pooled connections in use.',
+    multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'fyyur_db_pool_overflow', 'Connections open beyond the pool size.',
+    multiprocess_mode='livesum')
+POOL_SIZE = Gauge(
+    'fyyur_db_pool_size', 'Configured pool size.',
+    multiprocess_mode='livesum')
+# hit ratio: rate(...{result="HIT"}) / sum(rate(fyyur_cache_lookups_total))
+CACHE_LOOKUPS = Counter(
+    'fyyur_cache_lookups_total', 'Page cache lookups by result.',
+    ['result'])
+CACHE_RESULTS = {result: CACHE_LOOKUPS.labels(result) for result in ('HIT', 'MISS')}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if started:
+        STATEMENT_DURATION.observe(time.perf_counter() - started.pop())
+
+
+def _pool_listeners(pool):
+    def checkout(*args):
+        POOL_CHECKED_OUT.set(pool.checkedout())
+        POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    def checkin(*args):
+        # runs before the connection is handed back; if every pooled slot
+        # is already idle it will be closed as overflow instead
+        overflow = pool.overflow()
+        if pool.checkedout() == overflow:
+            overflow -= 1
+        POOL_CHECKED_OUT.set(pool.checkedout() - 1)
+        POOL_OVERFLOW.set(max(overflow, 0))
+    return checkout, checkin
+
+
+def collect():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class Metrics:
+    """Records request, SQL, connection pool and page cache metrics and
+    serves them at METRICS_PATH in the Prometheus text format.
+
+    Recording stays off the hot path's slow parts: the start time rides in
+    the WSGI environ instead of flask.g, the request proxy is resolved
+    once, and labelled children are looked up in a plain dict. See
+    `flask bench-metrics` for the cost.
+    """
+
+    def __init__(self, app=None):
+        self.children = {}  # (endpoint, method, status) -> histogram
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['METRICS_ENABLED']:
+            return
+        # statements on every engine, replicas included; the pool gauges
+        # follow the primary's
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        with app.app_context():
+            pool = db.engine.pool
+        if hasattr(pool, 'overflow'):
+            checkout, checkin = _pool_listeners(pool)
+            POOL_SIZE.set(pool.size())
+            event.listen(pool, 'checkout', checkout)
+            event.listen(pool, 'checkin', checkin)
+        app.wsgi_app = self.timed(app.wsgi_app)
+        app.after_request(self.finish)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.view)
+
+    @staticmethod
+    def timed(wsgi_app):
+        def wrapper(environ, start_response):
+            environ['fyyur.started'] = time.perf_counter()
+            return wsgi_app(environ, start_response)
+        return wrapper
+
+    def finish(self, response):
+        req = request._get_current_object()
+        started = req.environ.get('fyyur.started')
+        if started is None:
+            return response
+        key = (req.endpoint, req.method, response.status_code)
+        histogram = self.children.get(key)
+        if histogram is None:
+            histogram = self.children[key] = REQUEST_DURATION.labels(
+                key[0] or 'none', key[1], key[2])
+        histogram.observe(time.perf_counter() - started)
+        cache = CACHE_RESULTS.get(response.headers.get('X-Cache'))
+        if cache is not None:
+            cache.inc()
+        return response
+
+    @staticmethod
+    def view():
+        return Response(collect(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,40 @@
+"""Index Show hot paths and Venue area
+
+Revision ID: 157dfaceb639
+Revises: 594a8844f0c5
+Create Date: 2026-10-18 02:04:29.168306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '157dfaceb639'
+down_revision = '594a8844f0c5'
+branch_labels = None
+depends_on = None
+
+
+# Built CONCURRENTLY so a populated Show table keeps taking writes while the
+# indexes build; that cannot run inside the migration transaction.
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id']),
+    ('ix_Venue_city_state', 'Venue', ['city', 'state']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
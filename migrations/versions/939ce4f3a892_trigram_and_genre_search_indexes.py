@@ -0,0 +1,46 @@
+"""Trigram and genre search indexes
+
+Revision ID: 939ce4f3a892
+Revises: 157dfaceb639
+Create Date: 2026-10-18 02:05:20.240917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '939ce4f3a892'
+down_revision = '157dfaceb639'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, column, operator class); GIN indexes, built CONCURRENTLY.
+INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name', 'gin_trgm_ops'),
+    ('ix_Venue_city_trgm', 'Venue', 'city', 'gin_trgm_ops'),
+    ('ix_Venue_state_trgm', 'Venue', 'state', 'gin_trgm_ops'),
+    ('ix_Venue_genres', 'Venue', 'genres', None),
+    ('ix_Artist_name_trgm', 'Artist', 'name', 'gin_trgm_ops'),
+    ('ix_Artist_city_trgm', 'Artist', 'city', 'gin_trgm_ops'),
+    ('ix_Artist_state_trgm', 'Artist', 'state', 'gin_trgm_ops'),
+    ('ix_Artist_genres', 'Artist', 'genres', None),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for name, table, column, ops in INDEXES:
+            op.create_index(name, table, [column], unique=False,
+                            postgresql_using='gin',
+                            postgresql_ops={column: ops} if ops else {},
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, column, ops in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
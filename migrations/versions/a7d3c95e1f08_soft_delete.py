@@ -0,0 +1,32 @@
+"""Soft delete for venues and artists
+
+Revision ID: a7d3c95e1f08
+Revises: f2b6d81c3e57
+Create Date: 2026-10-18 21:04:17.392816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c95e1f08'
+down_revision = 'f2b6d81c3e57'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_deleted_at'.format(table), table, ['deleted_at'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_{}_deleted_at'.format(table), table_name=table)
+        op.drop_column(table, 'deleted_at')
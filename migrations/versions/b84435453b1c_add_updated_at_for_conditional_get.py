@@ -0,0 +1,37 @@
+"""Add updated_at for conditional GET
+
+Revision ID: b84435453b1c
+Revises: 939ce4f3a892
+Create Date: 2026-10-18 02:09:06.315797
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b84435453b1c'
+down_revision = '939ce4f3a892'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("(now() at time zone 'utc')")))
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(op.f('ix_{}_updated_at'.format(table)), table,
+                            ['updated_at'], unique=False,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,124 @@
+"""Show counts per venue and artist
+
+Revision ID: c3f1a9d27e40
+Revises: b84435453b1c
+Create Date: 2026-10-18 14:02:51.480113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a9d27e40'
+down_revision = 'b84435453b1c'
+branch_labels = None
+depends_on = None
+
+
+SIDES = [('VenueStats', 'Venue', 'venue_id'), ('ArtistStats', 'Artist', 'artist_id')]
+
+# Statement-level, so a bulk insert or COPY updates each venue's and
+# artist's row once rather than once per show. Shows after rolled_at are
+# upcoming; the row lock keeps a rollover from moving the boundary while a
+# write is counting against it.
+APPLY = '''
+CREATE FUNCTION show_counts_apply() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    boundary timestamp;
+BEGIN
+    SELECT rolled_at INTO boundary FROM "StatsRollover" WHERE id = 1 FOR SHARE;
+    IF TG_OP <> 'INSERT' THEN
+{remove}
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+{add}
+    END IF;
+    RETURN NULL;
+END
+$$
+'''
+
+REMOVE = '''
+        UPDATE "{table}" s
+           SET upcoming_shows = s.upcoming_shows - c.upcoming,
+               past_shows = s.past_shows - c.past,
+               next_show_at = CASE WHEN c.first = s.next_show_at
+                   THEN (SELECT min(start_time) FROM "Show"
+                          WHERE {key} = s.{key} AND start_time > boundary)
+                   ELSE s.next_show_at END
+          FROM (SELECT {key},
+                       count(*) FILTER (WHERE start_time > boundary) AS upcoming,
+                       count(*) FILTER (WHERE start_time <= boundary) AS past,
+                       min(start_time) FILTER (WHERE start_time > boundary) AS first
+                  FROM old_rows GROUP BY {key}) c
+         WHERE s.{key} = c.{key};'''
+
+ADD = '''
+        INSERT INTO "{table}" AS s ({key}, upcoming_shows, past_shows, next_show_at)
+        SELECT {key},
+               count(*) FILTER (WHERE start_time > boundary),
+               count(*) FILTER (WHERE start_time <= boundary),
+               min(start_time) FILTER (WHERE start_time > boundary)
+          FROM new_rows GROUP BY {key}
+        ON CONFLICT ({key}) DO UPDATE
+           SET upcoming_shows = s.upcoming_shows + excluded.upcoming_shows,
+               past_shows = s.past_shows + excluded.past_shows,
+               next_show_at = least(s.next_show_at, excluded.next_show_at);'''
+
+BACKFILL = '''
+INSERT INTO "{table}" ({key}, upcoming_shows, past_shows, next_show_at)
+SELECT {key},
+       count(*) FILTER (WHERE start_time > r.rolled_at),
+       count(*) FILTER (WHERE start_time <= r.rolled_at),
+       min(start_time) FILTER (WHERE start_time > r.rolled_at)
+  FROM "Show", "StatsRollover" r
+ GROUP BY {key}
+'''
+
+TRIGGERS = [
+    ('show_counts_insert', 'INSERT', 'NEW TABLE AS new_rows'),
+    ('show_counts_update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('show_counts_delete', 'DELETE', 'OLD TABLE AS old_rows'),
+]
+
+
+def upgrade():
+    op.create_table('StatsRollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    for table, parent, key in SIDES:
+        op.create_table(table,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+        sa.Column('past_shows', sa.Integer(), nullable=False),
+        sa.Column('next_show_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint([key], [parent + '.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key)
+        )
+
+    # no show may be written between the backfill and the triggers
+    op.execute('LOCK TABLE "Show" IN SHARE MODE')
+    # rolled_at is UTC like start_time, whatever the server's timezone
+    op.execute('INSERT INTO "StatsRollover" (id, rolled_at) '
+               "VALUES (1, now() at time zone 'utc')")
+    for table, parent, key in SIDES:
+        op.execute(BACKFILL.format(table=table, key=key))
+    op.execute(APPLY.format(
+        remove='\n'.join(REMOVE.format(table=table, key=key) for table, _, key in SIDES),
+        add='\n'.join(ADD.format(table=table, key=key) for table, _, key in SIDES)))
+    for name, operation, referencing in TRIGGERS:
+        op.execute('CREATE TRIGGER {} AFTER {} ON "Show" REFERENCING {} '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION show_counts_apply()'.format(
+                       name, operation, referencing))
+
+
+def downgrade():
+    for name, _, _ in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER {} ON "Show"'.format(name))
+    op.execute('DROP FUNCTION show_counts_apply()')
+    for table, _, _ in reversed(SIDES):
+        op.drop_table(table)
+    op.drop_table('StatsRollover')
@@ -0,0 +1,49 @@
+"""Show slots and no double booking
+
+Revision ID: d7e2b5c8a914
+Revises: c3f1a9d27e40
+Create Date: 2026-10-18 15:41:07.215934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e2b5c8a914'
+down_revision = 'c3f1a9d27e40'
+branch_labels = None
+depends_on = None
+
+
+# shows at one venue less than a slot apart; the bounds let it walk
+# ix_Show_venue_id_start_time instead of pairing every show with every other
+OVERLAPS = '''
+SELECT a.venue_id, a.id, b.id
+  FROM "Show" a JOIN "Show" b
+    ON b.venue_id = a.venue_id
+   AND b.start_time >= a.start_time AND b.start_time < a.start_time + interval '3 hours'
+   AND (b.start_time, b.id) > (a.start_time, a.id)
+ LIMIT 20
+'''
+
+
+def upgrade():
+    # rewrites the table
+    op.add_column('Show', sa.Column(
+        'slot', postgresql.TSRANGE(),
+        sa.Computed("tsrange(start_time, start_time + interval '3 hours')"),
+        nullable=False))
+    overlaps = op.get_bind().execute(sa.text(OVERLAPS)).fetchall()
+    if overlaps:
+        raise RuntimeError(
+            'Double-booked venues; move or delete one show of each pair, then retry: ' +
+            ', '.join('venue {} shows {} and {}'.format(*row) for row in overlaps))
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_slot" EXCLUDE USING gist '
+               "(int4range(venue_id, venue_id, '[]') WITH &&, slot WITH &&)")
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_venue_slot', 'Show')
+    op.drop_column('Show', 'slot')
@@ -0,0 +1,64 @@
+"""Store show times as timestamptz
+
+Revision ID: e5a0c4f19b73
+Revises: d7e2b5c8a914
+Create Date: 2026-10-18 17:12:38.904126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a0c4f19b73'
+down_revision = 'd7e2b5c8a914'
+branch_labels = None
+depends_on = None
+
+
+# existing values were written as UTC
+COLUMNS = [
+    ('Show', 'start_time', False),
+    ('StatsRollover', 'rolled_at', False),
+    ('VenueStats', 'next_show_at', True),
+    ('ArtistStats', 'next_show_at', True),
+]
+
+# timestamptz + interval depends on the session's TimeZone, which a
+# generated column may not; the same sum in UTC does not
+SLOTS = {
+    False: "tsrange(start_time, start_time + interval '3 hours')",
+    True: "tstzrange(start_time, (start_time AT TIME ZONE 'UTC' + interval '3 hours') AT TIME ZONE 'UTC')",
+}
+
+# the show count triggers keep the rollover boundary in a variable
+BOUNDARY = '''
+DO $$ BEGIN
+    EXECUTE replace(pg_get_functiondef('show_counts_apply()'::regprocedure),
+                    'boundary {};', 'boundary {};');
+END $$
+'''
+
+
+def set_types(aware):
+    op.drop_constraint('ex_Show_venue_slot', 'Show')
+    op.drop_column('Show', 'slot')
+    for table, column, nullable in COLUMNS:
+        op.alter_column(table, column, type_=sa.DateTime(timezone=aware), nullable=nullable,
+                        postgresql_using="{} AT TIME ZONE 'UTC'".format(column))
+    op.execute(BOUNDARY.format(*(('timestamp', 'timestamptz') if aware else ('timestamptz', 'timestamp'))))
+    op.add_column('Show', sa.Column(
+        'slot', postgresql.TSTZRANGE() if aware else postgresql.TSRANGE(),
+        sa.Computed(SLOTS[aware]), nullable=False))
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_slot" EXCLUDE USING gist '
+               "(int4range(venue_id, venue_id, '[]') WITH &&, slot WITH &&)")
+
+
+def upgrade():
+    # rewrites the Show table
+    set_types(aware=True)
+
+
+def downgrade():
+    set_types(aware=False)
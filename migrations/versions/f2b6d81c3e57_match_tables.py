@@ -0,0 +1,41 @@
+"""Top venue and artist matches
+
+Revision ID: f2b6d81c3e57
+Revises: e5a0c4f19b73
+Create Date: 2026-10-18 18:12:40.531207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d81c3e57'
+down_revision = 'e5a0c4f19b73'
+branch_labels = None
+depends_on = None
+
+
+# (table, owner, owner table, other); filled by `flask matches-build`
+SIDES = [('ArtistMatch', 'artist_id', 'Artist', 'venue_id'),
+         ('VenueMatch', 'venue_id', 'Venue', 'artist_id')]
+
+
+def upgrade():
+    for table, owner, owner_table, other in SIDES:
+        op.create_table(
+            table,
+            sa.Column(owner, sa.Integer(), nullable=False),
+            sa.Column(other, sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(precision=24), nullable=False),
+            sa.ForeignKeyConstraint([owner], [owner_table + '.id'], ondelete='CASCADE',
+                                    name='{}_{}_fkey'.format(table, owner)),
+            sa.PrimaryKeyConstraint(owner, other)
+        )
+        op.create_index('ix_{}_{}'.format(table, other), table, [other], unique=False)
+
+
+def downgrade():
+    for table, owner, owner_table, other in reversed(SIDES):
+        op.drop_index('ix_{}_{}'.format(table, other), table_name=table)
+        op.drop_table(table)
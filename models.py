@@ -1,13 +1,40 @@
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, TSTZRANGE
+from sqlalchemy.orm import with_loader_criteria
+from routing import RoutingSession
 
 # TODO: connect to a local postgresql database
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
-class Venue(db.Model):
+class SoftDelete:
+    # set when the row is deleted; ORM queries leave it out from then on (see
+    # hide_deleted) and purge.py removes it, shows first, once it can no
+    # longer be restored
+    deleted_at = db.Column(db.DateTime)
+
+
+class Venue(SoftDelete, db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # /venues groups by area
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        # search: ILIKE '%term%' on name/city/state and genre containment
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_state_trgm', 'state', postgresql_using='gin',
+                 postgresql_ops={'state': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        # the purge job and the readers correcting show counts find the
+        # deleted rows here
+        db.Index('ix_Venue_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -21,11 +48,28 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='venue', lazy='joined', cascade="all, delete")
+    # bumped on every write that changes what the row's pages render; read
+    # routes derive their ETag / Last-Modified from it
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"))
+    # shows are removed in batches by the purge job, never through the ORM
+    shows = db.relationship('Show', backref='venue', passive_deletes='all')
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-class Artist(db.Model):
+class Artist(SoftDelete, db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # search: ILIKE '%term%' on name/city/state and genre containment
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_state_trgm', 'state', postgresql_using='gin',
+                 postgresql_ops={'state': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Artist_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -38,15 +82,141 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='artist', lazy='joined', cascade="all, delete")
+    # bumped on every write that changes what the row's pages render; read
+    # routes derive their ETag / Last-Modified from it
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"))
+    shows = db.relationship('Show', backref='artist', passive_deletes='all')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate /
 
+# How long a show holds its venue; a venue takes no two shows whose slots
+# overlap. Changing it needs a migration recreating Show.slot.
+SHOW_LENGTH = timedelta(hours=3)
+BOOKING_CONSTRAINT = 'ex_Show_venue_slot'
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration./
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # detail pages split a venue's/artist's shows on start_time
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows seeks on (start_time, id)
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # no double booking; int4range stands in for venue_id so plain GiST
+        # range operators do without the btree_gist extension
+        ExcludeConstraint(
+            (db.func.int4range(db.column('venue_id'), db.column('venue_id'), db.literal_column("'[]'")), '&&'),
+            ('slot', '&&'),
+            name=BOOKING_CONSTRAINT, using='gist'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    # [start_time, start_time + SHOW_LENGTH), added up in UTC to keep the
+    # expression immutable
+    slot = db.Column(TSTZRANGE, db.Computed(
+        "tstzrange(start_time, (start_time AT TIME ZONE 'UTC' + interval '3 hours') AT TIME ZONE 'UTC')"),
+        nullable=False)
+    # bumped on every write that changes what the row's pages render; read
+    # routes derive their ETag / Last-Modified from it
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"))
+
+
+# Show counts per venue and per artist, kept by triggers on "Show" (see the
+# show_counts migration) so every write path, COPY included, maintains
+# them. Shows starting after StatsRollover.rolled_at count as upcoming; the
+# rollover job (stats.py) moves the ones that have since started to past,
+# and readers correct for the shows that started since it last ran.
+class VenueStats(db.Model):
+    __tablename__ = 'VenueStats'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    past_shows = db.Column(db.Integer, nullable=False, default=0)
+    # first show after rolled_at, None when there is none
+    next_show_at = db.Column(db.DateTime(timezone=True))
+
+
+class ArtistStats(db.Model):
+    __tablename__ = 'ArtistStats'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    past_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show_at = db.Column(db.DateTime(timezone=True))
+
+
+class StatsRollover(db.Model):
+    __tablename__ = 'StatsRollover'
+
+    # a single row
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+# The best-matching venues for each artist and artists for each venue, at
+# most MATCH_TOP_K per row, maintained by matching.py. Only the owning side
+# has a foreign key: a deleted match is removed by the refresh that follows,
+# which needs to see which lists it was on; readers join it away until then.
+class ArtistMatch(db.Model):
+    __tablename__ = 'ArtistMatch'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE', name='ArtistMatch_artist_id_fkey'),
+                          primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True, index=True)
+    score = db.Column(db.Float(precision=24), nullable=False)
+
+
+class VenueMatch(db.Model):
+    __tablename__ = 'VenueMatch'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE', name='VenueMatch_venue_id_fkey'),
+                          primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True, index=True)
+    score = db.Column(db.Float(precision=24), nullable=False)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def hide_deleted(state):
+    """Leave soft-deleted venues and artists out of every ORM SELECT,
+    including relationship loads and joins along relationships (an explicit
+    join(Venue, onclause) is not covered). A statement executed with
+    include_deleted=True sees them.
+    """
+    if state.is_select and not state.execution_options.get('include_deleted', False):
+        state.statement = state.statement.options(with_loader_criteria(
+            SoftDelete, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
+
+
+def is_booking_conflict(error):
+    """Whether a failed write broke the no-double-booking constraint."""
+    diag = getattr(getattr(error, 'orig', None), 'diag', None)
+    return diag is not None and diag.constraint_name == BOOKING_CONSTRAINT
+
+
+def touch(model, *criterion):
+    """Bump updated_at on the `model` rows matching `criterion`; returns
+    how many there were.
+    """
+    return model.query.filter(*criterion).update(
+        {model.updated_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def init_statement_timeout(app):
+    """Behind PgBouncer's transaction pooling a session-level timeout would
+    leak to other clients, so set it per transaction with SET LOCAL.
+    """
+    timeout = app.config['DATABASE_STATEMENT_TIMEOUT']
+    if not (app.config['DATABASE_PGBOUNCER'] and timeout):
+        return
+
+    @event.listens_for(db.session, 'after_begin')
+    def set_statement_timeout(session, transaction, connection):
+        connection.exec_driver_sql('SET LOCAL statement_timeout = %d' % timeout)
@@ -0,0 +1,171 @@
+import json
+import random
+import time
+from collections import Counter
+from flask import g, has_app_context, request, render_template
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Request profiling.
+#----------------------------------------------------------------------------#
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []   # (seconds, statement, parameters)
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = None
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started
+
+    @property
+    def python_time(self):
+        return max(self.total_time - self.db_time - self.render_time, 0.0)
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda s: s[0], reverse=True)[:n]
+
+    def duplicates(self, threshold):
+        """Statements run at least `threshold` times with different
+        parameters: usually a query issued once per row of another (N+1).
+        """
+        counts = Counter(statement for _, statement, _ in self.statements)
+        return [(statement, n) for statement, n in counts.most_common() if n >= threshold]
+
+
+def current_profile():
+    if has_app_context():
+        return g.get('profile')
+    return None
+
+
+class TimedTemplate(Template):
+    """Adds the time spent rendering to the request's profile. Only the
+    outermost render is timed; includes and extends run inside it.
+    """
+
+    def render(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            profile.render_time += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('profile_started')
+    if profile is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    profile.db_time += elapsed
+    profile.statements.append((elapsed, statement, parameters))
+
+
+class Profiler:
+    """Times each sampled request's SQL statements, template rendering and
+    remaining Python work.
+
+    Results go out as a Server-Timing header and one JSON log line per
+    request; statements repeated PROFILING_DUPLICATE_THRESHOLD times or
+    more are logged as likely N+1 queries. With PROFILING_PANEL on, adding
+    ?_profile=1 to a page appends a panel with the details (always sampled).
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['PROFILING_ENABLED']
+        if not self.enabled:
+            return
+        self.sample_rate = app.config['PROFILING_SAMPLE_RATE']
+        self.slow_statements = app.config['PROFILING_SLOW_STATEMENTS']
+        self.duplicate_threshold = app.config['PROFILING_DUPLICATE_THRESHOLD']
+        self.panel = app.config['PROFILING_PANEL']
+        app.jinja_env.template_class = TimedTemplate
+        # every engine: the primary and any read replicas
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def wants_panel(self):
+        return self.panel and request.args.get('_profile') == '1'
+
+    def start(self):
+        if self.wants_panel() or random.random() < self.sample_rate:
+            g.profile = RequestProfile()
+
+    def finish(self, response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        if response.is_streamed:
+            # the page's queries and rendering run while the body is sent,
+            # after this hook; log once it was, rendering counted as app time
+            method, path, endpoint = request.method, request.full_path.rstrip('?'), request.endpoint
+            response.call_on_close(
+                lambda: self.log(profile, method, path, endpoint, response.status_code))
+            return response
+        g.pop('profile')
+        profile.finish()
+        response.headers['Server-Timing'] = ', '.join([
+            'db;dur={:.2f};desc="{} statements"'.format(profile.db_time * 1000, len(profile.statements)),
+            'render;dur={:.2f}'.format(profile.render_time * 1000),
+            'app;dur={:.2f}'.format(profile.python_time * 1000),
+            'total;dur={:.2f}'.format(profile.total_time * 1000),
+        ])
+        slowest, duplicates = self.log(profile, request.method, request.full_path.rstrip('?'),
+                                       request.endpoint, response.status_code)
+
+        if self.wants_panel() and response.mimetype == 'text/html' \
+                and not response.is_streamed and response.status_code == 200:
+            panel = render_template('pages/profile_panel.html', profile=profile,
+                                    slowest=slowest, duplicates=duplicates)
+            body = response.get_data(as_text=True)
+            at = body.rfind('</body>')
+            at = at if at != -1 else len(body)
+            response.set_data(body[:at] + panel + body[at:])
+        return response
+
+    def log(self, profile, method, path, endpoint, status):
+        if profile.total_time is None:
+            profile.finish()
+        duplicates = profile.duplicates(self.duplicate_threshold)
+        slowest = profile.slowest(self.slow_statements)
+        self.app.logger.info(json.dumps({
+            'event': 'request_profile',
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'total_ms': round(profile.total_time * 1000, 2),
+            'db_ms': round(profile.db_time * 1000, 2),
+            'render_ms': round(profile.render_time * 1000, 2),
+            'python_ms': round(profile.python_time * 1000, 2),
+            'statements': len(profile.statements),
+            'slowest': [{'ms': round(seconds * 1000, 2), 'statement': statement,
+                         'parameters': repr(parameters)[:200]}
+                        for seconds, statement, parameters in slowest],
+            'duplicates': [{'count': n, 'statement': statement} for statement, n in duplicates],
+        }))
+        for statement, n in duplicates:
+            self.app.logger.warning('Possible N+1 on %s: statement ran %d times: %s',
+                                    endpoint, n, statement)
+        return slowest, duplicates
@@ -0,0 +1,240 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import db, Artist, Venue, Show, touch
+
+#----------------------------------------------------------------------------#
+# Soft delete and purge.
+#----------------------------------------------------------------------------#
+
+# Deleting a venue or artist only sets its deleted_at: one row written, no
+# matter how many shows it has. From then on the ORM leaves it out of every
+# query (models.hide_deleted), its shows drop out of the listings with it,
+# and readers subtract them from the other side's show counts (see
+# queries._deleted_ids). For PURGE_RESTORE_WINDOW seconds it can be
+# restored as it was; after that purge() deletes its shows PURGE_BATCH_SIZE
+# at a time, committing and pausing between batches so no transaction holds
+# its locks for long, and then the row itself.
+
+# kind -> (model, its column on "Show", the other kind)
+KINDS = {
+    'venue': (Venue, 'venue_id', 'artist'),
+    'artist': (Artist, 'artist_id', 'venue'),
+}
+
+DELETE_BATCH = '''
+DELETE FROM "Show" WHERE id IN (
+    SELECT id FROM "Show" WHERE {key} = :id LIMIT :batch_size
+)
+'''
+
+# taken before each batch: skips a row another worker is purging, and one
+# restored since it was picked
+LOCK_ROW = '''
+SELECT id FROM "{table}" WHERE id = :id AND deleted_at <= :cutoff
+FOR UPDATE SKIP LOCKED
+'''
+
+
+def soft_delete(kind, id, now=None):
+    """Mark the venue or artist `id` deleted; False if there is no such
+    live row. The caller commits.
+    """
+    model = KINDS[kind][0]
+    now = now or datetime.utcnow()
+    return bool(model.query.filter(model.id == id, model.deleted_at.is_(None))
+                .update({model.deleted_at: now, model.updated_at: now}, synchronize_session=False))
+
+
+def restore(kind, id, window, now=None):
+    """Undo the deletion of the venue or artist `id` if it was made less
+    than `window` seconds ago; False otherwise. The caller commits.
+    """
+    model = KINDS[kind][0]
+    now = now or datetime.utcnow()
+    return bool(model.query.filter(
+        model.id == id, model.deleted_at > now - timedelta(seconds=window)
+    ).update({model.deleted_at: None, model.updated_at: now}, synchronize_session=False))
+
+
+def touch_related(kind, id, batch_size):
+    """Bump updated_at on the rows of the other kind that share shows with
+    the venue or artist `id`: their pages list or count those shows. Commits
+    every `batch_size` rows and returns their ids.
+    """
+    model, key, other = KINDS[kind]
+    other_model, other_key, _ = KINDS[other]
+    ids = [other_id for other_id, in db.session.query(getattr(Show, other_key))
+           .filter(getattr(Show, key) == id).distinct()]
+    for start in range(0, len(ids), batch_size):
+        touch(other_model, other_model.id.in_(ids[start:start + batch_size]))
+        db.session.commit()
+    return ids
+
+
+def pending(window, now=None):
+    """The deleted venues and artists not purged yet, oldest first, as dicts
+    with when each was deleted, when it becomes due and its shows left.
+    """
+    now = now or datetime.utcnow()
+    rows = []
+    for kind, (model, key, _) in KINDS.items():
+        shows = db.session.query(db.func.count(Show.id)) \
+            .filter(getattr(Show, key) == model.id).scalar_subquery()
+        for id, name, deleted_at, count in db.session.query(
+                model.id, model.name, model.deleted_at, shows) \
+                .filter(model.deleted_at.isnot(None)) \
+                .execution_options(include_deleted=True):
+            due = deleted_at + timedelta(seconds=window)
+            rows.append({
+                'kind': kind,
+                'id': id,
+                'name': name,
+                'deleted_at': deleted_at,
+                'due': due,
+                'restorable': due > now,
+                'shows': count,
+            })
+    db.session.rollback()
+    return sorted(rows, key=lambda row: row['deleted_at'])
+
+
+def purge_row(kind, id, cutoff, batch_size, pause):
+    """Delete the shows of one deleted venue or artist, a batch per
+    transaction, then the row. Returns the shows deleted, or None when the
+    row was left alone (restored, or being purged by another worker).
+    """
+    model, key, _ = KINDS[kind]
+    params = {'id': id, 'cutoff': cutoff, 'batch_size': batch_size}
+    removed = 0
+    while True:
+        if db.session.execute(text(LOCK_ROW.format(table=model.__tablename__)), params).scalar() is None:
+            db.session.rollback()
+            return None
+        deleted = db.session.execute(text(DELETE_BATCH.format(key=key)), params).rowcount
+        if not deleted:
+            # stats and matches go with it (ON DELETE CASCADE)
+            db.session.execute(text('DELETE FROM "{}" WHERE id = :id'.format(model.__tablename__)), params)
+            db.session.commit()
+            return removed
+        db.session.commit()
+        removed += deleted
+        time.sleep(pause)
+
+
+def purge(window, batch_size, pause, now=None):
+    """Remove the venues and artists deleted more than `window` seconds
+    ago, with their shows; returns {kind: [(id, shows deleted), ...]}.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=window)
+    purged = {}
+    for kind, (model, key, _) in KINDS.items():
+        ids = [id for id, in db.session.query(model.id)
+               .filter(model.deleted_at <= cutoff)
+               .order_by(model.deleted_at)
+               .execution_options(include_deleted=True)]
+        db.session.rollback()
+        purged[kind] = []
+        for id in ids:
+            removed = purge_row(kind, id, cutoff, batch_size, pause)
+            if removed is not None:
+                purged[kind].append((id, removed))
+    return purged
+
+
+class PurgeJob:
+    """Runs purge() every PURGE_INTERVAL seconds from a thread in each worker
+    process; 0 leaves it to `flask purge` (cron). The same thread takes the
+    venues and artists just deleted or restored off the request: it hands
+    each to `on_changed` (kind, id) for what else follows from it (match
+    lists), touches the rows it shares shows with, then hands their ids to
+    `on_touched` (kind, ids) for cache invalidation.
+    """
+
+    def __init__(self, app=None):
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.changes = queue.Queue()
+        self.on_changed = None
+        self.on_touched = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config['PURGE_RESTORE_WINDOW']
+        self.interval = app.config['PURGE_INTERVAL']
+        self.batch_size = app.config['PURGE_BATCH_SIZE']
+        self.pause = app.config['PURGE_BATCH_PAUSE']
+        app.before_request(self.ensure_thread)
+
+    def changed(self, kind, id):
+        """Queue touching what the deleted or restored row shared shows with."""
+        self.ensure_thread()
+        self.changes.put((kind, id))
+
+    def wait(self):
+        """Block until every queued change has been seen to."""
+        self.changes.join()
+
+    def touch(self, kind, id):
+        if self.on_changed is not None:
+            self.on_changed(kind, id)
+        try:
+            ids = touch_related(kind, id, self.batch_size)
+            if self.on_touched is not None:
+                self.on_touched(KINDS[kind][2], ids)
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Touching the rows related to %s %s failed', kind, id)
+
+    def purge_now(self):
+        return purge(self.window, self.batch_size, self.pause)
+
+    def run_purge(self):
+        try:
+            self.purge_now()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Purge failed')
+
+    def run(self):
+        with self.app.app_context():
+            due = time.monotonic() + self.interval
+            while True:
+                timeout = max(due - time.monotonic(), 0) if self.interval else None
+                try:
+                    change = self.changes.get(timeout=timeout)
+                except queue.Empty:
+                    change = None
+                    due = time.monotonic() + self.interval
+                try:
+                    if change is None:
+                        self.run_purge()
+                    else:
+                        self.touch(*change)
+                except Exception:
+                    # keep the thread alive: wait() joins on every change
+                    db.session.rollback()
+                    self.app.logger.exception('Handling %s failed', change or 'purge')
+                finally:
+                    db.session.remove()
+                    if change is not None:
+                        self.changes.task_done()
+
+    def running(self):
+        return self.thread is not None and self.pid == os.getpid() and self.thread.is_alive()
+
+    def ensure_thread(self):
+        # threads do not survive gunicorn's fork; start one per process
+        if self.running():
+            return
+        with self.lock:
+            if not self.running():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
@@ -0,0 +1,322 @@
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime
+from sqlalchemy import func, select, tuple_
+from models import db, Artist, Venue, Show, VenueStats, ArtistStats, StatsRollover, SHOW_LENGTH
+from readmodels import (
+    VENUE_COLUMNS, ARTIST_COLUMNS, Item, VenueItem, Area, ShowItem, VenueShow, ArtistShow,
+    venue_record, artist_record, interned
+)
+
+#----------------------------------------------------------------------------#
+# Read queries.
+#----------------------------------------------------------------------------#
+
+def _started_since_rollover(now):
+    """Filter for the shows counted as upcoming in the stats tables that
+    have started by `now` (see stats.py).
+    """
+    rolled_at = db.session.query(StatsRollover.rolled_at).scalar_subquery()
+    return (Show.start_time > rolled_at) & (Show.start_time <= now)
+
+
+def _deleted_ids(model):
+    """Ids of `model`'s soft-deleted rows. Their shows stay (and stay
+    counted in the stats tables) until the purge job removes them, but are
+    no longer listed, so readers subtract them. Selected from the table
+    rather than the model so models.hide_deleted leaves them in.
+    """
+    table = model.__table__
+    return select(table.c.id).where(table.c.deleted_at.isnot(None))
+
+
+def venue_areas(now, yield_per=None):
+    """Venues grouped by (city, state) with their upcoming show counts.
+
+    A single statement reading the counts from VenueStats; rows come back
+    ordered by area so they can be grouped in one pass. With `yield_per`,
+    rows are fetched that many at a time from a server-side cursor and the
+    areas, and the venues in each, are iterators to walk once, in order.
+    """
+    started = db.session.query(Show.venue_id, func.count(Show.id).label('count')) \
+        .filter(_started_since_rollover(now)) \
+        .group_by(Show.venue_id) \
+        .subquery()
+    hidden = db.session.query(Show.venue_id, func.count(Show.id).label('count')) \
+        .filter(Show.artist_id.in_(_deleted_ids(Artist)), Show.start_time > now) \
+        .group_by(Show.venue_id) \
+        .subquery()
+    num_upcoming_shows = func.coalesce(VenueStats.upcoming_shows, 0) \
+        - func.coalesce(started.c.count, 0) - func.coalesce(hidden.c.count, 0)
+    query = db.session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        num_upcoming_shows.label('num_upcoming_shows')
+    ).outerjoin(VenueStats, VenueStats.venue_id == Venue.id) \
+     .outerjoin(started, started.c.venue_id == Venue.id) \
+     .outerjoin(hidden, hidden.c.venue_id == Venue.id) \
+     .order_by(Venue.city, Venue.state, Venue.id)
+    if yield_per:
+        return _areas(query.yield_per(yield_per), list_venues=False)
+    return list(_areas(query.all()))
+
+
+def _areas(rows, list_venues=True):
+    for (city, state), venues in groupby(rows, key=itemgetter(0, 1)):
+        venues = (VenueItem._make(row[2:]) for row in venues)
+        yield Area(city, interned(state), list(venues) if list_venues else venues)
+
+
+def venue_profile(venue_id):
+    """The venue's columns as a VenueRecord, or None."""
+    row = db.session.query(*[getattr(Venue, name) for name in VENUE_COLUMNS]) \
+        .filter(Venue.id == venue_id).one_or_none()
+    return row and venue_record(row)
+
+
+def artist_profile(artist_id):
+    """The artist's columns as an ArtistRecord, or None."""
+    row = db.session.query(*[getattr(Artist, name) for name in ARTIST_COLUMNS]) \
+        .filter(Artist.id == artist_id).one_or_none()
+    return row and artist_record(row)
+
+
+def artist_list(yield_per=None):
+    """Every artist's id and name, by id; an iterator over a server-side
+    cursor with `yield_per`.
+    """
+    query = db.session.query(Artist.id, Artist.name).order_by(Artist.id)
+    if yield_per:
+        return (Item._make(row) for row in query.yield_per(yield_per))
+    return [Item._make(row) for row in query]
+
+
+def encode_cursor(start_time, show_id):
+    return '{}_{}'.format(start_time.isoformat(), show_id)
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    start_time, _, show_id = cursor.rpartition('_')
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+def show_listing(limit, after=None, before=None):
+    """One page of the /shows listing, newest first.
+
+    Seeks on (start_time, id) instead of using OFFSET, so every page costs
+    the same no matter how deep it is. `after` continues towards older
+    shows, `before` walks back towards newer ones. Returns the page along
+    with the cursors for the previous and next pages (None at either end).
+    """
+    key = tuple_(Show.start_time, Show.id)
+    query = db.session.query(
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time,
+        Show.id
+    ).join(Show.venue) \
+     .join(Show.artist)
+
+    if before is not None:
+        rows = query.filter(key > tuple_(*decode_cursor(before))) \
+            .order_by(Show.start_time, Show.id) \
+            .limit(limit + 1).all()
+        has_newer, has_older = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        if after is not None:
+            query = query.filter(key < tuple_(*decode_cursor(after)))
+        rows = query.order_by(Show.start_time.desc(), Show.id.desc()) \
+            .limit(limit + 1).all()
+        has_newer, has_older = after is not None, len(rows) > limit
+        rows = rows[:limit]
+
+    shows = [ShowItem._make(row[:6]) for row in rows]
+
+    prev_cursor = next_cursor = None
+    if rows and has_newer:
+        prev_cursor = encode_cursor(rows[0].start_time, rows[0].id)
+    if rows and has_older:
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return shows, prev_cursor, next_cursor
+
+
+def _show_page(query, now, upcoming, limit, after=None):
+    """Bound `query` to one side of `now` and seek one page past `after`.
+
+    Upcoming shows run soonest first, past shows most recent first.
+    """
+    key = tuple_(Show.start_time, Show.id)
+    if upcoming:
+        query = query.filter(Show.start_time > now) \
+            .order_by(Show.start_time, Show.id)
+        if after is not None:
+            query = query.filter(key > tuple_(*decode_cursor(after)))
+    else:
+        query = query.filter(Show.start_time <= now) \
+            .order_by(Show.start_time.desc(), Show.id.desc())
+        if after is not None:
+            query = query.filter(key < tuple_(*decode_cursor(after)))
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return rows, next_cursor
+
+
+def venue_shows(venue_id, now, upcoming, limit, after=None):
+    """A page of a venue's upcoming or past shows and the cursor to the next."""
+    query = db.session.query(
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time,
+        Show.id
+    ).join(Show.artist) \
+     .filter(Show.venue_id == venue_id)
+    rows, next_cursor = _show_page(query, now, upcoming, limit, after)
+    return [VenueShow._make(row[:4]) for row in rows], next_cursor
+
+
+def artist_shows(artist_id, now, upcoming, limit, after=None):
+    """A page of an artist's upcoming or past shows and the cursor to the next."""
+    query = db.session.query(
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time,
+        Show.id
+    ).join(Show.venue) \
+     .filter(Show.artist_id == artist_id)
+    rows, next_cursor = _show_page(query, now, upcoming, limit, after)
+    return [ArtistShow._make(row[:4]) for row in rows], next_cursor
+
+
+def _hidden(column, value, other_column, other, *criterion):
+    return db.session.query(func.count(Show.id)) \
+        .filter(column == value, other_column.in_(_deleted_ids(other)), *criterion) \
+        .scalar_subquery()
+
+
+def _stats(model, key, column, value, other_column, other, now):
+    started = db.session.query(func.count(Show.id)) \
+        .filter(column == value, _started_since_rollover(now)) \
+        .scalar_subquery()
+    upcoming, past, next_show_at, started, hidden_upcoming, hidden_past = db.session.query(
+        model.upcoming_shows,
+        model.past_shows,
+        model.next_show_at,
+        started,
+        _hidden(column, value, other_column, other, Show.start_time > now),
+        _hidden(column, value, other_column, other, Show.start_time <= now)
+    ).select_from(StatsRollover) \
+     .outerjoin(model, key == value) \
+     .one()
+    if started:
+        next_show_at = next_show_start(now, column, value)
+    return ((upcoming or 0) - started - hidden_upcoming,
+            (past or 0) + started - hidden_past, next_show_at)
+
+
+def venue_stats(venue_id, now):
+    """(upcoming count, past count, next show start) for a venue."""
+    return _stats(VenueStats, VenueStats.venue_id, Show.venue_id, venue_id,
+                  Show.artist_id, Artist, now)
+
+
+def artist_stats(artist_id, now):
+    """(upcoming count, past count, next show start) for an artist."""
+    return _stats(ArtistStats, ArtistStats.artist_id, Show.artist_id, artist_id,
+                  Show.venue_id, Venue, now)
+
+
+def overlapping(start, end):
+    """Criteria for the shows taking up any of [start, end).
+
+    Every slot is SHOW_LENGTH long, so overlapping the window is the same
+    as starting in (start - SHOW_LENGTH, end): a range the start_time,
+    (venue_id, start_time) and (artist_id, start_time) indexes seek to.
+    """
+    return (Show.start_time > start - SHOW_LENGTH) & (Show.start_time < end)
+
+
+def booking_conflicts(venue_id, start_time):
+    """Ids of the shows at the venue that a show at `start_time` would overlap.
+
+    Shows of a deleted artist are included: they keep their slots until
+    purged, so restoring the artist never runs into a double booking.
+    """
+    return [id for id, in db.session.query(Show.id).filter(
+        Show.venue_id == venue_id,
+        overlapping(start_time, start_time + SHOW_LENGTH)
+    ).order_by(Show.start_time)]
+
+
+def next_show_start(now, column=None, value=None):
+    """Start time of the next upcoming show (where `column == value`, if given)."""
+    query = db.session.query(func.min(Show.start_time)).filter(Show.start_time > now)
+    if column is not None:
+        query = query.filter(column == value)
+    return query.scalar()
+
+
+#----------------------------------------------------------------------------#
+# Validators for conditional GET.
+#----------------------------------------------------------------------------#
+
+# Each returns a tuple that changes whenever the page it guards would
+# render differently, in one cheap statement; its first item is used as
+# Last-Modified. Writes keep updated_at current on the rows a page shows
+# (see models.touch), and the next show start covers shows moving from
+# upcoming to past.
+
+def _next_start(now, column=None, value=None):
+    query = db.session.query(func.min(Show.start_time)).filter(Show.start_time > now)
+    if column is not None:
+        query = query.filter(column == value)
+    return query.scalar_subquery()
+
+
+def venue_version(venue_id, now):
+    return db.session.query(
+        Venue.updated_at,
+        _next_start(now, Show.venue_id, venue_id)
+    ).filter(Venue.id == venue_id).one_or_none()
+
+
+def artist_version(artist_id, now):
+    return db.session.query(
+        Artist.updated_at,
+        _next_start(now, Show.artist_id, artist_id)
+    ).filter(Artist.id == artist_id).one_or_none()
+
+
+def venues_version(now):
+    return db.session.query(
+        db.session.query(func.max(Venue.updated_at)).scalar_subquery(),
+        db.session.query(func.count(Venue.id)).scalar_subquery(),
+        _next_start(now)
+    ).one()
+
+
+def artists_version():
+    return db.session.query(
+        func.max(Artist.updated_at),
+        func.count(Artist.id)
+    ).one()
+
+
+def shows_version():
+    return db.session.query(
+        db.session.query(func.max(Show.updated_at)).scalar_subquery(),
+        db.session.query(func.max(Venue.updated_at)).scalar_subquery(),
+        db.session.query(func.max(Artist.updated_at)).scalar_subquery()
+    ).one()
@@ -0,0 +1,57 @@
+import sys
+from collections import namedtuple
+from enums import Genre, State
+
+#----------------------------------------------------------------------------#
+# Read models.
+#----------------------------------------------------------------------------#
+
+# What the read-only pages render, built from column projections rather
+# than ORM instances: no identity map entry, no attribute instrumentation,
+# and a named tuple holds its fields in a few bytes each where a dict per
+# row keeps a hash table. Templates read them by attribute, as they did
+# the ORM objects and dicts.
+
+VENUE_COLUMNS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+                 'facebook_link', 'seeking_talent', 'seeking_description', 'image_link')
+ARTIST_COLUMNS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website',
+                  'facebook_link', 'seeking_venue', 'seeking_description', 'image_link')
+# added to a venue or artist for its page
+SHOW_SECTIONS = ('upcoming_shows', 'past_shows', 'upcoming_shows_count', 'past_shows_count',
+                 'upcoming_shows_more', 'past_shows_more')
+
+Item = namedtuple('Item', 'id name')
+VenueItem = namedtuple('VenueItem', 'id name num_upcoming_shows')
+Area = namedtuple('Area', 'city state venues')
+
+VenueRecord = namedtuple('VenueRecord', VENUE_COLUMNS)
+ArtistRecord = namedtuple('ArtistRecord', ARTIST_COLUMNS)
+VenuePage = namedtuple('VenuePage', VENUE_COLUMNS + SHOW_SECTIONS)
+ArtistPage = namedtuple('ArtistPage', ARTIST_COLUMNS + SHOW_SECTIONS)
+
+ShowItem = namedtuple('ShowItem', 'venue_id venue_name artist_id artist_name artist_image_link start_time')
+# a venue's show tiles name the artist, an artist's the venue
+VenueShow = namedtuple('VenueShow', 'artist_id artist_name artist_image_link start_time')
+ArtistShow = namedtuple('ArtistShow', 'venue_id venue_name venue_image_link start_time')
+
+# every row shares one string per genre and state instead of the copy the
+# driver decoded for it
+INTERNED = {value: sys.intern(value) for member in (*Genre, *State)
+            for value in (member.name, member.value) if isinstance(value, str)}
+
+
+def interned(value):
+    return INTERNED.get(value, value)
+
+
+def _record(cls, genres, state):
+    def make(row):
+        values = list(row)
+        values[genres] = tuple([INTERNED.get(genre, genre) for genre in values[genres] or ()])
+        values[state] = INTERNED.get(values[state], values[state])
+        return cls._make(values)
+    return make
+
+
+venue_record = _record(VenueRecord, VENUE_COLUMNS.index('genres'), VENUE_COLUMNS.index('state'))
+artist_record = _record(ArtistRecord, ARTIST_COLUMNS.index('genres'), ARTIST_COLUMNS.index('state'))
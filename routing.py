@@ -0,0 +1,73 @@
+import random
+import time
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.sql.dml import UpdateBase
+from config import options_for
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#----------------------------------------------------------------------------#
+
+READ_METHODS = ('GET', 'HEAD')
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def current_replica():
+    if has_app_context():
+        return g.get('replica')
+    return None
+
+
+class RoutingSession(Session):
+    """Sends the queries of a replica-routed request to its replica.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary,
+    as does everything outside a request (CLI commands, background jobs).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            replica = current_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Routes GET and HEAD requests to a randomly picked replica from
+    SQLALCHEMY_REPLICA_URIS.
+
+    Read-your-writes: a request that may have written (POST, PUT, PATCH,
+    DELETE) pins its client to the primary for REPLICA_STICKY_SECONDS,
+    through a timestamp in the signed session cookie, so the redirect after
+    a form post shows what was just saved. Pinned requests also skip the page
+    cache, which another client may have refilled from a lagging replica;
+    set CACHE_REINVALIDATE_AFTER to clear such pages for everyone.
+    """
+
+    def __init__(self, app=None):
+        self.engines = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self.engines = [create_engine(uri, **options_for(uri, app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+                        for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+        if self.engines:
+            app.before_request(self.start)
+            app.after_request(self.finish)
+
+    def start(self):
+        if session.get('primary_until', 0) > time.time():
+            g.sticky_primary = True
+        elif request.method in READ_METHODS:
+            g.replica = random.choice(self.engines)
+
+    def finish(self, response):
+        if request.method in WRITE_METHODS and response.status_code < 500:
+            session['primary_until'] = time.time() + self.sticky_seconds
+        return response
+
@@ -0,0 +1,77 @@
+from sqlalchemy import and_, cast, func, or_
+from sqlalchemy.dialects.postgresql import array
+from models import db
+from enums import Genre
+from readmodels import Item
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# forms store the enum name, the seed data the display value; accept either
+# and match both: genre -> every spelling of it
+SPELLINGS = {name: tuple(sorted(set(choice))) for choice in Genre.choices() for name in choice}
+GENRES = frozenset(SPELLINGS)
+
+
+def like_pattern(term):
+    """Case-insensitive partial match pattern with LIKE wildcards escaped."""
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%{}%'.format(term)
+
+
+def search(model, term, page, per_page, genres=()):
+    """A ranked page of `model` rows matching `term` on name, city or state.
+
+    Matching keeps the ILIKE '%term%' semantics; the pg_trgm GIN indexes on
+    those columns let PostgreSQL answer it without a sequential scan. Rows
+    are ranked by their best trigram similarity to the term. `genres`
+    restricts results to rows carrying every listed genre in either
+    spelling, answered from the GIN index on the genres array. Returns
+    (total matches, page of Items).
+    """
+    term = (term or '').strip()
+    pattern = like_pattern(term)
+    query = db.session.query(model.id, model.name).filter(or_(
+        model.name.ilike(pattern),
+        model.city.ilike(pattern),
+        model.state.ilike(pattern)
+    ))
+    if genres:
+        query = query.filter(genre_match(model.genres, genres))
+
+    count = query.count()
+    rank = func.greatest(
+        func.similarity(model.name, term),
+        func.similarity(model.city, term),
+        func.similarity(model.state, term)
+    )
+    rows = query.order_by(rank.desc(), model.name, model.id) \
+        .offset((page - 1) * per_page) \
+        .limit(per_page)
+    return count, [Item._make(row) for row in rows]
+
+
+def genre_match(column, genres):
+    """Rows whose `column` array holds each of `genres` in some spelling.
+
+    Genres spelt one way go into a single @> containment; each one with two
+    spellings becomes an && overlap with both. The GIN index answers both
+    operators.
+    """
+    plain, overlaps = set(), set()
+    for genre in genres:
+        spellings = SPELLINGS.get(genre, (genre,))
+        if len(spellings) == 1:
+            plain.add(genre)
+        else:
+            overlaps.add(spellings)
+    clauses = [column.op('&&')(cast(array(spellings), column.type)) for spellings in sorted(overlaps)]
+    if plain:
+        clauses.append(column.op('@>')(cast(array(sorted(plain)), column.type)))
+    return and_(*clauses)
+
+
+def genre_filter(values):
+    """The genres in `values` that are valid `Genre` names or values."""
+    return [value for value in values if value in GENRES]
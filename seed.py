@@ -0,0 +1,173 @@
+import random
+from datetime import timedelta
+from sqlalchemy import text
+from models import db, Artist, Venue, Show
+from dates import utcnow
+from enums import Genre
+from importer import copy_rows
+from stats import rollover
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# (city, state, weight): a few large markets and a long tail, so /venues has
+# some big areas and many small ones.
+CITIES = [
+    ('New York', 'NY', 30), ('Los Angeles', 'CA', 25), ('Chicago', 'IL', 15),
+    ('San Francisco', 'CA', 12), ('Austin', 'TX', 10), ('Nashville', 'TN', 10),
+    ('Seattle', 'WA', 8), ('New Orleans', 'LA', 8), ('Atlanta', 'GA', 6),
+    ('Denver', 'CO', 6), ('Boston', 'MA', 6), ('Portland', 'OR', 5),
+    ('Detroit', 'MI', 4), ('Philadelphia', 'PA', 4), ('Miami', 'FL', 4),
+    ('Minneapolis', 'MN', 3), ('Kansas City', 'MO', 3), ('Memphis', 'TN', 3),
+    ('Salt Lake City', 'UT', 2), ('Albuquerque', 'NM', 2), ('Burlington', 'VT', 1),
+    ('Boise', 'ID', 1), ('Fargo', 'ND', 1), ('Anchorage', 'AK', 1),
+]
+
+# popular genres come up more often
+GENRE_WEIGHTS = {
+    Genre.RocknRoll: 10, Genre.Pop: 9, Genre.HipHop: 8, Genre.Jazz: 6,
+    Genre.Electronic: 6, Genre.Alternative: 5, Genre.Country: 5, Genre.RnB: 5,
+    Genre.Blues: 4, Genre.Folk: 4, Genre.Punk: 3, Genre.Soul: 3, Genre.Funk: 3,
+    Genre.HeavyMetal: 3, Genre.Classical: 2, Genre.Reggae: 2,
+    Genre.Instrumental: 1, Genre.MusicalTheatre: 1, Genre.Other: 1,
+}
+
+# show start hours; shows last 3 hours, so a venue fits up to four a day
+SHOW_HOURS = (12, 15, 18, 19, 20, 21)
+
+VENUE_WORDS = ['Hall', 'Lounge', 'Club', 'Room', 'Theatre', 'Tavern', 'Bar', 'Stage', 'Garden']
+ARTIST_WORDS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Project', 'Quartet', 'Ensemble']
+ADJECTIVES = ['Blue', 'Wild', 'Golden', 'Electric', 'Velvet', 'Midnight', 'Rusty',
+              'Silver', 'Crimson', 'Lucky', 'Quiet', 'Neon', 'Broken', 'Little']
+NOUNS = ['Moon', 'River', 'Fox', 'Owl', 'Harbor', 'Engine', 'Lantern', 'Pine',
+         'Sparrow', 'Anchor', 'Comet', 'Crow', 'Mill', 'Canyon']
+
+
+class Generator:
+    """Deterministic fake venues, artists and shows: the same seed always
+    produces the same rows.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.cities = [(city, state) for city, state, _ in CITIES]
+        self.city_weights = [weight for _, _, weight in CITIES]
+        self.genres = [genre.value for genre in GENRE_WEIGHTS]
+        self.genre_weights = list(GENRE_WEIGHTS.values())
+        # (venue_id, day, hour) of each show generated
+        self.booked = set()
+
+    def name(self, words, n):
+        r = self.random
+        return '{} {} {} {}'.format(r.choice(ADJECTIVES), r.choice(NOUNS), r.choice(words), n)
+
+    def pick_genres(self):
+        k = self.random.choice((1, 1, 2, 2, 3, 4))
+        return sorted(set(self.random.choices(self.genres, self.genre_weights, k=k)))
+
+    def phone(self):
+        r = self.random
+        return '{}-{}-{}'.format(r.randint(200, 999), r.randint(200, 999), r.randint(1000, 9999))
+
+    def venue(self, n):
+        city, state = self.random.choices(self.cities, self.city_weights)[0]
+        seeking = self.random.random() < 0.3
+        return {
+            'name': self.name(VENUE_WORDS, n),
+            'genres': self.pick_genres(),
+            'address': '{} {} St'.format(self.random.randint(1, 9999), self.random.choice(NOUNS)),
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'website': 'https://venue{}.example.com'.format(n),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(n),
+            'seeking_talent': seeking,
+            'seeking_description': 'Looking for local acts.' if seeking else None,
+            'image_link': 'https://picsum.photos/seed/venue{}/400/300'.format(n),
+        }
+
+    def artist(self, n):
+        city, state = self.random.choices(self.cities, self.city_weights)[0]
+        seeking = self.random.random() < 0.3
+        return {
+            'name': self.name(ARTIST_WORDS, n),
+            'genres': self.pick_genres(),
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'website': 'https://artist{}.example.com'.format(n),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(n),
+            'seeking_venue': seeking,
+            'seeking_description': 'Looking for a residency.' if seeking else None,
+            'image_link': 'https://picsum.photos/seed/artist{}/400/300'.format(n),
+        }
+
+    def show(self, venue_ids, artist_ids, now):
+        # three quarters of the history is in the past; a few venues and
+        # artists get most of the bookings. No venue is double booked (see
+        # SHOW_LENGTH): once the busiest ones fill up their shows spill over
+        # to others.
+        r = self.random
+        for attempt in range(100):
+            if attempt < 3 and r.random() < 0.3:
+                venue_id = venue_ids[min(int(r.paretovariate(1.2)) - 1, len(venue_ids) - 1)]
+            else:
+                venue_id = venue_ids[r.randrange(len(venue_ids))]
+            day, hour = r.randint(-3 * 365, 365), r.choice(SHOW_HOURS)
+            if not any((venue_id, day, h) in self.booked for h in range(hour - 2, hour + 3)):
+                break
+        else:
+            raise ValueError('Too many shows for {} venues'.format(len(venue_ids)))
+        self.booked.add((venue_id, day, hour))
+        return {
+            'venue_id': venue_id,
+            'artist_id': artist_ids[min(int(r.paretovariate(1.2)) - 1, len(artist_ids) - 1)
+                                    if r.random() < 0.3 else r.randrange(len(artist_ids))],
+            'start_time': now.replace(hour=0, minute=0, second=0, microsecond=0)
+                          + timedelta(days=day, hours=hour),
+        }
+
+
+def truncate():
+    db.session.execute(text('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY CASCADE'))
+    db.session.commit()
+
+
+def load(model, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            copy_rows(model, batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        copy_rows(model, batch)
+        db.session.commit()
+
+
+def seed(venues, artists, shows, seed=0, batch_size=5000, now=None):
+    """Add `venues`, `artists` and `shows` generated rows to the database.
+
+    Rows are written with COPY in batches, so a million shows take seconds
+    rather than minutes. Shows only reference venues and artists created by
+    this run.
+    """
+    generator = Generator(seed)
+    now = now or utcnow()
+    first_venue = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+    first_artist = (db.session.query(db.func.max(Artist.id)).scalar() or 0) + 1
+    load(Venue, (generator.venue(first_venue + i) for i in range(venues)), batch_size)
+    load(Artist, (generator.artist(first_artist + i) for i in range(artists)), batch_size)
+    if shows and venues and artists:
+        venue_ids = [id for id, in db.session.query(Venue.id)
+                     .filter(Venue.id >= first_venue).order_by(Venue.id)]
+        artist_ids = [id for id, in db.session.query(Artist.id)
+                      .filter(Artist.id >= first_artist).order_by(Artist.id)]
+        load(Show, (generator.show(venue_ids, artist_ids, now) for _ in range(shows)), batch_size)
+    # the generated past shows would otherwise all count as just started
+    rollover()
+    db.session.execute(text('ANALYZE "Venue"; ANALYZE "Artist"; ANALYZE "Show"; '
+                            'ANALYZE "VenueStats"; ANALYZE "ArtistStats"'))
+    db.session.commit()
@@ -2,3 +2,41 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// "Load more" buttons on the venue and artist pages replace themselves with
+// the next page of show tiles (which carries its own button if there is more).
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('[data-load-more]');
+  if (!button) {
+    return;
+  }
+  event.preventDefault();
+  button.disabled = true;
+  fetch(button.getAttribute('data-load-more'))
+    .then(function (response) { return response.text(); })
+    .then(function (html) { button.parentNode.outerHTML = html; });
+});
+
+// Navbar search boxes suggest matching names from /typeahead as you type.
+document.addEventListener('input', function (event) {
+  var input = event.target;
+  var kind = input.getAttribute && input.getAttribute('data-typeahead');
+  if (!kind) {
+    return;
+  }
+  var list = document.getElementById(input.getAttribute('list'));
+  var query = input.value;
+  fetch('/typeahead?kind=' + kind + '&q=' + encodeURIComponent(query))
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      if (input.value !== query) {
+        return;
+      }
+      list.innerHTML = '';
+      data.results.forEach(function (result) {
+        var option = document.createElement('option');
+        option.value = result.name;
+        list.appendChild(option);
+      });
+    });
+});
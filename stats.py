@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from dates import utcnow
+from sqlalchemy import text
+from models import db
+
+#----------------------------------------------------------------------------#
+# Show count maintenance.
+#----------------------------------------------------------------------------#
+
+# The triggers on "Show" keep VenueStats and ArtistStats current on every
+# write; what changes without a write is time. rollover() moves the shows
+# that have started since StatsRollover.rolled_at from upcoming to past.
+# Pages stay exact between rollovers (see queries.venue_stats): they
+# subtract the shows in that window, which the rollover keeps short.
+
+SIDES = (('venue', 'VenueStats', 'venue_id'), ('artist', 'ArtistStats', 'artist_id'))
+
+ROLLOVER = '''
+UPDATE "{table}" s
+   SET upcoming_shows = s.upcoming_shows - m.started,
+       past_shows = s.past_shows + m.started,
+       next_show_at = (SELECT min(start_time) FROM "Show"
+                        WHERE {key} = s.{key} AND start_time > :now)
+  FROM (SELECT {key}, count(*) AS started FROM "Show"
+         WHERE start_time > :since AND start_time <= :now
+         GROUP BY {key}) m
+ WHERE s.{key} = m.{key}
+RETURNING m.started
+'''
+
+DRIFT = '''
+WITH expected AS (
+    SELECT {key},
+           count(*) FILTER (WHERE start_time > r.rolled_at) AS upcoming_shows,
+           count(*) FILTER (WHERE start_time <= r.rolled_at) AS past_shows,
+           min(start_time) FILTER (WHERE start_time > r.rolled_at) AS next_show_at
+      FROM "Show", "StatsRollover" r
+     GROUP BY {key}
+)
+SELECT coalesce(e.{key}, s.{key}),
+       coalesce(s.upcoming_shows, 0), coalesce(s.past_shows, 0), s.next_show_at,
+       coalesce(e.upcoming_shows, 0), coalesce(e.past_shows, 0), e.next_show_at
+  FROM expected e FULL JOIN "{table}" s ON s.{key} = e.{key}
+ WHERE (coalesce(s.upcoming_shows, 0), coalesce(s.past_shows, 0), s.next_show_at)
+       IS DISTINCT FROM
+       (coalesce(e.upcoming_shows, 0), coalesce(e.past_shows, 0), e.next_show_at)
+ ORDER BY 1
+'''
+
+REPAIR = '''
+INSERT INTO "{table}" ({key}, upcoming_shows, past_shows, next_show_at)
+VALUES (:id, :upcoming_shows, :past_shows, :next_show_at)
+ON CONFLICT ({key}) DO UPDATE
+   SET upcoming_shows = excluded.upcoming_shows,
+       past_shows = excluded.past_shows,
+       next_show_at = excluded.next_show_at
+'''
+
+FIELDS = ('upcoming_shows', 'past_shows', 'next_show_at')
+
+
+def lock_rollover():
+    """Take the rollover row for the transaction; show writes wait for it."""
+    return db.session.execute(text(
+        'SELECT rolled_at FROM "StatsRollover" WHERE id = 1 FOR UPDATE')).scalar()
+
+
+def rollover(now=None):
+    """Count the shows that started since the last rollover as past, and
+    commit; returns how many shows moved.
+    """
+    now = now or utcnow()
+    since = lock_rollover()
+    if since is None or now <= since:
+        db.session.rollback()
+        return 0
+    moved = 0
+    for kind, table, key in SIDES:
+        started = db.session.execute(text(ROLLOVER.format(table=table, key=key)),
+                                     {'since': since, 'now': now}).scalars().all()
+        if kind == 'venue':
+            moved = sum(started)
+    db.session.execute(text('UPDATE "StatsRollover" SET rolled_at = :now WHERE id = 1'),
+                       {'now': now})
+    db.session.commit()
+    return moved
+
+
+def check(repair=False):
+    """Recompute the counts from "Show" and return where the stored ones
+    differ, as dicts with the stored and expected values. With `repair`,
+    show writes are held off while the differing rows are rewritten.
+    """
+    if repair:
+        lock_rollover()
+    drift = []
+    for kind, table, key in SIDES:
+        for row in db.session.execute(text(DRIFT.format(table=table, key=key))):
+            drift.append({
+                'kind': kind,
+                'id': row[0],
+                'stored': dict(zip(FIELDS, row[1:4])),
+                'expected': dict(zip(FIELDS, row[4:7])),
+            })
+            if repair:
+                db.session.execute(text(REPAIR.format(table=table, key=key)),
+                                   dict(zip(FIELDS, row[4:7]), id=row[0]))
+    if repair:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return drift
+
+
+class RolloverJob:
+    """Runs rollover() every STATS_ROLLOVER_INTERVAL seconds from a thread
+    in each worker process; 0 leaves it to `flask stats-rollover` (cron).
+    Rollovers from several workers queue on the same row lock, and the
+    later ones find little left to move.
+    """
+
+    def __init__(self, app=None):
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config['STATS_ROLLOVER_INTERVAL']
+        if self.interval:
+            app.before_request(self.ensure_thread)
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    rollover()
+                except Exception:
+                    self.app.logger.exception('Show count rollover failed')
+                finally:
+                    db.session.remove()
+
+    def ensure_thread(self):
+        # threads do not survive gunicorn's fork; start one per process
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
@@ -0,0 +1,42 @@
+from flask import current_app, render_template, session, stream_template, Response
+
+#----------------------------------------------------------------------------#
+# Streamed pages.
+#----------------------------------------------------------------------------#
+
+# Listing pages are rendered while the response is sent: the template walks
+# rows from a server-side cursor, so neither the rows nor the HTML are held
+# in full. Errors after the first chunk cannot become an error page; the
+# connection is cut and the exception logged.
+
+
+def chunked(pieces, size):
+    """Join the template's output into chunks of about `size` characters.
+    Everything up to </head> goes out on its own, before the page's
+    queries run, so the browser can start on the stylesheets.
+    """
+    buffer = []
+    length = 0
+    head = True
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size or (head and '</head>' in piece):
+            head = False
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """render_template, as a response sent while it renders.
+
+    Pending flash messages are rendered buffered: the layout pops them from
+    the session, which is saved before a streamed body starts.
+    """
+    if session.get('_flashes'):
+        return render_template(template_name, **context)
+    pieces = stream_template(template_name, **context)
+    return Response(chunked(pieces, current_app.config['STREAM_CHUNK_SIZE']), mimetype='text/html')
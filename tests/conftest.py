@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import pytest
+from sqlalchemy import event
+
+# the app's modules sit at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['FYYUR_ENV'] = 'testing'
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The app on an up-to-date TEST_DATABASE_URL database; the tests using
+    it empty and re-seed that database, so they never fall back to
+    DATABASE_URL."""
+    if not os.environ.get('TEST_DATABASE_URL'):
+        pytest.skip('TEST_DATABASE_URL is not set')
+    import flask_migrate
+    from app import app
+    with app.app_context():
+        flask_migrate.upgrade(directory=os.path.join(ROOT, 'migrations'))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def reseed(app):
+    """Empties the database and seeds `venues`, `artists` and `shows` rows."""
+    import seed
+
+    def reseed(venues, artists, shows):
+        with app.app_context():
+            seed.truncate()
+            seed.seed(venues, artists, shows)
+    return reseed
+
+
+class Statements:
+    """Records the SQL `engine` runs on this thread while the block runs;
+    the app's background threads share the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.thread = threading.get_ident()
+        self.executed = []  # (statement, parameters)
+
+    @property
+    def sql(self):
+        return [statement for statement, _ in self.executed]
+
+    def _record(self, conn, cursor, statement, parameters, *args):
+        if threading.get_ident() == self.thread:
+            self.executed.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+@pytest.fixture
+def statements(app):
+    from models import db
+    with app.app_context():
+        engine = db.engine
+    return lambda: Statements(engine)
@@ -0,0 +1,97 @@
+import time
+import pytest
+from cache import CachedPage, RedisBackend
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+def page(body=b'<html></html>', ttl=60):
+    return CachedPage(body=body, status=200, mimetype='text/html', expires_at=time.time() + ttl)
+
+
+class RacingClient:
+    """Runs `during_set` between the generation check and the writes of a
+    set(), as another worker's invalidation would."""
+
+    def __init__(self, client, during_set):
+        self.client = client
+        self.during_set = during_set
+
+    def pipeline(self):
+        pipe = self.client.pipeline()
+        multi = pipe.multi
+
+        def racing_multi():
+            self.during_set()
+            multi()
+        pipe.multi = racing_multi
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def backend(server):
+    return RedisBackend(fakeredis.FakeRedis(server=server), tag_ttl=300)
+
+
+def test_set_and_get(backend):
+    backend.set('/venues', page(b'venues'), {'venues'}, backend.current_generation())
+    cached = backend.get('/venues')
+    assert cached.body == b'venues'
+    assert cached.status == 200
+    assert cached.mimetype == 'text/html'
+    assert cached.etag is None
+    assert backend.get('/artists') is None
+    backend.set('/shows', page()._replace(etag='abc'), {'shows'}, backend.current_generation())
+    assert backend.get('/shows').etag == 'abc'
+
+
+def test_invalidate_drops_tagged_pages(backend):
+    generation = backend.current_generation()
+    backend.set('/venues', page(), {'venues'}, generation)
+    backend.set('/venues/1', page(), {'venue:1', 'venues'}, generation)
+    backend.set('/artists', page(), {'artists'}, generation)
+    backend.invalidate({'venue:1'})
+    assert backend.get('/venues/1') is None
+    assert backend.get('/venues') is not None
+    assert backend.current_generation() == generation + 1
+    backend.invalidate({'venues'})
+    assert backend.get('/venues') is None
+    assert backend.get('/artists') is not None
+
+
+def test_stale_generation_is_not_stored(backend):
+    generation = backend.current_generation()
+    backend.invalidate({'venues'})
+    backend.set('/venues', page(), {'venues'}, generation)
+    assert backend.get('/venues') is None
+
+
+def test_invalidation_during_set_is_not_lost(server, backend):
+    other_worker = RedisBackend(fakeredis.FakeRedis(server=server))
+    racing = RedisBackend(RacingClient(fakeredis.FakeRedis(server=server),
+                                       lambda: other_worker.invalidate({'venues'})))
+    racing.set('/venues', page(), {'venues'}, racing.current_generation())
+    assert backend.get('/venues') is None
+
+
+def test_tag_sets_expire_no_sooner_than_pages(backend):
+    backend.set('/venues', page(ttl=60), {'venues'}, backend.current_generation())
+    assert 60 <= backend.client.ttl(backend.prefix + 'tag:venues') <= 300
+    backend.set('/shows', page(ttl=600), {'shows'}, backend.current_generation())
+    assert backend.client.ttl(backend.prefix + 'tag:shows') >= 599
+
+
+def test_page_without_its_tag_set_is_dropped(backend):
+    backend.set('/venues/1', page(), {'venue:1', 'venues'}, backend.current_generation())
+    # as if the server evicted it under memory pressure
+    backend.client.delete(backend.prefix + 'tag:venue:1')
+    assert backend.get('/venues/1') is None
+    assert not backend.client.exists(backend.prefix + 'page:/venues/1')
@@ -0,0 +1,53 @@
+import sys
+import pytest
+
+
+@pytest.mark.parametrize('path', [
+    '/venues', '/venues/1', '/venues/1/shows/past', '/artists', '/artists/1', '/artists/1/shows/past', '/shows',
+])
+def test_repeat_request_is_not_modified(client, reseed, statements, monkeypatch, path):
+    reseed(20, 40, 300)
+    first = client.get(path)
+    first.get_data()
+    assert first.status_code == 200
+    assert first.headers['ETag']
+
+    app_module = sys.modules['app']
+    rendered = []
+    for name in ('render_template', 'stream_page'):
+        render = getattr(app_module, name)
+        monkeypatch.setattr(app_module, name,
+                            lambda *args, render=render, **kwargs: rendered.append(args) or render(*args, **kwargs))
+    with statements() as recorded:
+        repeat = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b''
+    assert rendered == []
+    assert len(recorded.sql) <= 1
+
+    # and the spy does see a render when the page is sent
+    client.get(path).get_data()
+    assert rendered
+
+
+def test_cached_page_is_not_served_under_a_newer_etag(app, client, reseed, monkeypatch):
+    # another worker's write: the data changes but this worker's memory
+    # cache is not invalidated
+    from app import response_cache
+    from cache import MemoryBackend
+    from models import db, Venue
+    reseed(20, 40, 300)
+    monkeypatch.setattr(response_cache, 'enabled', True)
+    monkeypatch.setattr(response_cache, 'backend', MemoryBackend(1 << 20))
+    first = client.get('/venues/1')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert client.get('/venues/1').headers['X-Cache'] == 'HIT'
+    with app.app_context():
+        Venue.query.filter(Venue.id == 1).update({Venue.name: 'Renamed Elsewhere',
+                                                  Venue.updated_at: db.func.now()})
+        db.session.commit()
+    after = client.get('/venues/1', headers={'If-None-Match': first.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['X-Cache'] == 'MISS'
+    assert after.headers['ETag'] != first.headers['ETag']
+    assert b'Renamed Elsewhere' in after.get_data()
@@ -0,0 +1,75 @@
+import io
+import json
+
+
+def run_import(app, kind, lines, tmp_path):
+    from importer import import_file
+    batches = []
+    stream = io.BytesIO(''.join(json.dumps(line) + '\n' for line in lines).encode())
+    with app.app_context():
+        report = import_file(kind, stream, 'ndjson', str(tmp_path / 'errors.ndjson'),
+                             on_batch=lambda kind, records: batches.extend(records))
+    errors = [json.loads(line) for line in open(tmp_path / 'errors.ndjson')]
+    return report, batches, errors
+
+
+def venue(id, name):
+    return {'id': id, 'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+            'phone': '512-555-0100', 'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/venue'}
+
+
+def test_clashing_ids_are_rejected(app, reseed, tmp_path):
+    reseed(5, 5, 0)
+    report, batches, errors = run_import(app, 'venues', [
+        venue(3, 'Taken'), venue(1000, 'New'), venue(1000, 'Repeated'),
+    ], tmp_path)
+    assert (report.loaded, report.failed) == (1, 2)
+    assert [record['name'] for record in batches] == ['New']
+    assert [error['line'] for error in errors] == [1, 3]
+
+
+def test_double_bookings_are_rejected(app, reseed, tmp_path):
+    reseed(5, 5, 0)
+    show = {'venue_id': 1, 'artist_id': 1, 'start_time': '2031-01-01 20:00:00'}
+    report, batches, errors = run_import(app, 'shows', [
+        show, dict(show, artist_id=2), dict(show, start_time='2031-01-02 20:00:00'),
+    ], tmp_path)
+    assert (report.loaded, report.failed) == (2, 1)
+    assert [record['artist_id'] for record in batches] == [1, 1]
+    assert all('id' in record for record in batches)
+    assert errors[0]['line'] == 2
+    assert errors[0]['errors'] == {'row': ['The venue is already booked at that time.']}
+
+
+def test_refused_rows_do_not_stop_the_import(app, reseed, tmp_path):
+    reseed(5, 5, 0)
+    # names are unbounded, cities are not: the database refuses this one row
+    report, batches, errors = run_import(app, 'venues', [
+        venue(100, 'Fine'), dict(venue(101, 'Too long'), city='x' * 200), venue(102, 'Also fine'),
+    ], tmp_path)
+    assert (report.loaded, report.failed) == (2, 1)
+    assert [record['id'] for record in batches] == [100, 102]
+    assert errors[0]['line'] == 2
+
+
+class ReadOnly:
+    """A stream with read() and nothing else, as SpooledTemporaryFile is to
+    io.TextIOWrapper before Python 3.11."""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+def test_rows_are_read_from_a_bare_stream():
+    from importer import read_rows, text_lines
+    data = 'name,genres\r\n"Café, ""Ünïcode""",Jazz;Blues\r\nLast,Folk'.encode()
+    rows = list(read_rows(ReadOnly(data), 'csv'))
+    assert rows == [(2, {'name': 'Café, "Ünïcode"', 'genres': ['Jazz', 'Blues']}),
+                    (3, {'name': 'Last', 'genres': ['Folk']})]
+    # multi-byte characters split across chunks
+    lines = list(text_lines(ReadOnly('é\nü'.encode() * 3), chunk_size=1))
+    assert ''.join(lines) == 'é\nü' * 3
+    assert lines[0] == 'é\n'
@@ -0,0 +1,39 @@
+import threading
+
+
+def lists_with(artist_id):
+    """Rows of the artist's own list, and of venue lists it is on."""
+    from models import ArtistMatch, VenueMatch
+    return ArtistMatch.query.filter_by(artist_id=artist_id).count(), \
+        VenueMatch.query.filter_by(artist_id=artist_id).count()
+
+
+def test_refresh_runs_off_the_calling_thread(app, reseed, monkeypatch):
+    from app import match_engine
+    reseed(50, 50, 0)
+    threads = []
+    refresh = match_engine.refresh
+    monkeypatch.setattr(match_engine, 'refresh',
+                        lambda kind, ids: threads.append(threading.get_ident()) or refresh(kind, ids))
+    with app.app_context():
+        match_engine.profiles_changed('artist', [1])
+        match_engine.profiles_changed('artist', [2])
+        match_engine.wait()
+    assert threads and threading.get_ident() not in threads
+
+
+def test_deleted_artist_leaves_every_list(app, reseed):
+    import purge
+    from app import match_engine
+    from models import db
+    reseed(200, 200, 0)
+    with app.app_context():
+        match_engine.rebuild_table()
+        own, listed = lists_with(1)
+        assert own and listed
+        assert purge.soft_delete('artist', 1)
+        db.session.commit()
+        match_engine.profiles_changed('artist', [1])
+        match_engine.wait()
+        assert lists_with(1) == (0, 0)
+        db.session.rollback()
@@ -0,0 +1,62 @@
+import pytest
+
+
+def scans(plan):
+    """(node type, relation) for every node of an EXPLAIN (FORMAT JSON) plan."""
+    yield plan['Node Type'], plan.get('Relation Name')
+    for child in plan.get('Plans', ()):
+        yield from scans(child)
+
+
+def show_scans(app, client, statements, path, **args):
+    """The way each statement behind `path` reads "Show", by statement."""
+    from models import db
+    with statements() as recorded:
+        response = client.get(path, query_string=args)
+        response.get_data()
+    assert response.status_code == 200
+    found = {}
+    with app.app_context():
+        connection = db.session.connection()
+        for statement, parameters in recorded.executed:
+            if '"Show"' not in statement:
+                continue
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            found[statement] = {node for node, relation in scans(plan[0]['Plan']) if relation == 'Show'}
+        db.session.rollback()
+    return found
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    import seed
+    with app.app_context():
+        seed.truncate()
+        seed.seed(500, 1000, 100000)
+
+
+@pytest.fixture
+def middle_cursor(app, seeded):
+    from models import db, Show
+    from queries import encode_cursor
+    with app.app_context():
+        start_time, id = db.session.query(Show.start_time, Show.id) \
+            .order_by(Show.start_time, Show.id).offset(50000).first()
+        db.session.rollback()
+    return encode_cursor(start_time, id)
+
+
+@pytest.mark.parametrize('path', ['/venues/1', '/artists/1'])
+def test_detail_pages_use_show_indexes(app, client, statements, seeded, path):
+    found = show_scans(app, client, statements, path)
+    assert found
+    for statement, nodes in found.items():
+        assert nodes and nodes <= {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}, statement
+
+
+def test_shows_seek_uses_index(app, client, statements, middle_cursor):
+    found = show_scans(app, client, statements, '/shows', after=middle_cursor)
+    seeks = {statement: nodes for statement, nodes in found.items() if 'LIMIT' in statement}
+    assert seeks
+    for statement, nodes in seeks.items():
+        assert nodes <= {'Index Scan', 'Index Only Scan'}, statement
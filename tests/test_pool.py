@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine, text
+from config import engine_options, options_for
+
+
+def test_sqlite_files_take_the_engine_options(tmp_path):
+    # primary and replica as two SQLite files, as for trying out routing
+    options = engine_options(None, pool_size=5, max_overflow=5, pool_timeout=10, pool_recycle=1800,
+                             statement_timeout=30000, pgbouncer=False)
+    for name in ('primary', 'replica'):
+        uri = 'sqlite:///' + str(tmp_path / (name + '.sqlite3'))
+        engine = create_engine(uri, **options_for(uri, options))
+        with engine.connect() as connection:
+            assert connection.execute(text('SELECT 1')).scalar() == 1
+        engine.dispose()
+
+
+def test_postgresql_keeps_the_queue_pool():
+    options = engine_options('postgresql://localhost/fyyur', pool_size=5, max_overflow=5, pool_timeout=10,
+                             pool_recycle=1800, statement_timeout=30000, pgbouncer=False)
+    assert (options['pool_size'], options['max_overflow'], options['pool_timeout']) == (5, 5, 10)
+    assert options['connect_args'] == {'options': '-c statement_timeout=30000'}
+
+
+def test_pool_under_concurrent_workers(app, reseed):
+    import bench
+    from models import db
+    reseed(20, 40, 300)
+    with app.app_context():
+        engine = db.engine
+    limit = engine.pool.size() + app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow']
+    paths = ['/venues/%d' % id for id in range(1, 11)] + ['/artists/%d' % id for id in range(1, 11)] \
+        + ['/shows', '/api/v1/shows?limit=100']
+    # four times as many clients as the pool has connections
+    result = bench.pool_load(app, engine, paths, threads=4 * limit, requests=25)
+    assert result['errors'] == {}
+    assert result['requests'] == 4 * limit * 25
+    assert result['peak_checked_out'] <= limit
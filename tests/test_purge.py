@@ -0,0 +1,82 @@
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def venue_with_shows(shows):
+    from sqlalchemy import text
+    from bench import INSERT_SHOWS
+    from models import db, Artist, Venue
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id).limit(100)]
+    venue = Venue(name='Purge Test', genres=['Jazz'], city='Austin', state='TX')
+    db.session.add(venue)
+    db.session.flush()
+    db.session.execute(text(INSERT_SHOWS), {
+        'venue_id': venue.id, 'artist_ids': artist_ids, 'shows': shows,
+        'start': datetime(2040, 1, 1, tzinfo=timezone.utc)})
+    db.session.commit()
+    return venue.id
+
+
+def test_delete_time_does_not_grow_with_shows(app, client, reseed, statements, monkeypatch):
+    import purge
+    from app import match_engine, purge_job
+    from models import db
+    reseed(20, 100, 0)
+    refreshed_on = []
+    refresh = match_engine.refresh
+    monkeypatch.setattr(match_engine, 'refresh',
+                        lambda kind, ids: refreshed_on.append(threading.get_ident()) or refresh(kind, ids))
+    results = {}
+    for shows in (2000, 20000):
+        with app.app_context():
+            venue_id = venue_with_shows(shows)
+        timings, counts = [], set()
+        for _ in range(5):
+            with statements() as recorded:
+                started = time.perf_counter()
+                response = client.delete('/venues/%d/delete' % venue_id)
+                timings.append(time.perf_counter() - started)
+            assert response.status_code == 200
+            counts.add(len(recorded.sql))
+            purge_job.wait()
+            with app.app_context():
+                assert purge.restore('venue', venue_id, app.config['PURGE_RESTORE_WINDOW'])
+                db.session.commit()
+        results[shows] = statistics.median(timings), counts
+    (small, small_counts), (large, large_counts) = results[2000], results[20000]
+    # ten times the shows, the same statements and about the same time
+    assert small_counts == large_counts
+    assert large < small * 2 + 0.005, results
+    assert refreshed_on and threading.get_ident() not in refreshed_on
+
+
+def test_a_failed_change_does_not_stop_the_thread(app, monkeypatch):
+    from app import purge_job
+    seen = []
+
+    def on_changed(kind, id):
+        seen.append(id)
+        if id == -1:
+            raise RuntimeError('boom')
+    monkeypatch.setattr(purge_job, 'on_changed', on_changed)
+    purge_job.changed('venue', -1)
+    purge_job.changed('venue', -2)
+    waiter = threading.Thread(target=purge_job.wait, daemon=True)
+    waiter.start()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert seen == [-1, -2]
+    assert purge_job.running()
+
+
+def test_a_dead_thread_is_restarted(app, monkeypatch):
+    from app import purge_job
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    purge_job.ensure_thread()
+    monkeypatch.setattr(purge_job, 'thread', dead)
+    purge_job.ensure_thread()
+    assert purge_job.thread is not dead and purge_job.thread.is_alive()
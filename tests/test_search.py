@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.mark.parametrize('names, values', [
+    (['HipHop'], ['Hip-Hop']),
+    (['HipHop', 'Jazz'], ['Hip-Hop', 'Jazz']),
+    (['RnB', 'RocknRoll'], ['R&B', 'Rock n Roll']),
+])
+def test_either_spelling_finds_the_same_rows(app, reseed, names, values):
+    from models import Venue, Artist
+    from search import search
+    reseed(500, 500, 0)
+    with app.app_context():
+        for model in (Venue, Artist):
+            by_name = search(model, '', 1, 1000, names)
+            assert by_name[0] > 0
+            assert search(model, '', 1, 1000, values) == by_name
+            assert search(model, '', 1, 1000, names[:1] + values[1:]) == by_name
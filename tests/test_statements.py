@@ -0,0 +1,56 @@
+import re
+import statistics
+import time
+import pytest
+
+
+def measure(client, statements, path, repeat=5):
+    """Statements behind `path`, and the median time to serve it in full."""
+    client.get(path).get_data()  # warm-up: caches, typeahead index, lazy setup
+    with statements() as recorded:
+        response = client.get(path)
+        response.get_data()  # streamed pages query while they are read
+    assert response.status_code == 200
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(path).get_data()
+        timings.append(time.perf_counter() - started)
+    return recorded.sql, statistics.median(timings)
+
+
+@pytest.mark.parametrize('path', ['/venues', '/shows'])
+def test_cost_does_not_grow_with_shows(client, reseed, statements, path):
+    results = []
+    for shows in (2000, 20000):
+        reseed(100, 200, shows)
+        results.append(measure(client, statements, path))
+    (small_sql, small_time), (large_sql, large_time) = results
+    # ten times the shows: the same statements, and about the same time
+    assert len(small_sql) == len(large_sql)
+    assert large_time < small_time * 2 + 0.005, (small_time, large_time)
+
+
+# routes that render shows, and so may join "Show" to the venue or artist
+SHOW_ROUTES = {
+    'venues', 'shows', 'show_venue', 'venue_show_tiles', 'show_artist', 'artist_show_tiles',
+    'api.shows', 'api.show', 'api.calendar', 'api.calendar_venue', 'api.venue_availability',
+}
+SHOW_JOIN = re.compile(r'JOIN "Show"|FROM "Show"(?: AS \w+)? (?:LEFT OUTER |FULL OUTER )?JOIN')
+
+
+def test_only_show_pages_join_show(app, client, reseed, statements):
+    from app import benchmark_requests
+    reseed(20, 40, 300)
+    with app.test_request_context():
+        requests = benchmark_requests(1, 1)
+    joined = {}
+    for name, method, path, data in requests:
+        with statements() as recorded:
+            response = client.open(path, method=method, data=data() if callable(data) else data)
+            response.get_data()  # streamed pages query while they are read
+        assert response.status_code < 400, name
+        joins = [sql for sql in recorded.sql if SHOW_JOIN.search(sql)]
+        if joins and name not in SHOW_ROUTES:
+            joined[name] = joins
+    assert joined == {}
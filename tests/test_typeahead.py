@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+def test_lookups_stay_consistent_under_concurrent_writes():
+    from typeahead import PrefixIndex
+    index = PrefixIndex(100000)
+    for id in range(2000):
+        index.add('venue', id, 'Band %d' % id)
+    errors, done = [], threading.Event()
+
+    def write():
+        for id in range(2000, 4000):
+            index.add('artist', id, 'Band %d' % id)
+            index.remove('venue', id - 2000)
+        done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                results = index.lookup('band', limit=50)
+                assert len(results) == len(set(results))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    write()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert len(index.lookup('band', limit=5000)) == 2000
+
+
+def test_first_requests_build_the_index_once(app, monkeypatch):
+    from typeahead import PrefixIndex
+    index = PrefixIndex(100000)
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.1)
+        index.built_at = time.monotonic()
+    monkeypatch.setattr(index, 'build', build)
+    threads = [threading.Thread(target=index.ensure_fresh, args=(app,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [1]
@@ -0,0 +1,42 @@
+import json
+import time
+import pytest
+from flask import Flask
+from writequeue import ShowQueue
+
+
+@pytest.fixture
+def show_queue(app, tmp_path, monkeypatch):
+    queue = ShowQueue(app)
+    monkeypatch.setattr(queue, 'path', str(tmp_path / 'show-queue.sqlite3'))
+    return queue
+
+
+def test_worker_starts_with_requests_when_queueing():
+    for write_behind in (False, True):
+        app = Flask(__name__)
+        app.config.update(SHOW_QUEUE_PATH='unused', SHOW_QUEUE_BATCH_SIZE=10, SHOW_QUEUE_CLAIM_TIMEOUT=30,
+                          SHOW_QUEUE_RETENTION=60, SHOW_WRITE_BEHIND=write_behind)
+        queue = ShowQueue(app)
+        assert (queue.ensure_worker in app.before_request_funcs.get(None, [])) == write_behind
+
+
+def test_worker_drains_what_is_left_in_the_journal(show_queue, reseed):
+    reseed(5, 5, 0)
+    # as left by a worker that died after submit()
+    show_queue.connection().execute(
+        'INSERT INTO submission (payload, created_at) VALUES (?, ?)',
+        (json.dumps({'venue_id': 1, 'artist_id': 1, 'start_time': '2031-01-01T20:00:00+00:00'}), time.time()))
+    show_queue.ensure_worker()
+    for _ in range(100):
+        if show_queue.status(1)['status'] != 'pending':
+            break
+        time.sleep(0.05)
+    assert show_queue.status(1)['status'] == 'done'
+
+
+def test_failed_finish_leaves_no_transaction_open(show_queue):
+    conn = show_queue.connection()
+    with pytest.raises(ValueError):
+        show_queue.finish([(1, 'done', None, None, 'one too many')])
+    assert not conn.in_transaction
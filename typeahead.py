@@ -0,0 +1,148 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from models import db, Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Typeahead index.
+#----------------------------------------------------------------------------#
+
+def name_keys(name):
+    """Lowercased suffixes of `name` starting at each word.
+
+    'The Wild Sax Band' -> 'the wild sax band', 'wild sax band', 'sax band',
+    'band', so a query matches the start of any word and may span words.
+    """
+    words = name.lower().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """In-memory prefix index over venue and artist names.
+
+    Entries are (key, kind, id) tuples kept in one sorted list: a lookup is
+    a bisect followed by a scan that stops after `limit` distinct hits, so
+    it does not depend on how many names are indexed. Writes shift the list
+    in place, so lookups hold the same lock as writers; a lookup only ever
+    holds it for the bisect and a short scan.
+
+    Memory: roughly 90 bytes per entry plus its key string (~50 bytes for a
+    short name), times one entry per word, plus ~150 bytes per name for the
+    id -> name map. A three word name costs about 0.5 KB, so the default
+    cap of 200k names stays around 100 MB. Names past `max_names` are not
+    indexed.
+    """
+
+    def __init__(self, max_names):
+        self.max_names = max_names
+        self.entries = []
+        self.names = {}
+        self.built_at = None
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+
+    def __len__(self):
+        return len(self.names)
+
+    def _insert(self, kind, id, name):
+        if (kind, id) in self.names or len(self.names) >= self.max_names:
+            return
+        self.names[(kind, id)] = name
+        for key in name_keys(name):
+            insort(self.entries, (key, kind, id))
+
+    def _delete(self, kind, id):
+        name = self.names.pop((kind, id), None)
+        if name is None:
+            return
+        for key in name_keys(name):
+            i = bisect_left(self.entries, (key, kind, id))
+            if i < len(self.entries) and self.entries[i] == (key, kind, id):
+                del self.entries[i]
+
+    def add(self, kind, id, name):
+        with self.lock:
+            self._delete(kind, id)
+            if name:
+                self._insert(kind, id, name)
+
+    def remove(self, kind, id):
+        with self.lock:
+            self._delete(kind, id)
+
+    def expire(self):
+        """Have the next lookup trigger a background rebuild."""
+        if self.built_at is not None:
+            self.built_at = float('-inf')
+
+    def lookup(self, query, kind=None, limit=10):
+        """Up to `limit` (kind, id, name) matches for the prefix `query`."""
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return []
+        with self.lock:
+            return self._lookup(prefix, kind, limit)
+
+    def _lookup(self, prefix, kind, limit):
+        entries, names = self.entries, self.names
+        results, seen = [], set()
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and len(results) < limit:
+            key, entry_kind, id = entries[i]
+            if not key.startswith(prefix):
+                break
+            i += 1
+            if (kind and entry_kind != kind) or (entry_kind, id) in seen:
+                continue
+            name = names.get((entry_kind, id))
+            if name is not None:
+                seen.add((entry_kind, id))
+                results.append((entry_kind, id, name))
+        return results
+
+    def build(self):
+        """Load every venue and artist name; swaps the index in one step."""
+        names = {}
+        for kind, model in (('venue', Venue), ('artist', Artist)):
+            for id, name in db.session.query(model.id, model.name) \
+                    .filter(model.name.isnot(None)) \
+                    .yield_per(10000):
+                if len(names) >= self.max_names:
+                    break
+                names[(kind, id)] = name
+        entries = sorted(
+            (key, kind, id)
+            for (kind, id), name in names.items()
+            for key in name_keys(name)
+        )
+        with self.lock:
+            self.entries, self.names = entries, names
+            self.built_at = time.monotonic()
+
+    def ensure_fresh(self, app):
+        """Build on first use; afterwards rebuild in the background once the
+        index is older than TYPEAHEAD_MAX_AGE, to pick up writes handled by
+        other worker processes.
+        """
+        if self.built_at is None:
+            # concurrent first requests wait for one build instead of each
+            # loading every name
+            with self.build_lock:
+                if self.built_at is None:
+                    self.build()
+            return
+        if time.monotonic() - self.built_at < app.config['TYPEAHEAD_MAX_AGE']:
+            return
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+
+        def rebuild():
+            try:
+                with app.app_context():
+                    self.build()
+            finally:
+                self.rebuilding = False
+        threading.Thread(target=rebuild, daemon=True).start()
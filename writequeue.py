@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Artist, Venue, Show, touch, is_booking_conflict
+from importer import resolve_foreign_keys
+
+#----------------------------------------------------------------------------#
+# Write-behind queue for show submissions.
+#----------------------------------------------------------------------------#
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS submission (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, claimed, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    show_id INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_submission_status_id ON submission (status, id);
+'''
+
+
+def insert_shows(records):
+    """Insert `records` with one statement and return their new ids, in
+    order. The ids are drawn from the sequence first, so matching them to
+    the records does not depend on RETURNING order.
+    """
+    ids = [id for id, in db.session.execute(
+        select(func.nextval(func.pg_get_serial_sequence('"Show"', 'id')))
+        .select_from(func.generate_series(1, len(records))))]
+    db.session.execute(insert(Show.__table__).values(
+        [dict(record, id=id) for record, id in zip(records, ids)]))
+    touch(Venue, Venue.id.in_({record['venue_id'] for record in records}))
+    touch(Artist, Artist.id.in_({record['artist_id'] for record in records}))
+    return ids
+
+
+class ShowQueue:
+    """Durable queue of validated show submissions, drained in batches.
+
+    submit() appends to a SQLite journal (WAL) and returns a ticket; a
+    background thread claims up to SHOW_QUEUE_BATCH_SIZE pending rows,
+    inserts them into PostgreSQL with one multi-row INSERT and one commit,
+    and records each ticket's show id or error. Several gunicorn workers
+    can share the journal: claims are taken in a write transaction.
+
+    A worker that dies between committing to PostgreSQL and marking its
+    claim done leaves the claim behind; it is retried after
+    SHOW_QUEUE_CLAIM_TIMEOUT, and a retried submission whose show already
+    exists is marked done instead of inserted twice.
+    """
+
+    def __init__(self, app=None):
+        self.local = threading.local()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        # called with the records of each inserted batch
+        self.on_drained = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.path = app.config['SHOW_QUEUE_PATH']
+        self.batch_size = app.config['SHOW_QUEUE_BATCH_SIZE']
+        self.claim_timeout = app.config['SHOW_QUEUE_CLAIM_TIMEOUT']
+        self.retention = app.config['SHOW_QUEUE_RETENTION']
+        if app.config['SHOW_WRITE_BEHIND']:
+            # picks up what a crashed or recycled worker left in the journal
+            # without waiting for the next submission
+            app.before_request(self.ensure_worker)
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # survives a crash of the app; an OS crash may lose the last
+            # few submissions
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def submit(self, record):
+        """Queue a validated show record; returns its ticket number."""
+        payload = json.dumps(dict(record, start_time=record['start_time'].isoformat()))
+        cursor = self.connection().execute(
+            'INSERT INTO submission (payload, created_at) VALUES (?, ?)', (payload, time.time()))
+        self.ensure_worker()
+        self.wakeup.set()
+        return cursor.lastrowid
+
+    def status(self, ticket):
+        row = self.connection().execute(
+            'SELECT status, show_id, error FROM submission WHERE id = ?', (ticket,)).fetchone()
+        if row is None:
+            return None
+        status, show_id, error = row
+        return {
+            'ticket': ticket,
+            'status': 'pending' if status == 'claimed' else status,
+            'show_id': show_id,
+            'error': error,
+        }
+
+    def pending(self):
+        return self.connection().execute(
+            "SELECT count(*) FROM submission WHERE status IN ('pending', 'claimed')").fetchone()[0]
+
+    def claim(self):
+        conn = self.connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE submission SET status = 'pending' WHERE status = 'claimed' AND claimed_at < ?",
+                (now - self.claim_timeout,))
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM submission WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (self.batch_size,)).fetchall()
+            conn.executemany(
+                "UPDATE submission SET status = 'claimed', claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now, id) for id, _, _ in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        jobs = []
+        for id, payload, attempts in rows:
+            record = json.loads(payload)
+            record['start_time'] = datetime.fromisoformat(record['start_time'])
+            jobs.append((id, record, attempts))
+        return jobs
+
+    def finish(self, results):
+        """results: (ticket, status, show id, error) tuples."""
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'UPDATE submission SET status = ?, show_id = ?, error = ? WHERE id = ?',
+                [(status, show_id, error, id) for id, status, show_id, error in results])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def drain_once(self):
+        """Move one batch into PostgreSQL; returns how many were handled."""
+        jobs = self.claim()
+        if not jobs:
+            return 0
+        results = []
+        retried = [record for _, record, attempts in jobs if attempts > 0]
+        existing = {}
+        if retried:
+            # a crashed drain may already have committed these
+            existing = {(venue_id, artist_id, start_time): id
+                        for venue_id, artist_id, start_time, id in db.session.query(
+                            Show.venue_id, Show.artist_id, Show.start_time, Show.id)
+                        .filter(tuple_(Show.venue_id, Show.artist_id, Show.start_time).in_(
+                            [(r['venue_id'], r['artist_id'], r['start_time']) for r in retried]))}
+        fresh = []
+        for id, record, attempts in jobs:
+            key = (record['venue_id'], record['artist_id'], record['start_time'])
+            if attempts > 0 and key in existing:
+                results.append((id, 'done', existing[key], None))
+            else:
+                record['_ticket'] = id
+                fresh.append(record)
+        found, missing = resolve_foreign_keys(fresh) if fresh else ([], [])
+        for record in missing:
+            results.append((record['_ticket'], 'failed', None, 'Unknown venue or artist.'))
+        if found:
+            tickets = [record.pop('_ticket') for record in found]
+            try:
+                show_ids = insert_shows(found)
+                db.session.commit()
+                results.extend((ticket, 'done', show_id, None)
+                               for ticket, show_id in zip(tickets, show_ids))
+            except SQLAlchemyError:
+                db.session.rollback()
+                # one bad row fails the whole statement; find it
+                inserted = []
+                for ticket, record in zip(tickets, found):
+                    try:
+                        show_id, = insert_shows([record])
+                        db.session.commit()
+                        results.append((ticket, 'done', show_id, None))
+                        inserted.append(record)
+                    except SQLAlchemyError as e:
+                        db.session.rollback()
+                        message = 'The venue is already booked at that time.' if is_booking_conflict(e) \
+                            else str(getattr(e, 'orig', e)).strip()
+                        results.append((ticket, 'failed', None, message))
+                found = inserted
+            if found and self.on_drained is not None:
+                self.on_drained(found)
+        self.finish(results)
+        return len(jobs)
+
+    def prune(self):
+        """Forget finished submissions after SHOW_QUEUE_RETENTION seconds."""
+        self.connection().execute(
+            "DELETE FROM submission WHERE status IN ('done', 'failed') AND created_at < ?",
+            (time.time() - self.retention,))
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                self.wakeup.wait(timeout=self.claim_timeout)
+                self.wakeup.clear()
+                try:
+                    while self.drain_once():
+                        pass
+                    self.prune()
+                except Exception:
+                    self.app.logger.exception('Show queue worker error')
+                finally:
+                    db.session.remove()
+
+    def running(self):
+        return self.thread is not None and self.pid == os.getpid() and self.thread.is_alive()
+
+    def ensure_worker(self):
+        # threads do not survive gunicorn's fork; start one per process
+        if self.running():
+            return
+        with self.lock:
+            if not self.running():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                # drain what is already queued straight away
+                self.wakeup.set()
+                self.thread.start()